@@ -0,0 +1,89 @@
+# Run from the repository root: python -m benchmarks.embedding_recall_bench [embeddings.npy]
+#
+# Measures recall@k, memory per vector and search latency of reduced-dimension and quantized
+# vector stores against exact full precision search. Pass a .npy matrix of real embeddings
+# (e.g. exported memories) for meaningful numbers; the synthetic fallback only imitates
+# Matryoshka embeddings by putting more variance in the leading dimensions.
+import os
+import sys
+import time
+import numpy
+import asyncio
+import tempfile
+
+from core.bot_workflow.vector_db import truncate_embedding
+from core.bot_workflow.vector_backends import NumpyBackend
+
+K = 10
+N_QUERIES = 200
+N_SYNTHETIC = 20_000
+SYNTHETIC_DIM = 3072
+COLLECTION = "memories"
+CONFIGS = [
+    (dimensions, quantization, rescore_multiplier)
+    for dimensions in (3072, 1024, 256)
+    for quantization, rescore_multiplier in (("none", 1), ("int8", 1), ("int8", 4), ("binary", 1), ("binary", 4))
+]
+
+def synthetic_embeddings(rng: numpy.random.Generator) -> numpy.ndarray:
+    # Clustered data, so neighbours are meaningful, with decaying variance across dimensions
+    centers = rng.standard_normal((N_SYNTHETIC // 20, SYNTHETIC_DIM), dtype=numpy.float32)
+    vectors = centers[rng.integers(0, len(centers), N_SYNTHETIC)]
+    vectors += 0.7 * rng.standard_normal((N_SYNTHETIC, SYNTHETIC_DIM), dtype=numpy.float32)
+    vectors *= 1 / numpy.sqrt(1 + numpy.arange(SYNTHETIC_DIM, dtype=numpy.float32) / 64)
+    return vectors
+
+def normalized(vectors: numpy.ndarray) -> numpy.ndarray:
+    return vectors / numpy.linalg.norm(vectors, axis=1, keepdims=True)
+
+def bytes_per_vector(dimensions: int, quantization: str) -> float:
+    if quantization == "int8":
+        return dimensions + 4
+    if quantization == "binary":
+        return dimensions / 8
+    return dimensions * 4
+
+async def main():
+    rng = numpy.random.default_rng(0)
+    embeddings = numpy.load(sys.argv[1]).astype(numpy.float32) if len(sys.argv) > 1 else synthetic_embeddings(rng)
+    query_rows = rng.choice(len(embeddings), N_QUERIES, replace=False)
+    # Queries are noisy copies of stored vectors, like a rephrased question
+    queries = embeddings[query_rows] + 0.3 * embeddings.std() * rng.standard_normal((N_QUERIES, embeddings.shape[1]), dtype=numpy.float32)
+
+    full = normalized(embeddings)
+    ground_truth = [set(numpy.argsort(-(full @ query))[:K].tolist()) for query in normalized(queries)]
+    print(f"{len(embeddings)} vectors of {embeddings.shape[1]} dimensions, {N_QUERIES} queries, recall@{K} against full precision search\n")
+    print(f"{'dims':>5} {'quantization':>12} {'rescore':>8} {'recall':>7} {'bytes/vector':>13} {'search p50':>11}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for dimensions, quantization, rescore_multiplier in CONFIGS:
+            if dimensions > embeddings.shape[1]:
+                continue
+            backend = NumpyBackend(
+                os.path.join(directory, f"{dimensions}-{quantization}-{rescore_multiplier}"),
+                quantization=quantization,
+                rescore_multiplier=rescore_multiplier
+            )
+            await backend.ensure_collection(COLLECTION, dimensions)
+            truncated = normalized(embeddings[:, :dimensions])
+            await backend.insert(COLLECTION, [
+                {"id": i, "vector": vector, "metadata": {}, "text": ""}
+                for i, vector in enumerate(truncated)
+            ])
+
+            recalls = []
+            latencies = []
+            for query, expected in zip(queries, ground_truth):
+                start = time.perf_counter()
+                hits = await backend.search(COLLECTION, truncate_embedding(query.tolist(), dimensions), K)
+                latencies.append(time.perf_counter() - start)
+                recalls.append(len(expected & {hit.id for hit in hits}) / K)
+
+            print(
+                f"{dimensions:>5} {quantization:>12} {rescore_multiplier if quantization != 'none' else '-':>8} "
+                f"{numpy.mean(recalls):>7.3f} {bytes_per_vector(dimensions, quantization):>13.0f} "
+                f"{1000 * numpy.median(latencies):>8.2f} ms"
+            )
+
+if __name__ == "__main__":
+    asyncio.run(main())
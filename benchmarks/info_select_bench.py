@@ -0,0 +1,87 @@
+# Run from the repository root: python -m benchmarks.info_select_bench [--profile profile.json]
+#
+# Compares the two ways of turning retrieved knowledge chunks into prompt context: the local
+# reranker, and the INFO_SELECT LLM call. The LLM path only runs when a profile is given, since it
+# needs the API keys. Embeddings are synthetic, as the chunks' stored vectors come back with the
+# search hits and cost no request.
+import time
+import numpy
+import random
+import asyncio
+import argparse
+
+from core.util.tokens import estimate_tokens
+from core.bot_workflow.profile_loader import Profile
+from core.bot_workflow.reranker import LocalReranker
+from core.ai_apis.client_registry import ClientRegistry
+
+DIM = 3072
+N_RUNS = 200
+N_LLM_RUNS = 5
+CHUNK_WORDS = 350
+HIT_COUNTS = (5, 10, 20)
+WORDS = "the bot server channel command error token model memory reply user message config file index search".split()
+QUERY = "what does error E1432 mean when running /sync"
+
+def make_passages(rng: random.Random, n: int) -> list[str]:
+    passages = [" ".join(rng.choices(WORDS, k=CHUNK_WORDS)) for _ in range(n)]
+    passages[rng.randrange(n)] += " Error E1432 is raised by /sync when the command tree is out of date."
+    return passages
+
+def percentile_ms(samples: list[float], q: float) -> float:
+    return 1000 * float(numpy.percentile(samples, q))
+
+def bench_reranker(passages: list[str], vectors: list[list[float]], query_vector: list[float]) -> list[float]:
+    reranker = LocalReranker()
+    samples = []
+    for _ in range(N_RUNS):
+        start = time.perf_counter()
+        reranker.rerank(QUERY, passages, query_vector, vectors)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+async def bench_llm(profile: Profile, passages: list[str]) -> list[float]:
+    NAME = "INFO_SELECT"
+    prompt = profile.get_prompt(NAME).replace({
+        "user_query": QUERY,
+        "available_info": "".join(passage + "\n" for passage in passages)
+    })
+    client = ClientRegistry.instance().llm(NAME)
+    samples = []
+    for _ in range(N_LLM_RUNS):
+        start = time.perf_counter()
+        await client.send_request(prompt=prompt, params=profile.request_params[NAME])
+        samples.append(time.perf_counter() - start)
+    return samples
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", help="Also time the INFO_SELECT LLM call with this profile")
+    args = parser.parse_args()
+
+    profile = None
+    if args.profile:
+        profile = Profile.from_file(args.profile)
+        ClientRegistry.instance().register_all(list(profile.providers.values()))
+
+    rng = random.Random(0)
+    vector_rng = numpy.random.default_rng(0)
+    for n_hits in HIT_COUNTS:
+        passages = make_passages(rng, n_hits)
+        vectors = vector_rng.standard_normal((n_hits, DIM), dtype=numpy.float32).tolist()
+        query_vector = vector_rng.standard_normal(DIM, dtype=numpy.float32).tolist()
+        input_tokens = sum(estimate_tokens(passage) for passage in passages)
+        kept_tokens = sum(estimate_tokens(passage.text) for passage in LocalReranker().rerank(QUERY, passages, query_vector, vectors))
+
+        samples = bench_reranker(passages, vectors, query_vector)
+        print(f"{n_hits:>2} hits, {input_tokens} tokens retrieved")
+        print(f"   reranker     p50 {percentile_ms(samples, 50):8.2f} ms   p95 {percentile_ms(samples, 95):8.2f} ms   {kept_tokens} tokens kept")
+        if profile is not None:
+            samples = await bench_llm(profile, passages)
+            print(f"   INFO_SELECT  p50 {percentile_ms(samples, 50):8.2f} ms   p95 {percentile_ms(samples, 95):8.2f} ms")
+
+    if profile is not None:
+        await ClientRegistry.instance().aclose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
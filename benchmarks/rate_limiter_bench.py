@@ -0,0 +1,80 @@
+# Run from the repository root: python -m benchmarks.rate_limiter_bench
+import sys
+import time
+import random
+import tracemalloc
+
+import core.util.rate_limits as rate_limits
+from core.util.rate_limits import RateLimiter, RateLimit
+
+N_USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+N_CHECKS = 1_000_000
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def make_limiter() -> RateLimiter:
+    return RateLimiter(
+        RateLimit(n_messages=3, seconds=10),
+        RateLimit(n_messages=10, seconds=60),
+        RateLimit(n_messages=35, seconds=5 * 60),
+        RateLimit(n_messages=100, seconds=2 * 3600),
+        RateLimit(n_messages=250, seconds=8 * 3600)
+    )
+
+def main():
+    clock = FakeClock()
+    rate_limits.time = clock
+    limiter = make_limiter()
+    user_ids = [random.getrandbits(63) for _ in range(N_USERS)]
+
+    start = time.perf_counter()
+    for user_id in user_ids:
+        clock.now += 0.001
+        limiter.register_request(user_id)
+    register_elapsed = time.perf_counter() - start
+
+    # Measured separately since tracing allocations slows everything down
+    tracemalloc.start()
+    memory_limiter = make_limiter()
+    for user_id in user_ids:
+        memory_limiter.register_request(user_id)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del memory_limiter
+
+    sample = random.choices(user_ids, k=N_CHECKS)
+    start = time.perf_counter()
+    limited = 0
+    for user_id in sample:
+        limited += limiter.is_rate_limited(user_id)
+    check_elapsed = time.perf_counter() - start
+
+    hot_user = user_ids[0]
+    hot_limited = 0
+    start = time.perf_counter()
+    for _ in range(N_CHECKS):
+        clock.now += 0.001
+        limiter.register_request(hot_user)
+        hot_limited += limiter.is_rate_limited(hot_user)
+    hot_elapsed = time.perf_counter() - start
+
+    tracked_before_sweep = len(limiter.user_logs)
+    clock.now += limiter.max_window_seconds + 1
+    start = time.perf_counter()
+    limiter.register_request(hot_user)
+    sweep_elapsed = time.perf_counter() - start
+
+    print(f"users:                  {N_USERS}")
+    print(f"register_request:       {1e9 * register_elapsed / N_USERS:.0f} ns/op")
+    print(f"is_rate_limited:        {1e9 * check_elapsed / N_CHECKS:.0f} ns/op ({limited} limited)")
+    print(f"hot user register+check:{1e9 * hot_elapsed / N_CHECKS:.0f} ns/op ({hot_limited} limited)")
+    print(f"peak memory:            {peak_bytes / 2**20:.1f} MiB ({peak_bytes / N_USERS:.0f} B/user)")
+    print(f"idle sweep:             {tracked_before_sweep} -> {len(limiter.user_logs)} users in {1000 * sweep_elapsed:.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Run from the repository root: python -m benchmarks.vector_backend_bench [n_vectors] [dim]
+import os
+import sys
+import time
+import numpy
+import asyncio
+import tempfile
+
+from core.bot_workflow.vector_backends import MilvusBackend, NumpyBackend, VectorStoreBackend
+
+N_VECTORS = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+DIM = int(sys.argv[2]) if len(sys.argv) > 2 else 3072
+N_QUERIES = 200
+BATCH_SIZE = 1000
+COLLECTION = "memories"
+
+def make_rows(rng: numpy.random.Generator) -> list[dict]:
+    vectors = rng.standard_normal((N_VECTORS, DIM), dtype=numpy.float32)
+    return [
+        {"id": i, "vector": vectors[i].tolist(), "metadata": {"type": "memory", "channel": i % 10, "guild_id": i % 100}, "text": f"message {i}"}
+        for i in range(N_VECTORS)
+    ]
+
+def percentile_ms(samples: list[float], q: float) -> float:
+    return 1000 * float(numpy.percentile(samples, q))
+
+async def bench(name: str, open_backend, rows: list[dict], queries: numpy.ndarray):
+    start = time.perf_counter()
+    backend: VectorStoreBackend = open_backend()
+    await backend.ensure_collection(COLLECTION, DIM)
+    for i in range(0, len(rows), BATCH_SIZE):
+        await backend.insert(COLLECTION, rows[i:i + BATCH_SIZE])
+    insert_elapsed = time.perf_counter() - start
+    await backend.close()
+
+    start = time.perf_counter()
+    backend = open_backend()
+    await backend.ensure_collection(COLLECTION, DIM)
+    await backend.search(COLLECTION, queries[0].tolist(), 5)
+    startup_elapsed = time.perf_counter() - start
+
+    filters = (("search", None), ("search + filter", {"channel": 3}), ("search + guild", {"guild_id": 42}))
+    for label, metadata_filter in filters:
+        samples = []
+        for query in queries:
+            start = time.perf_counter()
+            await backend.search(COLLECTION, query.tolist(), 5, metadata_filter)
+            samples.append(time.perf_counter() - start)
+        print(f"{name:<16} {label:<16} p50 {percentile_ms(samples, 50):7.2f} ms   p95 {percentile_ms(samples, 95):7.2f} ms")
+    print(f"{name:<16} insert {insert_elapsed:.2f} s, reopen + first search {1000 * startup_elapsed:.0f} ms")
+    await backend.close()
+
+async def main():
+    rng = numpy.random.default_rng(0)
+    rows = make_rows(rng)
+    queries = rng.standard_normal((N_QUERIES, DIM), dtype=numpy.float32)
+    print(f"{N_VECTORS} vectors of {DIM} dimensions, {N_QUERIES} queries, top 5")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for dtype in ("float32", "float16"):
+            await bench(
+                f"numpy {dtype}",
+                lambda: NumpyBackend(os.path.join(directory, dtype), dtype=dtype),
+                rows,
+                queries
+            )
+        try:
+            await bench("milvus lite", lambda: MilvusBackend(os.path.join(directory, "milvus.db")), rows, queries)
+        except Exception as e:
+            print(f"milvus lite      skipped: {e!r}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
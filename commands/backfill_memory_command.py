@@ -0,0 +1,78 @@
+import re
+import time
+import discord
+import logging
+from discord import app_commands
+from discord.ext import commands
+from core.bot_workflow.knowledge import LongTermMemoryIndex
+from core.bot_workflow.history_backfill import HistoryBackfill
+from core.bot_workflow.profile_loader import MemoryBackfillConfig
+
+class BackfillMemoryCommand(commands.Cog):
+    def __init__(self, bot: commands.Bot, long_term_memory: LongTermMemoryIndex, backfill_config: MemoryBackfillConfig) -> None:
+        self.bot = bot
+        self.backfill_config = backfill_config
+        self.backfill = HistoryBackfill(
+            long_term_memory,
+            batch_size=backfill_config.batch_size,
+            max_concurrent_channels=backfill_config.max_concurrent_channels,
+            max_pending_batches=backfill_config.max_pending_batches
+        )
+        self.running = False
+
+    async def _resolve_channels(self, channels: str) -> list[discord.abc.Messageable]:
+        resolved = []
+        # Accepts channel mentions or ids, separated by anything
+        for channel_id in dict.fromkeys(int(match) for match in re.findall(r"\d{15,}", channels)):
+            channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+            if not isinstance(channel, discord.abc.Messageable):
+                raise ValueError(f"<#{channel_id}> has no message history")
+            resolved.append(channel)
+        return resolved
+
+    @app_commands.command(
+        name="backfill_memories",
+        description="Memorize the message history of channels, resuming where the last backfill stopped"
+    )
+    @app_commands.describe(channels="Channel mentions or ids", limit="Maximum messages to read per channel")
+    async def backfill_memories(self, interaction: discord.Interaction, channels: str, limit: int | None = None) -> None:
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.response.send_message(":x: Only the bot owner can backfill memories", ephemeral=True)
+            return
+        if self.running:
+            await interaction.response.send_message(":x: A backfill is already running", ephemeral=True)
+            return
+        # Set before the first await, so a second invocation can't slip in
+        self.running = True
+        try:
+            await interaction.response.defer()
+            try:
+                to_backfill = await self._resolve_channels(channels)
+            except (ValueError, discord.HTTPException) as e:
+                await interaction.followup.send(f":x: {e}")
+                return
+            if not to_backfill:
+                await interaction.followup.send(":x: No channels given")
+                return
+
+            # Interaction tokens expire after 15 minutes, so progress goes to a normal message instead
+            status = await interaction.followup.send(f"Backfilling {len(to_backfill)} channels...", wait=True)
+            status_message = await status.channel.fetch_message(status.id)
+            last_update = time.monotonic()
+
+            async def on_progress(progress: HistoryBackfill.Progress):
+                nonlocal last_update
+                if time.monotonic() - last_update < self.backfill_config.progress_interval_seconds:
+                    return
+                last_update = time.monotonic()
+                try:
+                    await status_message.edit(content=f"Backfilling... {progress.describe()}")
+                except discord.HTTPException as e:
+                    logging.warning(f"Could not update backfill progress: {e}")
+
+            progress = await self.backfill.run(to_backfill, limit=limit, on_progress=on_progress)
+            logging.info(f"Memory backfill finished: {progress.describe()}")
+            failures = "".join(f"\n<#{channel_id}>: {error}" for channel_id, error in progress.failed_channels.items())
+            await status_message.edit(content=f"Backfill finished. {progress.describe()}{failures}"[:2000])
+        finally:
+            self.running = False
@@ -7,7 +7,8 @@ import traceback
 from discord import app_commands
 from discord.ext import commands
 from core.util.rate_limits import RateLimit, RateLimiter
-from core.ai_apis.client import LLMClient, LLMRequestParams
+from core.ai_apis.client import LLMRequestParams
+from core.ai_apis.client_registry import ClientRegistry
 from core.bot_workflow.profile_loader import Profile, FalImageGenModuleConfig
 
 class ImageGenCommand(commands.Cog):
@@ -21,8 +22,7 @@ class ImageGenCommand(commands.Cog):
         blocked_words = ["nsfw", "naked", "bikini", "lingerie", "sexy", "penis", "fuck", "murder", "blood"]
         NAME = "NSFW_IMAGE_PROMPT_FILTER"
         nsfw_filter_prompt = self.bot_profile.prompts[NAME]
-        nsfw_filter_provider = self.bot_profile.providers[NAME]
-        nsfw_filter_llm = LLMClient.from_provider(nsfw_filter_provider)
+        nsfw_filter_llm = ClientRegistry.instance().llm(NAME)
 
         for word in blocked_words:
             if word in prompt:
@@ -0,0 +1,133 @@
+import time
+import logging
+
+from enum import Enum
+from collections import deque
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    def __init__(
+            self,
+            name: str,
+            *,
+            window_size: int = 20,
+            min_calls: int = 5,
+            failure_rate_threshold: float = 0.5,
+            slow_call_seconds: float = 10.0,
+            slow_call_rate_threshold: float = 0.8,
+            open_seconds: float = 30.0,
+            max_open_seconds: float = 300.0
+        ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.base_open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.state = CircuitState.CLOSED
+        # (succeeded, seconds) for the most recent calls
+        self._calls: deque[tuple[bool, float]] = deque(maxlen=window_size)
+        self._opened_at = 0.0
+        self._open_seconds = open_seconds
+        self._probe_in_flight = False
+
+    def is_available(self) -> bool:
+        if self.state == CircuitState.CLOSED:
+            return True
+        if self.state == CircuitState.OPEN:
+            return time.monotonic() - self._opened_at >= self._open_seconds
+        return not self._probe_in_flight
+
+    def acquire(self) -> None:
+        if not self.is_available():
+            raise CircuitOpenError(f"Circuit for {self.name} is {self.state.value}, skipping request")
+        if self.state == CircuitState.OPEN:
+            self.state = CircuitState.HALF_OPEN
+            logging.info(f"Circuit for {self.name} is half-open, sending a probe request")
+        if self.state == CircuitState.HALF_OPEN:
+            # Only one request at a time gets to find out whether the provider recovered
+            self._probe_in_flight = True
+
+    def release(self) -> None:
+        # For calls that were cancelled, which say nothing about the provider's health
+        self._probe_in_flight = False
+
+    def record_success(self, seconds: float) -> None:
+        self._calls.append((True, seconds))
+        if self.state == CircuitState.HALF_OPEN:
+            self._close()
+        else:
+            self._evaluate()
+
+    def record_failure(self, seconds: float) -> None:
+        self._calls.append((False, seconds))
+        if self.state == CircuitState.HALF_OPEN:
+            # Still down, wait longer before probing again
+            self._open(min(self._open_seconds * 2, self.max_open_seconds))
+        else:
+            self._evaluate()
+
+    def _evaluate(self):
+        if self.state != CircuitState.CLOSED or len(self._calls) < self.min_calls:
+            return
+        failure_rate = sum(1 for succeeded, _ in self._calls if not succeeded) / len(self._calls)
+        slow_rate = sum(1 for _, seconds in self._calls if seconds >= self.slow_call_seconds) / len(self._calls)
+        if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+            self._open(self.base_open_seconds)
+
+    def _open(self, open_seconds: float):
+        self.state = CircuitState.OPEN
+        self._opened_at = time.monotonic()
+        self._open_seconds = open_seconds
+        self._probe_in_flight = False
+        logging.warning(f"Circuit for {self.name} opened for {open_seconds:.0f} s (health {self.health_score():.2f})")
+
+    def _close(self):
+        self.state = CircuitState.CLOSED
+        self._calls.clear()
+        self._open_seconds = self.base_open_seconds
+        self._probe_in_flight = False
+        logging.info(f"Circuit for {self.name} closed, provider recovered")
+
+    def health_score(self) -> float:
+        if not self._calls:
+            return 1.0
+        healthy = sum(1 for succeeded, seconds in self._calls if succeeded and seconds < self.slow_call_seconds)
+        return healthy / len(self._calls)
+
+class CircuitBreakerRegistry:
+    _instance: "CircuitBreakerRegistry | None" = None
+
+    def __init__(self):
+        self.settings: dict = {}
+        self._breakers: dict[tuple[str, str], CircuitBreaker] = {}
+
+    @classmethod
+    def instance(cls) -> "CircuitBreakerRegistry":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def configure(self, **settings) -> None:
+        self.settings = settings
+        self._breakers.clear()
+
+    def get(self, provider_name: str, model_name: str) -> CircuitBreaker:
+        key = (provider_name, model_name)
+        if key not in self._breakers:
+            self._breakers[key] = CircuitBreaker(f"{model_name} @ {provider_name}", **self.settings)
+        return self._breakers[key]
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"{breaker.name}: {breaker.state.value} (health {breaker.health_score():.2f})"
+            for breaker in self._breakers.values()
+        ) or "no requests"
@@ -1,10 +1,17 @@
 import json
+import time
 import openai
 
-from typing import Any
+from typing import Any, AsyncIterator, Callable
+from contextlib import nullcontext
 from abc import ABC, abstractmethod
 from core.ai_apis.providers import ProviderData
-from core.ai_apis.types import LLMRequestParams, Prompt
+from core.ai_apis.usage_stats import TokenUsageStats
+from core.ai_apis.embedding_cache import EmbeddingCache
+from core.ai_apis.circuit_breaker import CircuitBreaker, CircuitBreakerRegistry
+from core.ai_apis.scheduler import RequestScheduler
+from core.util.tokens import estimate_tokens, estimate_message_tokens
+from core.ai_apis.api_types import LLMRequestParams, Prompt
 
 class ContentModerator(ABC):
     @abstractmethod
@@ -23,25 +30,48 @@ class OpenAIModerator(ContentModerator):
 
 # TODO: should be provider (e.g. OpenAI) agnostic
 class EmbeddingsClient:
-    def __init__(self, provider: ProviderData):
-        self.client = openai.AsyncOpenAI(
+    def __init__(self, client: openai.AsyncClient, cache: EmbeddingCache | None = None, scheduler: RequestScheduler | None = None):
+        self.client = client
+        self.cache = cache
+        self.scheduler = scheduler
+
+    @classmethod
+    def from_provider(cls, provider: ProviderData):
+        client = openai.AsyncOpenAI(
             api_key=provider.api_key, 
             base_url=provider.api_base
         )
+        return cls(client)
 
-    async def vectorize(self, input: str | list[str], model="text-embedding-3-large") -> list[float] | list[list[float]]:
-        if isinstance(input, str):
-            response = await self.client.embeddings.create(
-                input=input,
-                model=model
-            )
-            return response.data[0].embedding
-        elif isinstance(input, list):
-            response = await self.client.embeddings.create(
-                input=input,
-                model=model
-            )
-            return [e.embedding for e in response.data]
+    async def _request_embeddings(self, texts: list[str], model: str, dimensions: int | None) -> list[list[float]]:
+        slot = self.scheduler.slot(estimated_tokens=sum(estimate_tokens(text) for text in texts)) if self.scheduler else nullcontext()
+        async with slot:
+            if dimensions is None:
+                response = await self.client.embeddings.create(input=texts, model=model)
+            else:
+                response = await self.client.embeddings.create(input=texts, model=model, dimensions=dimensions)
+        return [e.embedding for e in response.data]
+
+    async def vectorize(
+            self,
+            input: str | list[str],
+            model="text-embedding-3-large",
+            dimensions: int | None = None
+        ) -> list[float] | list[list[float]]:
+        texts = [input] if isinstance(input, str) else input
+        if self.cache is None:
+            vectors = await self._request_embeddings(texts, model, dimensions)
+        else:
+            # Shortened embeddings differ from the full ones, so they're cached separately
+            cache_model = model if dimensions is None else f"{model}@{dimensions}"
+            vectors = await self.cache.get_many(cache_model, texts)
+            missing_texts = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+            if missing_texts:
+                new_vectors = await self._request_embeddings(missing_texts, model, dimensions)
+                await self.cache.put_many(cache_model, missing_texts, new_vectors)
+                by_text = dict(zip(missing_texts, new_vectors))
+                vectors = [by_text[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return vectors[0] if isinstance(input, str) else vectors
 
 class SyncEmbeddingsClient:
     def __init__(self, provider: ProviderData):
@@ -65,12 +95,14 @@ class SyncEmbeddingsClient:
             return [e.embedding for e in response.data]
 
 class LLMClient:
-    def __init__(self, client: openai.AsyncClient):
+    def __init__(self, client: openai.AsyncClient, name: str = "default", scheduler: RequestScheduler | None = None):
         self.client = client
+        self.name = name
+        self.scheduler = scheduler
 
     @classmethod
-    def from_openai_client(cls, client: openai.AsyncClient):
-        return cls(client)
+    def from_openai_client(cls, client: openai.AsyncClient, name: str = "default", scheduler: RequestScheduler | None = None):
+        return cls(client, name, scheduler)
 
     @classmethod
     def from_provider(cls, provider: ProviderData):
@@ -79,9 +111,45 @@ class LLMClient:
             base_url=provider.api_base,
             timeout=15
         )
-        return cls.from_openai_client(client)
+        return cls.from_openai_client(client, provider.provider_name)
+
+    def circuit_breaker(self, model_name: str) -> CircuitBreaker:
+        return CircuitBreakerRegistry.instance().get(self.name, model_name)
+
+    def _slot(self, prompt: Prompt, params: LLMRequestParams):
+        if self.scheduler is None:
+            return nullcontext()
+        prompt_tokens = sum(estimate_message_tokens(message) for message in prompt.messages)
+        return self.scheduler.slot(estimated_tokens=prompt_tokens + (params.max_tokens or 0))
+
+    @staticmethod
+    def _record_usage(model_name: str, usage: Any, on_usage: Callable[[Any], None] | None):
+        if usage is None:
+            return
+        TokenUsageStats.instance().record(model_name, usage)
+        if on_usage is not None:
+            on_usage(usage)
 
-    async def send_request(self, *, prompt: Prompt, params: LLMRequestParams):
+    async def send_request(self, *, prompt: Prompt, params: LLMRequestParams, on_usage: Callable[[Any], None] | None = None):
+        # Fails fast while the model is known to be down, instead of waiting for it to time out
+        breaker = self.circuit_breaker(params.model_name)
+        breaker.acquire()
+        try:
+            async with self._slot(prompt, params):
+                start = time.perf_counter()
+                try:
+                    choice = await self._send_request(prompt=prompt, params=params, on_usage=on_usage)
+                except Exception:
+                    breaker.record_failure(time.perf_counter() - start)
+                    raise
+        except BaseException:
+            # Cancelled, possibly while still queued; a no-op if the outcome was already recorded
+            breaker.release()
+            raise
+        breaker.record_success(time.perf_counter() - start)
+        return choice
+
+    async def _send_request(self, *, prompt: Prompt, params: LLMRequestParams, on_usage: Callable[[Any], None] | None):
         raw_response = await self.client.chat.completions.create(
             messages=prompt.to_openai_format(),
             model=params.model_name,
@@ -89,6 +157,7 @@ class LLMClient:
             temperature=params.temperature,
             logit_bias=params.logit_bias
         )
+        LLMClient._record_usage(params.model_name, raw_response.usage, on_usage)
         
         if raw_response.choices is None or len(raw_response.choices) == 0:
             resp_json = json.loads(raw_response.to_json())
@@ -98,3 +167,44 @@ class LLMClient:
                 raise RuntimeError(f"ProviderData returned no response choices. Response was {str(raw_response)}")
         else:
             return raw_response.choices[0]
+
+    async def stream_request(self, *, prompt: Prompt, params: LLMRequestParams, on_usage: Callable[[Any], None] | None = None) -> AsyncIterator[str]:
+        breaker = self.circuit_breaker(params.model_name)
+        breaker.acquire()
+        first_token_seconds: float | None = None
+        try:
+            async with self._slot(prompt, params):
+                start = time.perf_counter()
+                try:
+                    stream = await self.client.chat.completions.create(
+                        messages=prompt.to_openai_format(),
+                        model=params.model_name,
+                        max_tokens=params.max_tokens,
+                        temperature=params.temperature,
+                        logit_bias=params.logit_bias,
+                        stream=True,
+                        stream_options={"include_usage": True}
+                    )
+
+                    async for chunk in stream:
+                        # With include_usage, the last chunk has no choices and carries the token usage
+                        LLMClient._record_usage(params.model_name, chunk.usage, on_usage)
+                        if chunk.choices is None or len(chunk.choices) == 0:
+                            chunk_json = json.loads(chunk.to_json())
+                            if "error" in chunk_json and chunk_json["error"]:
+                                raise RuntimeError(chunk_json["error"])
+                            continue
+                        token = chunk.choices[0].delta.content
+                        if token:
+                            if first_token_seconds is None:
+                                first_token_seconds = time.perf_counter() - start
+                            yield token
+                except Exception:
+                    breaker.record_failure(time.perf_counter() - start)
+                    raise
+        except BaseException:
+            # Cancelled, or the caller stopped reading the stream
+            breaker.release()
+            raise
+        # Streams are judged by time to first token, since long replies are expected to take a while
+        breaker.record_success(first_token_seconds if first_token_seconds is not None else time.perf_counter() - start)
@@ -0,0 +1,90 @@
+import openai
+import httpx
+import logging
+
+from core.ai_apis.providers import ProviderData
+from core.ai_apis.embedding_cache import EmbeddingCache
+from core.ai_apis.scheduler import RequestScheduler
+from core.ai_apis.client import LLMClient, EmbeddingsClient
+
+class ClientRegistry:
+    _instance: "ClientRegistry | None" = None
+
+    def __init__(self):
+        self._openai_clients: dict[str, openai.AsyncOpenAI] = {}
+        self._llm_clients: dict[str, LLMClient] = {}
+        self._embeddings_clients: dict[str, EmbeddingsClient] = {}
+        self._schedulers: dict[str, RequestScheduler] = {}
+        self.embedding_cache: EmbeddingCache | None = None
+
+    @classmethod
+    def instance(cls) -> "ClientRegistry":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def register(self, provider: ProviderData) -> None:
+        name = provider.provider_name
+        if name in self._openai_clients:
+            return
+
+        # One keep-alive pool per provider, shared by every request made through it
+        http_client = openai.DefaultAsyncHttpxClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=provider.max_connections,
+                max_keepalive_connections=provider.max_connections
+            )
+        )
+        client = openai.AsyncOpenAI(
+            api_key=provider.api_key,
+            base_url=provider.api_base,
+            timeout=15,
+            http_client=http_client
+        )
+        # Chat, vision and embedding requests to the same provider share its limits
+        scheduler = RequestScheduler(
+            name,
+            max_concurrent_requests=provider.max_concurrent_requests,
+            requests_per_minute=provider.requests_per_minute,
+            tokens_per_minute=provider.tokens_per_minute
+        )
+        self._openai_clients[name] = client
+        self._schedulers[name] = scheduler
+        self._llm_clients[name] = LLMClient.from_openai_client(client, name, scheduler)
+        self._embeddings_clients[name] = EmbeddingsClient(client, self.embedding_cache, scheduler)
+        logging.info(f"Created API client for provider {name} (max {provider.max_connections} connections, {provider.max_concurrent_requests} concurrent requests)")
+
+    def register_all(self, providers: list[ProviderData], *, embedding_cache: EmbeddingCache | None = None) -> None:
+        if embedding_cache is not None:
+            self.embedding_cache = embedding_cache
+        for provider in providers:
+            self.register(provider)
+
+    def llm(self, provider_name: str) -> LLMClient:
+        if provider_name not in self._llm_clients:
+            raise ValueError(f"No client registered for provider {provider_name}. Please ensure it is set in the profile JSON.")
+        return self._llm_clients[provider_name]
+
+    def embeddings(self, provider_name: str) -> EmbeddingsClient:
+        if provider_name not in self._embeddings_clients:
+            raise ValueError(f"No client registered for provider {provider_name}. Please ensure it is set in the profile JSON.")
+        return self._embeddings_clients[provider_name]
+
+    def scheduler_stats(self) -> dict[str, dict]:
+        return {name: scheduler.stats() for name, scheduler in self._schedulers.items()}
+
+    async def aclose(self) -> None:
+        for name, client in self._openai_clients.items():
+            try:
+                await client.close()
+            except Exception as e:
+                logging.warning(f"Failed to close API client for provider {name}: {e}")
+        self._openai_clients.clear()
+        self._llm_clients.clear()
+        self._embeddings_clients.clear()
+        self._schedulers.clear()
+        if self.embedding_cache is not None:
+            logging.info(f"Embedding cache stats: {self.embedding_cache.stats()}")
+            self.embedding_cache.close()
+            self.embedding_cache = None
@@ -0,0 +1,140 @@
+import os
+import time
+import numpy
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+
+from collections import OrderedDict
+
+CacheKey = tuple[str, str]
+
+class EmbeddingCache:
+    def __init__(self, path: str | None, *, max_memory_entries: int = 10_000, max_disk_entries: int = 200_000):
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[CacheKey, list[float]] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._disk_entries = 0
+
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL, "
+                "PRIMARY KEY (model, text_hash))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._db.commit()
+            self._disk_entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            logging.info(f"Opened embedding cache at '{path}' with {self._disk_entries} entries")
+
+    @staticmethod
+    def key(model: str, text: str) -> CacheKey:
+        return model, hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _remember(self, key: CacheKey, vector: list[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, keys: list[CacheKey]) -> dict[CacheKey, list[float]]:
+        found: dict[CacheKey, list[float]] = {}
+        if self._db is None or not keys:
+            return found
+        with self._db_lock:
+            for model, text_hash in keys:
+                row = self._db.execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND text_hash = ?", (model, text_hash)
+                ).fetchone()
+                if row is not None:
+                    found[(model, text_hash)] = numpy.frombuffer(row[0], dtype=numpy.float32).tolist()
+            if found:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, text_hash) for model, text_hash in found]
+                )
+                self._db.commit()
+        return found
+
+    def _disk_put(self, entries: list[tuple[CacheKey, list[float]]]):
+        if self._db is None or not entries:
+            return
+        now = time.time()
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [
+                    (model, text_hash, numpy.asarray(vector, dtype=numpy.float32).tobytes(), now)
+                    for (model, text_hash), vector in entries
+                ]
+            )
+            self._disk_entries += len(entries)
+            if self._disk_entries > self.max_disk_entries:
+                # Evict least recently used entries, with some slack so this doesn't run on every insert
+                excess = self._disk_entries - self.max_disk_entries + self.max_disk_entries // 10
+                self._db.execute(
+                    "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self._disk_entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._db.commit()
+
+    async def get_many(self, model: str, texts: list[str]) -> list[list[float] | None]:
+        keys = [EmbeddingCache.key(model, text) for text in texts]
+        results: list[list[float] | None] = []
+        not_in_memory: list[CacheKey] = []
+        for key in keys:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            else:
+                not_in_memory.append(key)
+            results.append(vector)
+
+        if not_in_memory:
+            found_on_disk = await asyncio.to_thread(self._disk_get, not_in_memory)
+            for i, key in enumerate(keys):
+                if results[i] is not None:
+                    continue
+                vector = found_on_disk.get(key)
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self.disk_hits += 1
+                    self._remember(key, vector)
+                    results[i] = vector
+        return results
+
+    async def put_many(self, model: str, texts: list[str], vectors: list[list[float]]):
+        entries = [(EmbeddingCache.key(model, text), vector) for text, vector in zip(texts, vectors)]
+        for key, vector in entries:
+            self._remember(key, vector)
+        await asyncio.to_thread(self._disk_put, entries)
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": self._disk_entries
+        }
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
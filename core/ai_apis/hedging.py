@@ -0,0 +1,87 @@
+import asyncio
+
+from typing import Awaitable, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+# An attempt receives a claim() callback. Streaming attempts call it before emitting output and
+# must stop if it returns False, since another attempt already started answering.
+Attempt = Callable[[Callable[[], bool]], Awaitable[T]]
+
+class HedgedRace(Generic[T]):
+    def __init__(self, attempts: list[Attempt[T]], hedge_delays: list[float | None]):
+        if len(attempts) != len(hedge_delays):
+            raise ValueError("Need exactly one hedge delay per attempt")
+        self.attempts = attempts
+        self.hedge_delays = hedge_delays
+        self.leader: int | None = None
+        self.errors: list[BaseException] = []
+        self._leader_claimed = asyncio.Event()
+
+    def _claim_for(self, index: int) -> Callable[[], bool]:
+        def claim() -> bool:
+            if self.leader is None:
+                self.leader = index
+                self._leader_claimed.set()
+            return self.leader == index
+        return claim
+
+    async def run(self) -> tuple[int, T]:
+        running: dict[asyncio.Task, int] = {}
+        next_attempt = 0
+        leader_waiter: asyncio.Task | None = None
+
+        def launch():
+            nonlocal next_attempt
+            task = asyncio.create_task(self.attempts[next_attempt](self._claim_for(next_attempt)))
+            running[task] = next_attempt
+            next_attempt += 1
+
+        def cancel_all_except(keep: int | None):
+            for task, index in list(running.items()):
+                if index != keep:
+                    task.cancel()
+
+        launch()
+        try:
+            while running:
+                if leader_waiter is None and self.leader is None:
+                    leader_waiter = asyncio.create_task(self._leader_claimed.wait())
+                can_hedge = self.leader is None and next_attempt < len(self.attempts)
+                timeout = self.hedge_delays[next_attempt - 1] if can_hedge else None
+                waiting_on = set(running) | ({leader_waiter} if leader_waiter is not None else set())
+                done, _ = await asyncio.wait(waiting_on, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Nothing answered in time, start the next attempt alongside the slow ones
+                    launch()
+                    continue
+
+                if leader_waiter in done:
+                    leader_waiter = None
+                    cancel_all_except(self.leader)
+
+                for task in done:
+                    if task not in running:
+                        continue
+                    index = running.pop(task)
+                    if task.cancelled():
+                        continue
+                    error = task.exception()
+                    if error is None:
+                        if self.leader is None or self.leader == index:
+                            return index, task.result()
+                        continue
+                    self.errors.append(error)
+                    if self.leader == index:
+                        # The answering attempt failed midway, let the others take over again
+                        self.leader = None
+                        self._leader_claimed.clear()
+                    if self.leader is None and next_attempt < len(self.attempts):
+                        launch()
+
+            raise RuntimeError(f"All {len(self.attempts)} attempts failed: {[str(e) for e in self.errors]}")
+        finally:
+            pending = list(running) + ([leader_waiter] if leader_waiter is not None else [])
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,52 @@
+import math
+
+from collections import deque
+
+class LatencyTracker:
+    _instance: "LatencyTracker | None" = None
+    HISTOGRAM_BOUNDS = [0.5, 1.0, 2.0, 4.0, 8.0, 15.0]
+
+    def __init__(self, window_size: int = 200):
+        self.window_size = window_size
+        self._samples: dict[str, deque[float]] = {}
+
+    @classmethod
+    def instance(cls) -> "LatencyTracker":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def record(self, key: str, seconds: float) -> None:
+        if key not in self._samples:
+            self._samples[key] = deque(maxlen=self.window_size)
+        self._samples[key].append(seconds)
+
+    def count(self, key: str) -> int:
+        return len(self._samples.get(key, ()))
+
+    def percentile(self, key: str, q: float, *, min_samples: int = 1) -> float | None:
+        samples = self._samples.get(key)
+        if samples is None or len(samples) < max(min_samples, 1):
+            return None
+        ordered = sorted(samples)
+        rank = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+        return ordered[rank]
+
+    def histogram(self, key: str, bucket_bounds: list[float]) -> dict[str, int]:
+        counts = {f"<={bound}s": 0 for bound in bucket_bounds}
+        counts[f">{bucket_bounds[-1]}s"] = 0
+        for sample in self._samples.get(key, ()):
+            for bound in bucket_bounds:
+                if sample <= bound:
+                    counts[f"<={bound}s"] += 1
+                    break
+            else:
+                counts[f">{bucket_bounds[-1]}s"] += 1
+        return counts
+
+    def summary(self) -> str:
+        return "; ".join(
+            f"{key}: {len(samples)} samples, p50 {self.percentile(key, 0.5):.2f}s, p95 {self.percentile(key, 0.95):.2f}s, "
+            f"{self.histogram(key, LatencyTracker.HISTOGRAM_BOUNDS)}"
+            for key, samples in self._samples.items() if samples
+        )
@@ -6,6 +6,10 @@ class ProviderData(BaseModel):
     provider_name: str
     api_base: str = Field(default='https://api.openai.com/v1')
     api_key: str
+    max_connections: int = 20
+    max_concurrent_requests: int = 8
+    requests_per_minute: int | None = None
+    tokens_per_minute: int | None = None
 
     @model_validator(mode='before')
     @classmethod
@@ -0,0 +1,174 @@
+import time
+import asyncio
+
+from enum import IntEnum
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterator
+from core.ai_apis.latency_stats import LatencyTracker
+
+class Priority(IntEnum):
+    # Lower values are served first
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+_current_guild: ContextVar[int | None] = ContextVar("scheduler_guild", default=None)
+_current_priority: ContextVar[Priority] = ContextVar("scheduler_priority", default=Priority.INTERACTIVE)
+
+# Tags every API request made within the block, including in tasks it spawns
+@contextmanager
+def request_scope(*, guild_id: int | None = None, priority: Priority | None = None) -> Iterator[None]:
+    guild_token = _current_guild.set(guild_id) if guild_id is not None else None
+    priority_token = _current_priority.set(priority) if priority is not None else None
+    try:
+        yield
+    finally:
+        if priority_token is not None:
+            _current_priority.reset(priority_token)
+        if guild_token is not None:
+            _current_guild.reset(guild_token)
+
+class TokenBucket:
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.available = float(per_minute)
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def seconds_until(self, amount: float) -> float:
+        self._refill()
+        # Requests bigger than the whole bucket only wait for it to be full
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.available -= amount
+
+@dataclass
+class _Waiter:
+    future: asyncio.Future
+    tokens: int
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+class RequestScheduler:
+    def __init__(
+            self,
+            name: str,
+            *,
+            max_concurrent_requests: int,
+            requests_per_minute: int | None = None,
+            tokens_per_minute: int | None = None
+        ):
+        self.name = name
+        self.max_concurrent_requests = max_concurrent_requests
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.in_flight = 0
+        # Priority -> guild -> waiters. Guilds are served round-robin so one busy server can't starve the rest
+        self._queues: dict[Priority, OrderedDict[int | None, deque[_Waiter]]] = {p: OrderedDict() for p in Priority}
+        self._retry_handle: asyncio.TimerHandle | None = None
+
+    def queue_depth(self, priority: Priority | None = None) -> int:
+        priorities = list(Priority) if priority is None else [priority]
+        return sum(len(waiters) for p in priorities for waiters in self._queues[p].values())
+
+    def _next_guild_queue(self) -> tuple[OrderedDict[int | None, deque[_Waiter]], int | None] | None:
+        for priority in Priority:
+            guilds = self._queues[priority]
+            if guilds:
+                return guilds, next(iter(guilds))
+        return None
+
+    def _seconds_until_allowed(self, waiter: _Waiter) -> float:
+        wait = 0.0
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.seconds_until(1))
+        if self.token_bucket is not None:
+            wait = max(wait, self.token_bucket.seconds_until(waiter.tokens))
+        return wait
+
+    def _dispatch(self):
+        while self.in_flight < self.max_concurrent_requests:
+            next_queue = self._next_guild_queue()
+            if next_queue is None:
+                return
+            guilds, guild = next_queue
+            waiters = guilds[guild]
+            waiter = waiters[0]
+
+            wait = self._seconds_until_allowed(waiter)
+            if wait > 0:
+                if self._retry_handle is None:
+                    self._retry_handle = asyncio.get_running_loop().call_later(wait, self._retry_dispatch)
+                return
+
+            waiters.popleft()
+            if waiters:
+                # This guild goes to the back of the line
+                guilds.move_to_end(guild)
+            else:
+                del guilds[guild]
+            if self.request_bucket is not None:
+                self.request_bucket.take(1)
+            if self.token_bucket is not None:
+                self.token_bucket.take(waiter.tokens)
+            self.in_flight += 1
+            LatencyTracker.instance().record(f"queue wait @ {self.name}", time.monotonic() - waiter.enqueued_at)
+            waiter.future.set_result(None)
+
+    def _retry_dispatch(self):
+        self._retry_handle = None
+        self._dispatch()
+
+    def _remove(self, waiter: _Waiter, priority: Priority, guild: int | None):
+        waiters = self._queues[priority].get(guild)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._queues[priority][guild]
+
+    def _release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, *, estimated_tokens: int = 0) -> AsyncIterator[None]:
+        priority = _current_priority.get()
+        guild = _current_guild.get()
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), estimated_tokens)
+        self._queues[priority].setdefault(guild, deque()).append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # The slot was granted right as we got cancelled
+                self._release()
+            else:
+                self._remove(waiter, priority, guild)
+            raise
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict[str, float | int | None]:
+        wait_key = f"queue wait @ {self.name}"
+        return {
+            "in_flight": self.in_flight,
+            "queued_interactive": self.queue_depth(Priority.INTERACTIVE),
+            "queued_background": self.queue_depth(Priority.BACKGROUND),
+            "wait_p50_seconds": LatencyTracker.instance().percentile(wait_key, 0.5),
+            "wait_p95_seconds": LatencyTracker.instance().percentile(wait_key, 0.95)
+        }
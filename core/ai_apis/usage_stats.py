@@ -0,0 +1,46 @@
+from typing import Any
+from dataclasses import dataclass
+
+@dataclass
+class ModelUsage:
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def cache_hit_rate(self) -> float:
+        return self.cached_prompt_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+class TokenUsageStats:
+    _instance: "TokenUsageStats | None" = None
+
+    def __init__(self):
+        self.by_model: dict[str, ModelUsage] = {}
+
+    @classmethod
+    def instance(cls) -> "TokenUsageStats":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def cached_tokens(usage: Any) -> int:
+        details = getattr(usage, "prompt_tokens_details", None)
+        return (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+
+    def record(self, model_name: str, usage: Any) -> None:
+        if usage is None:
+            return
+        model_usage = self.by_model.setdefault(model_name, ModelUsage())
+        model_usage.requests += 1
+        model_usage.prompt_tokens += usage.prompt_tokens or 0
+        model_usage.completion_tokens += usage.completion_tokens or 0
+        model_usage.cached_prompt_tokens += TokenUsageStats.cached_tokens(usage)
+
+    def summary(self) -> str:
+        return "; ".join(
+            f"{model}: {usage.requests} requests, {usage.prompt_tokens} prompt tokens "
+            f"({usage.cached_prompt_tokens} cached, {100 * usage.cache_hit_rate:.1f}%), {usage.completion_tokens} completion tokens"
+            for model, usage in self.by_model.items()
+        )
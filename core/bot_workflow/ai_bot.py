@@ -1,6 +1,13 @@
 from dataclasses import dataclass
 from core.ai_apis.client import LLMClient
+from core.ai_apis.client_registry import ClientRegistry
+from core.ai_apis.usage_stats import TokenUsageStats
+from core.ai_apis.latency_stats import LatencyTracker
+from core.ai_apis.hedging import HedgedRace
 from core.ai_apis.api_types import LLMRequestParams, Prompt
+from core.bot_workflow.stage_graph import StageGraph
+from core.bot_workflow.prompt_budget import PromptBudget
+from core.bot_workflow.response_cache import SemanticResponseCache
 from core.bot_workflow.custom_bot_data import CustomBotData
 from core.bot_workflow.response_logs import SimpleDebugLogger
 from core.bot_workflow.bot_types import MessageSnapshot, MessageSnapshotHistory
@@ -8,11 +15,17 @@ from core.bot_workflow.response_steps import PersonalityRewriteStep, RelevantInf
 
 import re
 import json
+import time
 import random
+import asyncio
 import logging
 import discord
 import datetime
 
+from typing import Any, Callable
+
+VOLATILE_CONTEXT_POINTER = "(see the CONTEXT message at the end)"
+
 class AIDiscordBotResponder:
     @dataclass
     class Response:
@@ -21,22 +34,45 @@ class AIDiscordBotResponder:
         tool_call_result: str | None
         verbose_log_output: str
 
-    def __init__(self, bot_data: CustomBotData, initial_message: discord.Message, verbose: bool=False):
+    def __init__(
+            self, 
+            bot_data: CustomBotData, 
+            initial_message: discord.Message, 
+            verbose: bool=False, 
+            *, 
+            earlier_messages: list[discord.Message] | None = None
+        ):
         self.verbose = verbose
         self.bot_data = bot_data
         self.initial_message = initial_message
+        # Other pings in the channel answered by the same reply, oldest first, when requests are coalesced
+        self.earlier_messages = earlier_messages or []
         self.clients: dict[str, LLMClient] = {}
         self.logger = SimpleDebugLogger("ResponseLogger")
+        self._chosen_replacements: dict[str, str] | None = None
 
-        for provider_name, provider_data in bot_data.provider_store.providers.items():
-            self.clients[provider_name] = LLMClient.from_provider(provider_data)
+        for provider_name in bot_data.provider_store.providers:
+            self.clients[provider_name] = ClientRegistry.instance().llm(provider_name)
 
     async def _get_usable_message_history_before(self, message: discord.Message) -> MessageSnapshotHistory:
         USABLE_HISTORY_LENGTH = 14
-        usable_history = await self.bot_data.recent_history.get_finalized_message_history()
+        channel_history = self.bot_data.recent_history.for_channel(message.channel.id)
+        usable_history = await channel_history.get_finalized_message_history()
+        if self.bot_data.conversation_summarizer is not None:
+            # Whatever falls out of the window is folded into the channel's summary in the background
+            self.bot_data.conversation_summarizer.note_history(message.channel.id, usable_history.as_list(), USABLE_HISTORY_LENGTH)
         last_n_messages = [msg for msg in usable_history._memory][-USABLE_HISTORY_LENGTH:]
+        for earlier_message in self.earlier_messages:
+            last_n_messages.append(await MessageSnapshot.of_discord_message(earlier_message))
         last_n_messages.append(await MessageSnapshot.of_discord_message(message))
         return MessageSnapshotHistory(last_n_messages)
+
+    def _query_text(self) -> str:
+        return "\n".join(message.content for message in [*self.earlier_messages, self.initial_message])
+
+    def _user_nicks(self) -> str:
+        nicks = dict.fromkeys(message.author.display_name for message in [*self.earlier_messages, self.initial_message])
+        return ", ".join(nicks)
     
     async def _describe_image_if_present(self, message: discord.Message, user_query: str) -> str | None:
         NAME = "IMAGE_VIEW"
@@ -69,24 +105,36 @@ class AIDiscordBotResponder:
         )
         return response.message.content
     
-    async def _rephrase_user_query(self) -> str:
-        user_query = await UserQueryRephraseStep(self.logger).execute(self.bot_data, self.initial_message.content)
+    async def _rephrase_user_query(self, memory_snapshot: MessageSnapshotHistory) -> str:
+        rephraser = UserQueryRephraseStep(logger=self.logger, history=memory_snapshot)
+        user_query = await rephraser.execute(self.bot_data, self.initial_message.content)
         if user_query is None:
             raise RuntimeError("Rephraser step returned empty response")
         return user_query
     
-    async def _select_relevant_info(self, user_query: str) -> str:
-        info_selector = RelevantInfoSelectStep(logger=self.logger, user_query=user_query)
+    async def _select_relevant_info(self, user_query: str, query_vector: list[float] | None) -> str:
+        info_selector = RelevantInfoSelectStep(logger=self.logger, user_query=user_query, query_vector=query_vector)
         knowledge = await info_selector.execute(self.bot_data, self.initial_message.content)
         if knowledge is None:
             raise RuntimeError("Knowledge retrieval step returned empty response")
         return knowledge
 
-    async def _get_old_memories_as_text(self, user_query: str) -> str:
-        old_memories = ""
+    def _memory_scope_filter(self) -> dict | None:
+        scope = self.bot_data.profile.options.memory_search_scope
+        message = self.initial_message
+        if scope == "guild" and message.guild is not None:
+            return {"guild_id": message.guild.id}
+        if scope != "global":
+            # Direct messages have no server, so they're scoped to the channel
+            return {"channel_id": message.channel.id}
+        return None
+
+    async def _get_old_memories(self, query: str | list[float]) -> list[str]:
+        old_memories = []
         if self.bot_data.long_term_memory is not None:
-            for hit in await self.bot_data.long_term_memory.get_closest_messages(user_query):
-                old_memories += hit.entity["text"] + "\n"
+            hits = await self.bot_data.long_term_memory.get_closest_messages(query, metadata_filter=self._memory_scope_filter())
+            for hit in hits:
+                old_memories.append(hit.entity["text"])
         return old_memories
     
     async def _personality_rewrite(self, llm_response: str) -> str:
@@ -96,34 +144,225 @@ class AIDiscordBotResponder:
             raise RuntimeError("Personality rewrite step returned empty response")
         return personality_rewrite
         
-    async def create_response(self) -> Response:
-        MAIN_CLIENT_NAME = "PERSONALITY"
-        knowledge: str | None = None
-        old_memories: str | None = None
-        attachment_description: str | None = None
-        user_query: str | None = self.initial_message.content
-        memory_snapshot = await self._get_usable_message_history_before(self.initial_message)
+    def _stage_timeout(self, name: str) -> float:
+        options = self.bot_data.profile.options
+        return options.stage_timeouts.get(name, options.default_stage_timeout)
 
-        # View image
-        if self.bot_data.profile.options.enable_image_viewing:
-            attachment_description = await self._describe_image_if_present(self.initial_message, user_query)
-            self.logger.verbose(attachment_description or "None", category="ATTACHMENT DESCRIPTION")
+    async def _user_query_stage(self, memory_snapshot: MessageSnapshotHistory, rephrase: bool) -> str:
+        if not rephrase:
+            return self._query_text()
+        return await self._rephrase_user_query(memory_snapshot)
+
+    async def _attachment_description_stage(self) -> str | None:
+        attachment_description = await self._describe_image_if_present(self.initial_message, self.initial_message.content)
+        self.logger.verbose(attachment_description or "None", category="ATTACHMENT DESCRIPTION")
+        return attachment_description
+
+    async def _query_embedding_stage(self, user_query: str) -> list[float]:
+        # Embedded once, then shared by the knowledge search, memory search and response cache
+        return await self.bot_data.knowledge.embed(user_query)
+
+    async def _knowledge_stage(self, user_query: str, query_embedding: list[float] | None) -> str:
+        knowledge = await self._select_relevant_info(user_query, query_embedding)
+        self.logger.verbose(knowledge, category="INFO FROM KNOWLEDGE DB")
+        return knowledge
+
+    async def _old_memories_stage(self, user_query: str, query_embedding: list[float] | None) -> list[str]:
+        old_memories = await self._get_old_memories(query_embedding if query_embedding is not None else user_query)
+        self.logger.verbose("\n".join(old_memories), category="RETRIEVED MEMORIES")
+        return old_memories
 
-        # Retrieve knowlege
-        if self.bot_data.profile.options.enable_knowledge_retrieval:
-            user_query = await self._rephrase_user_query()
-            knowledge = await self._select_relevant_info(user_query)
-            self.logger.verbose(knowledge, category="INFO FROM KNOWLEDGE DB")
+    def _cache_scope(self) -> int:
+        message = self.initial_message
+        if self.bot_data.profile.options.response_cache.scope == "guild" and message.guild is not None:
+            return message.guild.id
+        return message.channel.id
 
-        # Retrieve memories
-        if self.bot_data.profile.options.enable_long_term_memory:
-            old_memories = await self._get_old_memories_as_text(user_query)
-            self.logger.verbose(old_memories, category="RETRIEVED MEMORIES")
+    async def _cached_response_stage(self, query_embedding: list[float] | None) -> SemanticResponseCache.Lookup | None:
+        if self.bot_data.response_cache is None or query_embedding is None:
+            return None
+        lookup = self.bot_data.response_cache.lookup(self._cache_scope(), query_embedding)
+        if lookup.hit is not None:
+            self.logger.verbose(f"Similarity {lookup.similarity:.3f} with '{lookup.hit.query}'", category="RESPONSE CACHE HIT")
+        return lookup
 
+    def _should_retrieve(self) -> bool:
+        gate = self.bot_data.retrieval_gate
+        if gate is None:
+            return True
+        decision = gate.check(self._query_text())
+        self.logger.verbose(f"{'Retrieving' if decision.retrieve else 'Skipping retrieval'} ({decision.reason}). {gate.stats()}", category="RETRIEVAL GATE")
+        return decision.retrieve
+
+    def _build_stage_graph(self, retrieve: bool) -> StageGraph:
+        options = self.bot_data.profile.options
+        use_knowledge = options.enable_knowledge_retrieval and retrieve
+        use_memories = options.enable_long_term_memory and retrieve
+        graph = StageGraph(self.logger)
+
+        async def history_stage():
+            return await self._get_usable_message_history_before(self.initial_message)
+
+        async def user_query_stage(memory_snapshot: MessageSnapshotHistory) -> str:
+            return await self._user_query_stage(memory_snapshot, use_knowledge)
+
+        graph.add("memory_snapshot", history_stage)
+        # Falls back to the raw message if the rephrase is too slow
+        graph.add(
+            "user_query",
+            user_query_stage,
+            depends_on=["memory_snapshot"],
+            timeout=self._stage_timeout("user_query"),
+            timeout_default=self._query_text()
+        )
+        # Answers to images depend on the image, not just the question, and batched pings ask several things at once
+        use_response_cache = self.bot_data.response_cache is not None and not self.initial_message.attachments and not self.earlier_messages
+        if use_knowledge or use_memories or use_response_cache:
+            # Searches embed the query themselves if this times out
+            graph.add(
+                "query_embedding",
+                self._query_embedding_stage,
+                depends_on=["user_query"],
+                timeout=self._stage_timeout("query_embedding"),
+                timeout_default=None
+            )
+        if use_response_cache:
+            graph.add(
+                "cached_response",
+                self._cached_response_stage,
+                depends_on=["query_embedding"],
+                timeout=self._stage_timeout("cached_response"),
+                timeout_default=None
+            )
+        if options.enable_image_viewing:
+            graph.add(
+                "attachment_description",
+                self._attachment_description_stage,
+                timeout=self._stage_timeout("attachment_description"),
+                timeout_default=None
+            )
+        if use_knowledge:
+            graph.add(
+                "knowledge",
+                self._knowledge_stage,
+                depends_on=["user_query", "query_embedding"],
+                timeout=self._stage_timeout("knowledge"),
+                timeout_default=None
+            )
+        if use_memories:
+            graph.add(
+                "old_memories",
+                self._old_memories_stage,
+                depends_on=["user_query", "query_embedding"],
+                timeout=self._stage_timeout("old_memories"),
+                timeout_default=None
+            )
+        return graph
+
+    def _replace_undesirable_text(self, text: str) -> str:
+        # Random replacements are picked once so that streamed partial texts stay consistent
+        if self._chosen_replacements is None:
+            self._chosen_replacements = {}
+            for target, replacement_obj in self.bot_data.profile.regex_replacements.items():
+                if isinstance(replacement_obj, list):
+                    self._chosen_replacements[target] = random.choice(replacement_obj)
+                else:
+                    self._chosen_replacements[target] = replacement_obj
+        for target, replacement in self._chosen_replacements.items():
+            text = re.sub(target, replacement, text)
+        return text
+
+    def _log_usage(self, usage: Any):
+        self.logger.verbose(
+            f"{usage.prompt_tokens} prompt tokens ({TokenUsageStats.cached_tokens(usage)} cached), {usage.completion_tokens} completion tokens",
+            category="TOKEN USAGE"
+        )
+
+    async def _send_main_request(
+            self,
+            *,
+            prompt: Prompt,
+            params: LLMRequestParams,
+            on_partial: Callable[[str], None] | None,
+            claim: Callable[[], bool]
+        ) -> str:
+        client = self.clients["PERSONALITY"]
+        self.logger.verbose(f"Sending request to model name '{params.model_name}' with parameters {params.model_dump_json()}", category="REQUEST")
+        start = time.perf_counter()
+        first_token_recorded = False
+        try:
+            if on_partial is None:
+                raw_response = await client.send_request(prompt=prompt, params=params, on_usage=self._log_usage)
+                LatencyTracker.instance().record(params.model_name, time.perf_counter() - start)
+                first_token_recorded = True
+                self.logger.verbose(f"{raw_response}", category="FULL RESPONSE")
+                if raw_response.message.content is None:
+                    raise RuntimeError(f"Model '{params.model_name}' returned an empty response")
+                claim()
+                return raw_response.message.content
+
+            streamed_text = ""
+            async for token in client.stream_request(prompt=prompt, params=params, on_usage=self._log_usage):
+                if not streamed_text:
+                    LatencyTracker.instance().record(params.model_name, time.perf_counter() - start)
+                    first_token_recorded = True
+                    if not claim():
+                        # Another model started answering first
+                        return ""
+                streamed_text += token
+                on_partial(self._replace_undesirable_text(streamed_text))
+            if not streamed_text:
+                raise RuntimeError(f"Model '{params.model_name}' returned an empty response")
+            self.logger.verbose(streamed_text, category="FULL RESPONSE")
+            return streamed_text
+        except asyncio.CancelledError:
+            self.logger.verbose(f"Request to LLM '{params.model_name}' was cancelled", category="HEDGE")
+            raise
+        except Exception as e:
+            # Failures and timeouts count too, or a model that keeps timing out would look fast to the hedge delay.
+            # Cancelled hedges are left out, they only say the model was slower than the winner
+            if not first_token_recorded:
+                LatencyTracker.instance().record(params.model_name, time.perf_counter() - start)
+            self.logger.verbose(f"Request to LLM '{params.model_name}' failed with error: {e}", category="MODEL FAILURE")
+            logging.exception(e)
+            raise
+
+    def _healthy_models(self, model_names: list[str]) -> list[str]:
+        client = self.clients["PERSONALITY"]
+        healthy = []
+        for name in model_names:
+            breaker = client.circuit_breaker(name)
+            if breaker.is_available():
+                healthy.append(name)
+            else:
+                self.logger.verbose(f"Skipping model '{name}', its circuit is {breaker.state.value}", category="CIRCUIT OPEN")
+        if not healthy:
+            raise RuntimeError("Cannot generate response, every model is currently unavailable")
+        return healthy
+
+    def _hedge_delay(self, model_name: str) -> float | None:
+        hedging = self.bot_data.profile.options.hedging
+        if not hedging.enabled:
+            return None
+        delay = LatencyTracker.instance().percentile(model_name, hedging.percentile, min_samples=hedging.min_samples)
+        if delay is None:
+            delay = hedging.default_delay_seconds
+        return min(max(delay, hedging.min_delay_seconds), hedging.max_delay_seconds)
+
+    async def _generate_main_response(
+            self,
+            *,
+            memory_snapshot: MessageSnapshotHistory,
+            attachment_description: str | None,
+            knowledge: str | None,
+            old_memories: list[str] | None,
+            on_partial: Callable[[str], None] | None
+        ) -> str:
+        MAIN_CLIENT_NAME = "PERSONALITY"
         # Build full prompt from info
         full_prompt = await self._build_full_prompt(
             memory_snapshot=memory_snapshot,
-            user_nick=self.initial_message.author.display_name,
+            user_nick=self._user_nicks(),
             attachment_description=attachment_description,
             relevant_info=knowledge,
             old_memories=old_memories
@@ -132,42 +371,66 @@ class AIDiscordBotResponder:
 
         # Formulate responses w/ full prompt
         main_client_params = self.bot_data.profile.request_params[MAIN_CLIENT_NAME]
-        model_names_order = [main_client_params.model_name] + self.bot_data.profile.options.llm_fallbacks
-        llm_response = None
-        for name in model_names_order:
-            modified_params = main_client_params.model_copy(deep=True)
-            modified_params = LLMRequestParams(
+        model_names_order = self._healthy_models([main_client_params.model_name] + self.bot_data.profile.options.llm_fallbacks)
+
+        def make_attempt(name: str):
+            params = LLMRequestParams(
                 model_name=name,
                 temperature=main_client_params.temperature,
                 max_tokens=main_client_params.max_tokens,
                 logit_bias=main_client_params.logit_bias
             )
-            self.logger.verbose(f"Sending request to model name '{name}' with parameters {modified_params.model_dump_json()}", category="REQUEST")
-            try:
-                raw_response = await self.clients[MAIN_CLIENT_NAME].send_request(
-                    prompt=full_prompt,
-                    params=modified_params
-                )
-                llm_response = raw_response.message.content
-                self.logger.verbose(f"{raw_response}", category="FULL RESPONSE")
-                break
-            except Exception as e:
-                self.logger.verbose(f"Request to LLM '{name}' failed with error: {e}", category="MODEL FAILURE")
-                logging.exception(e)
-        if llm_response is None:
-            raise RuntimeError("Cannot generate response and all fallbacks failed")
-        
+            return lambda claim: self._send_main_request(prompt=full_prompt, params=params, on_partial=on_partial, claim=claim)
+
+        self.logger.verbose(f"{ClientRegistry.instance().scheduler_stats()}", category="SCHEDULER")
+        # Without hedging, a fallback only starts once the previous model failed
+        hedge_delays = [self._hedge_delay(name) for name in model_names_order]
+        self.logger.verbose(f"Hedge delays: {dict(zip(model_names_order, hedge_delays))}", category="HEDGE")
+        race: HedgedRace[str] = HedgedRace([make_attempt(name) for name in model_names_order], hedge_delays)
+        try:
+            winner, llm_response = await race.run()
+        except RuntimeError as e:
+            raise RuntimeError("Cannot generate response and all fallbacks failed") from e
+        self.logger.verbose(f"Response from model '{model_names_order[winner]}'", category="HEDGE")
+        return llm_response
+
+    async def create_response(self, *, on_partial: Callable[[str], None] | None = None) -> Response:
+        options = self.bot_data.profile.options
+        # Partial output can only be shown if nothing rewrites the response afterwards
+        if not options.enable_response_streaming or options.enable_personality_rewrite:
+            on_partial = None
+
+        # Image description, query rephrase, knowledge and memory lookups run concurrently where independent
+        retrieve = self._should_retrieve()
+        stage_results = await self._build_stage_graph(retrieve).run()
+        memory_snapshot: MessageSnapshotHistory = stage_results["memory_snapshot"]
+        attachment_description: str | None = stage_results.get("attachment_description")
+        knowledge: str | None = stage_results.get("knowledge")
+        old_memories: list[str] | None = stage_results.get("old_memories")
+        if retrieve and self.bot_data.retrieval_gate is not None:
+            self.bot_data.retrieval_gate.record_outcome(bool(knowledge) or bool(old_memories))
+        cache_lookup: SemanticResponseCache.Lookup | None = stage_results.get("cached_response")
+
+        if cache_lookup is not None and cache_lookup.hit is not None:
+            llm_response = cache_lookup.hit.response
+        else:
+            llm_response = await self._generate_main_response(
+                memory_snapshot=memory_snapshot,
+                attachment_description=attachment_description,
+                knowledge=knowledge,
+                old_memories=old_memories,
+                on_partial=on_partial
+            )
+            if cache_lookup is not None and self.bot_data.response_cache is not None:
+                # The raw answer is cached, so replies served from the cache are still rewritten below
+                self.bot_data.response_cache.store(self._cache_scope(), stage_results["user_query"], cache_lookup.vector, llm_response)
+
         # Rewrite in-character
         if self.bot_data.profile.options.enable_personality_rewrite:
             llm_response = await self._personality_rewrite(llm_response)
         
         # Replace undesirable text
-        for target, replacement_obj in self.bot_data.profile.regex_replacements.items():
-            if isinstance(replacement_obj, list):
-                replacement = random.choice(replacement_obj)
-            else:
-                replacement = replacement_obj
-            llm_response = re.sub(target, replacement, llm_response)
+        llm_response = self._replace_undesirable_text(llm_response)
         self.logger.verbose(f"Sanitized text, result: {llm_response}", category="REGEX REPLACEMENT")
 
         return AIDiscordBotResponder.Response(
@@ -184,25 +447,65 @@ class AIDiscordBotResponder:
             user_nick: str,
             attachment_description: str | None,
             relevant_info: str | None,
-            old_memories: str | None
+            old_memories: list[str] | None
         ) -> Prompt:
         NAME = "PERSONALITY"
         full_prompt: Prompt = self.bot_data.profile.get_prompt(NAME)
+        history_summary = None
+        if self.bot_data.conversation_summarizer is not None:
+            history_summary = self.bot_data.conversation_summarizer.summary_for(self.initial_message.channel.id)
+            self.logger.verbose(history_summary or "None yet", category="HISTORY SUMMARY")
+
+        budget_config = self.bot_data.profile.options.prompt_budget
+        if budget_config.enabled:
+            budget = PromptBudget(
+                max_prompt_tokens=budget_config.max_prompt_tokens,
+                knowledge_tokens=budget_config.knowledge_tokens,
+                memories_tokens=budget_config.memories_tokens,
+                min_history_messages=budget_config.min_history_messages
+            )
+        else:
+            budget = PromptBudget.unlimited()
+        allocation = budget.allocate(
+            base_prompt=full_prompt,
+            history=memory_snapshot.as_list(),
+            knowledge=relevant_info,
+            memories=old_memories or [],
+            extra_text="\n".join(text for text in (attachment_description, history_summary) if text)
+        )
+        self.logger.verbose(allocation.describe(), category="PROMPT TOKENS")
 
-        for memorized_message in memory_snapshot.as_list():
+        if history_summary is not None and self.bot_data.profile.options.volatile_context_placement == "inline":
+            full_prompt = full_prompt.plus(Prompt.system_msg(f"SUMMARY OF THE EARLIER CONVERSATION:\n{history_summary}"))
+        for memorized_message in allocation.history:
             if memorized_message.is_bot:
                 full_prompt = full_prompt.plus(Prompt.assistant_msg(memorized_message.text))
             else:
                 full_prompt = full_prompt.plus(Prompt.user_msg(memorized_message.text))
-        
-        if self.bot_data.profile.options.enable_image_viewing:
-            full_prompt = full_prompt.plus(Prompt.system_msg(f"(I've viewed the image by user_nick. Description: {attachment_description})"))
 
         now_str = datetime.datetime.now().strftime("%B %d, %H:%M:%S")
-
-        return full_prompt.replace({
+        volatile_values = {
             "now": now_str,
             "nick": user_nick or "",
-            "knowledge": relevant_info or "",
-            "old_memories": old_memories or ""
-        })
\ No newline at end of file
+            "knowledge": allocation.knowledge or "",
+            "old_memories": "\n".join(allocation.memories)
+        }
+
+        if self.bot_data.profile.options.volatile_context_placement == "trailing":
+            # Keep the persona prefix byte-identical between requests so provider-side prompt caching can hit
+            full_prompt = full_prompt.replace({
+                placeholder: VOLATILE_CONTEXT_POINTER for placeholder in volatile_values
+            })
+            context = f"CONTEXT FOR THIS REPLY:\nIt is now {now_str}\nYou are replying to: {volatile_values['nick']}\n" \
+                f"VECTOR DATABASE KNOWLEDGE, IF ANY:\n{volatile_values['knowledge']}\n" \
+                f"OLD MEMORIES, IF ANY:\n{volatile_values['old_memories']}"
+            if history_summary is not None:
+                context += f"\nSUMMARY OF THE EARLIER CONVERSATION:\n{history_summary}"
+            if self.bot_data.profile.options.enable_image_viewing:
+                context += f"\n(I've viewed the image by user_nick. Description: {attachment_description})"
+            return full_prompt.plus(Prompt.system_msg(context))
+
+        if self.bot_data.profile.options.enable_image_viewing:
+            full_prompt = full_prompt.plus(Prompt.system_msg(f"(I've viewed the image by user_nick. Description: {attachment_description})"))
+
+        return full_prompt.replace(volatile_values)
@@ -1,5 +1,7 @@
+import time
 import asyncio
 from abc import ABC
+from collections import OrderedDict
 from core.bot_workflow.message_snapshot import MessageSnapshot
 
 class MessageSnapshotHistory:
@@ -47,10 +49,11 @@ class MessageSnapshotHistory:
         return ret
 
 class SynchronizedMessageHistory:
-    def __init__(self, history: MessageSnapshotHistory = MessageSnapshotHistory()):
-        self.backing_history = history
+    def __init__(self, history: MessageSnapshotHistory | None = None):
+        self.backing_history = history if history is not None else MessageSnapshotHistory()
         self._pending_message_ids: set[int] = set()
         self._lock = asyncio.Lock()
+        self.last_used = time.monotonic()
 
     async def add(self, message: MessageSnapshot, *, pending=False):
         async with self._lock:
@@ -74,6 +77,9 @@ class SynchronizedMessageHistory:
     def is_pending(self, message_id: int) -> bool:
         return message_id in self._pending_message_ids
 
+    def has_pending(self) -> bool:
+        return len(self._pending_message_ids) > 0
+
     async def get_finalized_message_history(self) -> MessageSnapshotHistory:
         ret_msgs = []
 
@@ -92,6 +98,47 @@ class SynchronizedMessageHistory:
             ret += f"{pending_str}[ID {id} | {msg.sent}] <{msg.nick}{bot_str}> {msg.text}\n"
         return ret
         
+class ChannelHistoryStore:
+    def __init__(self, *, memory_length: int, max_channels: int, idle_seconds: float):
+        self.memory_length = memory_length
+        self.max_channels = max_channels
+        self.idle_seconds = idle_seconds
+        self._shards: OrderedDict[int, SynchronizedMessageHistory] = OrderedDict()
+
+    def for_channel(self, channel_id: int) -> SynchronizedMessageHistory:
+        now = time.monotonic()
+        shard = self._shards.get(channel_id)
+        if shard is None:
+            shard = SynchronizedMessageHistory(MessageSnapshotHistory(memory_length=self.memory_length))
+            self._shards[channel_id] = shard
+        else:
+            self._shards.move_to_end(channel_id)
+        shard.last_used = now
+        self._evict(now, keep=channel_id)
+        return shard
+
+    def _evict(self, now: float, *, keep: int):
+        # Least recently used channels are at the front of the dict
+        for _ in range(len(self._shards)):
+            channel_id, shard = next(iter(self._shards.items()))
+            if channel_id == keep:
+                break
+            over_capacity = len(self._shards) > self.max_channels
+            idle = now - shard.last_used > self.idle_seconds
+            if not over_capacity and not idle:
+                break
+            if shard.has_pending():
+                # A response is still being generated for this channel
+                self._shards.move_to_end(channel_id)
+                continue
+            del self._shards[channel_id]
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self._shards
+
+    def __len__(self) -> int:
+        return len(self._shards)
+
 class AIBotData(ABC):
     def __init__(self, name: str, recent_memory: MessageSnapshotHistory | None = None):
         self.name = name
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+
+from dataclasses import dataclass, field
+from collections import OrderedDict
+from core.ai_apis.client import LLMClient
+from core.ai_apis.api_types import LLMRequestParams, Prompt
+from core.ai_apis.scheduler import Priority, request_scope
+from core.bot_workflow.message_snapshot import MessageSnapshot
+from core.util.tokens import truncate_to_tokens
+
+# Folds messages that fell out of the history window into a running summary per channel, in the background
+class ConversationSummarizer:
+    @dataclass
+    class ChannelState:
+        summary: str = ""
+        # Snowflake of the newest summarized message, snowflakes grow over time
+        watermark: int = 0
+        backlog: list[MessageSnapshot] = field(default_factory=list)
+        scheduled: bool = False
+
+    def __init__(
+            self,
+            client: LLMClient,
+            params: LLMRequestParams,
+            prompt: Prompt,
+            *,
+            min_batch: int = 6,
+            max_backlog: int = 40,
+            max_summary_tokens: int = 300,
+            max_channels: int = 2000
+        ):
+        self.client = client
+        self.params = params
+        self.prompt = prompt
+        self.min_batch = min_batch
+        self.max_backlog = max_backlog
+        self.max_summary_tokens = max_summary_tokens
+        self.max_channels = max_channels
+        self._channels: OrderedDict[int, ConversationSummarizer.ChannelState] = OrderedDict()
+        self._queue: asyncio.Queue[int] = asyncio.Queue()
+        self._worker: asyncio.Task | None = None
+        self.summarized_count = 0
+        self.failed_count = 0
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    def _state(self, channel_id: int) -> ChannelState:
+        state = self._channels.get(channel_id)
+        if state is None:
+            state = ConversationSummarizer.ChannelState()
+            self._channels[channel_id] = state
+            while len(self._channels) > self.max_channels:
+                self._channels.popitem(last=False)
+        else:
+            self._channels.move_to_end(channel_id)
+        return state
+
+    def note_history(self, channel_id: int, history: list[MessageSnapshot], window: int):
+        state = self._state(channel_id)
+        queued_ids = {message.message_id for message in state.backlog}
+        state.backlog.extend(
+            message for message in history[:-window]
+            if message.message_id > state.watermark and message.message_id not in queued_ids
+        )
+        if len(state.backlog) > self.max_backlog:
+            # Only if summaries keep failing, the oldest messages are given up on
+            state.backlog = state.backlog[-self.max_backlog:]
+        if len(state.backlog) >= self.min_batch and not state.scheduled:
+            state.scheduled = True
+            self._queue.put_nowait(channel_id)
+
+    def summary_for(self, channel_id: int) -> str | None:
+        state = self._channels.get(channel_id)
+        if state is None or not state.summary:
+            return None
+        return state.summary
+
+    async def _summarize(self, state: ChannelState, messages: list[MessageSnapshot]) -> str:
+        new_messages = "\n".join(
+            f"<{message.nick}{' (BOT)' if message.is_bot else ''}> {message.text}" for message in messages
+        )
+        prompt = self.prompt.model_copy(deep=True).replace({
+            "previous_summary": state.summary or "(none yet)",
+            "new_messages": new_messages
+        })
+        response = await self.client.send_request(prompt=prompt, params=self.params)
+        if response.message.content is None:
+            raise RuntimeError("History summary model returned an empty response")
+        return truncate_to_tokens(response.message.content.strip(), self.max_summary_tokens)
+
+    async def _run(self):
+        while True:
+            channel_id = await self._queue.get()
+            state = self._channels.get(channel_id)
+            try:
+                if state is None:
+                    continue
+                messages = list(state.backlog)
+                # Replies to users go first
+                with request_scope(priority=Priority.BACKGROUND):
+                    state.summary = await self._summarize(state, messages)
+                state.watermark = max(message.message_id for message in messages)
+                state.backlog = [message for message in state.backlog if message.message_id > state.watermark]
+                self.summarized_count += len(messages)
+            except Exception as e:
+                self.failed_count += 1
+                logging.error(f"Failed to summarize {len(state.backlog) if state else 0} messages of channel {channel_id}: {e}")
+            finally:
+                if state is not None:
+                    state.scheduled = False
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "channels": len(self._channels),
+            "summarized_messages": self.summarized_count,
+            "failed_batches": self.failed_count,
+            "queued_channels": self._queue.qsize()
+        }
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
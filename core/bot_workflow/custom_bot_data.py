@@ -1,7 +1,11 @@
 from core.ai_apis import providers
 from core.bot_workflow.profile_loader import Profile
 from core.bot_workflow.knowledge import KnowledgeIndex, LongTermMemoryIndex
-from core.bot_workflow.bot_types import MessageSnapshotHistory, SynchronizedMessageHistory, AIBotData
+from core.bot_workflow.memory_ingestion import MemoryIngestionQueue
+from core.bot_workflow.response_cache import SemanticResponseCache
+from core.bot_workflow.retrieval_gate import RetrievalGate
+from core.bot_workflow.conversation_summary import ConversationSummarizer
+from core.bot_workflow.bot_types import MessageSnapshotHistory, ChannelHistoryStore, AIBotData
 
 class CustomBotData(AIBotData):
     def __init__(self,
@@ -11,6 +15,10 @@ class CustomBotData(AIBotData):
                  provider_store: providers.ProviderDataStore,
                  knowledge: KnowledgeIndex,
                  long_term_memory: LongTermMemoryIndex | None,
+                 memory_ingestion: MemoryIngestionQueue | None,
+                 response_cache: SemanticResponseCache | None,
+                 retrieval_gate: RetrievalGate | None,
+                 conversation_summarizer: ConversationSummarizer | None,
                  discord_bot_id: int,
                  memory_length: int
                 ):
@@ -19,7 +27,15 @@ class CustomBotData(AIBotData):
         self.provider_store = provider_store
         self.discord_bot_id = discord_bot_id
         self.long_term_memory = long_term_memory
-        self.recent_history = SynchronizedMessageHistory()
+        self.memory_ingestion = memory_ingestion
+        self.response_cache = response_cache
+        self.retrieval_gate = retrieval_gate
+        self.conversation_summarizer = conversation_summarizer
+        self.recent_history = ChannelHistoryStore(
+            memory_length=memory_length,
+            max_channels=profile.options.max_tracked_channels,
+            idle_seconds=profile.options.channel_history_idle_seconds
+        )
         self.knowledge = knowledge 
         self.RECENT_MEMORY_LENGTH = profile.options.recent_message_history_length
     
\ No newline at end of file
@@ -4,12 +4,16 @@ import discord
 import traceback
 
 from io import StringIO
+from typing import Callable
 from discord.ext import commands
 from core.util.rate_limits import RateLimiter, RateLimit
+from core.ai_apis.scheduler import Priority, request_scope
+from core.bot_workflow.streamed_reply import StreamedReply
 from core.bot_workflow.message_snapshot import MessageSnapshot
+from core.bot_workflow.request_coalescer import ChannelCoalescer
 from core.bot_workflow.ai_bot import CustomBotData, AIDiscordBotResponder
 from core.bot_workflow.response_logs import ResponseLogsManager, SimpleDebugLogger
-from core.bot_workflow.discord_message_parser import DiscordMessageParser, DenialReason, SpecialFunctionFlags
+from core.bot_workflow.discord_message_parser import DiscordMessageParser, DenialReason, SpecialFunctionFlags, UserMessageContext
 
 MSG_LOG_FILE_REPLY = "Verbose logs for message ID {} attached (only last 10 are stored)"
 
@@ -26,6 +30,10 @@ class DiscordChatHandler(commands.Cog):
         self.message_parser = DiscordMessageParser(self.bot)
         self.ai_bot = ai_bot_data
         self.logger = SimpleDebugLogger("ChatHandlerLogger")
+        coalescing = ai_bot_data.profile.options.request_coalescing
+        self.coalescer: ChannelCoalescer[tuple[discord.Message, bool]] | None = None
+        if coalescing.enabled:
+            self.coalescer = ChannelCoalescer(window_seconds=coalescing.window_ms / 1000, max_batch=coalescing.max_batch)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message) -> None:
@@ -43,14 +51,13 @@ class DiscordChatHandler(commands.Cog):
                 await message.add_reaction(emoji)
             return
         if SpecialFunctionFlags.VIEW_MESSAGE_LOGS in ctx.called_functions:
-            await self.handle_log_request(message)
+            await self.handle_log_request(message, ctx)
             return
         
         verbose = SpecialFunctionFlags.REQUEST_VERBOSE_REPLY in ctx.called_functions
         await self.respond_with_llm(message, verbose=verbose)
 
-    async def handle_log_request(self, message: discord.Message):
-        ctx = self.message_parser.parse_message(message)
+    async def handle_log_request(self, message: discord.Message, ctx: UserMessageContext):
         try:
             num = None
             for num_str in ctx.sanitized_content.split(" "):
@@ -77,16 +84,49 @@ class DiscordChatHandler(commands.Cog):
 
     async def respond_with_llm(self, user_message: discord.Message, *, verbose: bool=False):
         await self.memorize_discord_message(user_message, pending=True, add_after_id=None)
+        if self.coalescer is None:
+            await self.respond_to_batch([user_message], verbose=verbose)
+            return
+
+        async with self.coalescer.batch(user_message.channel.id, (user_message, verbose)) as batch:
+            if batch is None:
+                # Answered by the reply to an earlier ping in this channel
+                return
+            await self.respond_to_batch(
+                [message for message, _ in batch],
+                verbose=any(message_verbose for _, message_verbose in batch)
+            )
 
+    async def respond_to_batch(self, user_messages: list[discord.Message], *, verbose: bool=False):
+        # The reply goes to the latest ping, the earlier ones are part of its context
+        user_message = user_messages[-1]
+        earlier_messages = user_messages[:-1]
         typing_msg = await user_message.reply(
             self.ai_bot.profile.lang["bot_typing"], 
             mention_author=False,
         )
         
+        options = self.ai_bot.profile.options
+        streamed_reply: StreamedReply | None = None
+        # Streamed edits never ping, so only stream when no ping is expected at the end
+        if options.enable_response_streaming and not options.only_ping_on_response_finish:
+            streamed_reply = StreamedReply(
+                typing_msg,
+                chunker=self._chunk_response,
+                min_edit_interval=options.stream_edit_interval_seconds
+            )
+
         try:
-            resp = await self.generate_response(user_message, verbose)
+            resp = await self.generate_response(
+                user_message,
+                verbose,
+                on_partial=streamed_reply.update if streamed_reply is not None else None,
+                earlier_messages=earlier_messages
+            )
 
-            if self.ai_bot.profile.options.only_ping_on_response_finish:
+            if streamed_reply is not None and streamed_reply.started:
+                base_resp_msg: discord.Message = await streamed_reply.finish(resp.text)
+            elif self.ai_bot.profile.options.only_ping_on_response_finish:
                 base_resp_msg: discord.Message = await self.send_chunked_with_disclaimers(
                     resp.text,
                     reply_to=user_message,
@@ -113,19 +153,40 @@ class DiscordChatHandler(commands.Cog):
                     nick=base_resp_msg.author.name,
                     sent=base_resp_msg.created_at,
                     is_bot=True,
-                    message_id=base_resp_msg.id 
+                    message_id=base_resp_msg.id,
+                    channel_id=base_resp_msg.channel.id,
+                    guild_id=base_resp_msg.guild.id if base_resp_msg.guild is not None else None,
+                    author_id=base_resp_msg.author.id
                 ),
                 pending=False,
                 add_after_id=user_message.id
             )
-            await self.ai_bot.recent_history.mark_finalized(user_message.id)
+            channel_history = self.ai_bot.recent_history.for_channel(user_message.channel.id)
+            for answered_message in user_messages:
+                await channel_history.mark_finalized(answered_message.id)
             ResponseLogsManager.instance().store_log(base_resp_msg.id, resp.verbose_log_output)
         except Exception as e:
+            if streamed_reply is not None:
+                await streamed_reply.close()
             await self.handle_error(user_message, e)
 
-    async def generate_response(self, to_respond: discord.Message, verbose: bool) -> AIDiscordBotResponder.Response:
-        resp = AIDiscordBotResponder(self.ai_bot, to_respond, verbose)
-        return await resp.create_response()
+    async def generate_response(
+            self, 
+            to_respond: discord.Message, 
+            verbose: bool, 
+            *, 
+            on_partial: Callable[[str], None] | None = None,
+            earlier_messages: list[discord.Message] | None = None
+        ) -> AIDiscordBotResponder.Response:
+        resp = AIDiscordBotResponder(self.ai_bot, to_respond, verbose, earlier_messages=earlier_messages)
+        if earlier_messages and self.coalescer is not None:
+            resp.logger.verbose(
+                f"Answering {len(earlier_messages) + 1} pings at once: {[message.id for message in earlier_messages]} and {to_respond.id}. {self.coalescer.stats()}",
+                category="COALESCED"
+            )
+        # Lets the request schedulers share provider capacity fairly between servers
+        with request_scope(guild_id=to_respond.guild.id if to_respond.guild else None, priority=Priority.INTERACTIVE):
+            return await resp.create_response(on_partial=on_partial)
 
     def _chunk_by_length_and_spaces(self, full_text: str, max_chunk_length: int) -> list[str]:
         chunks: list[str] = []
@@ -186,16 +247,18 @@ class DiscordChatHandler(commands.Cog):
 
         return balanced
 
-    async def send_chunked_with_disclaimers(self, resp_str: str, *, reply_to: discord.Message | None, edit_msg: discord.Message | None, ping: bool) -> discord.Message:
+    def _chunk_response(self, resp_str: str) -> list[str]:
         disclaimer = self.ai_bot.profile.lang.get("disclaimer", "")
         max_chunk_length = 1800 - len(disclaimer)
+        return self._chunk_by_length_and_spaces(resp_str, max_chunk_length)
 
+    async def send_chunked_with_disclaimers(self, resp_str: str, *, reply_to: discord.Message | None, edit_msg: discord.Message | None, ping: bool) -> discord.Message:
         if reply_to is not None and edit_msg is not None:
             raise ValueError("Must specify one of reply_to or edit_msg, not both")
         def strip_newline(chunk):
             return chunk.strip('\r\n') if self.ai_bot.profile.options.remove_trailing_newline else chunk
 
-        raw_chunks = self._chunk_by_length_and_spaces(resp_str, max_chunk_length)
+        raw_chunks = self._chunk_response(resp_str)
         '''
         code_balanced_chunks = [
             f"{strip_newline(chunk)}{disclaimer}" 
@@ -222,19 +285,20 @@ class DiscordChatHandler(commands.Cog):
         return last_msg
     
     async def memorize_message(self, message: MessageSnapshot, *, pending: bool, add_after_id: None | int) -> None:
+        channel_history = self.ai_bot.recent_history.for_channel(message.channel_id)
         if add_after_id is None:
-            await self.ai_bot.recent_history.add(
+            await channel_history.add(
                 message,
                 pending=pending
             )
         else:
-             await self.ai_bot.recent_history.add_after(
+             await channel_history.add_after(
                 add_after_id,
                 message,
                 pending=pending
             )
-        if self.ai_bot.long_term_memory is not None:
-            await self.ai_bot.long_term_memory.memorize(message)
+        if self.ai_bot.memory_ingestion is not None:
+            await self.ai_bot.memory_ingestion.enqueue(message)
         
     async def memorize_discord_message(self, message: discord.Message, *, pending: bool, add_after_id: None | int) -> None:
         to_memorize = await MessageSnapshot.of_discord_message(message)
@@ -243,8 +307,6 @@ class DiscordChatHandler(commands.Cog):
             pending=pending,
             add_after_id=add_after_id
         )
-        if self.ai_bot.long_term_memory is not None:
-            await self.ai_bot.long_term_memory.memorize(to_memorize)
 
     async def handle_error(self, reply_to: discord.Message, error: Exception):
         # TODO: implement message forgetting
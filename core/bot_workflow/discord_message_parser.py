@@ -24,9 +24,8 @@ class UserMessageContext:
 class DiscordMessageParser:
     def __init__(self, bot: commands.Bot):
         self.MAX_CHARACTERS = 1024
-        self.rate_limiter = RateLimiter()
         self.bot = bot
-        self.message = RateLimiter(
+        self.rate_limiter = RateLimiter(
             RateLimit(n_messages=3, seconds=10),
             RateLimit(n_messages=10, seconds=60),
             RateLimit(n_messages=35, seconds=5*60),
@@ -41,15 +40,15 @@ class DiscordMessageParser:
         denial_reason = None
         called_functions: list[SpecialFunctionFlags] = []
 
-        self.rate_limiter.register_request(message.author.id)
-
         if self.bot.user not in message.mentions:
             denied = True
             denial_reason = DenialReason.DID_NOT_PING
-
-        if self.rate_limiter.is_rate_limited(message.author.id):
-            denied = True
-            denial_reason = DenialReason.RATE_LIMITED
+        else:
+            # Only pings count towards the limit, so unrelated guild traffic isn't tracked
+            self.rate_limiter.register_request(message.author.id)
+            if self.rate_limiter.is_rate_limited(message.author.id):
+                denied = True
+                denial_reason = DenialReason.RATE_LIMITED
 
         if not denied and len(raw_content) > self.MAX_CHARACTERS:
              denied = True
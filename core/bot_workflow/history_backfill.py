@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import asyncio
+import contextlib
+import discord
+import logging
+
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable
+from core.ai_apis.scheduler import Priority, request_scope
+from core.bot_workflow.knowledge import LongTermMemoryIndex
+from core.bot_workflow.message_snapshot import MessageSnapshot
+
+# Memorizes channel history oldest first. The newest memorized message per channel is checkpointed,
+# so an interrupted backfill resumes there and later runs only pick up new messages
+class HistoryBackfill:
+    CHECKPOINT_PATH = os.path.join('brain_content', 'memories', 'backfill_checkpoint.json')
+
+    @dataclass
+    class Progress:
+        fetched: int = 0
+        embedded: int = 0
+        already_memorized: int = 0
+        finished_channels: int = 0
+        total_channels: int = 0
+        failed_channels: dict[int, str] = field(default_factory=dict)
+        started: float = field(default_factory=time.monotonic)
+
+        def describe(self) -> str:
+            elapsed = max(time.monotonic() - self.started, 1e-9)
+            failed = f", {len(self.failed_channels)} failed" if self.failed_channels else ""
+            return f"{self.finished_channels}/{self.total_channels} channels done{failed}. " \
+                f"{self.fetched} messages fetched ({self.fetched / elapsed:.1f}/s), " \
+                f"{self.embedded} embedded ({self.embedded / elapsed:.1f}/s), " \
+                f"{self.already_memorized} already memorized, {elapsed:.0f} s elapsed"
+
+    def __init__(
+            self,
+            long_term_memory: LongTermMemoryIndex,
+            *,
+            checkpoint_path: str | None = None,
+            batch_size: int = 100,
+            max_concurrent_channels: int = 2,
+            max_pending_batches: int = 2
+        ):
+        self.long_term_memory = long_term_memory
+        self.checkpoint_path = checkpoint_path or os.path.join(os.getcwd(), HistoryBackfill.CHECKPOINT_PATH)
+        self.batch_size = batch_size
+        self.max_pending_batches = max_pending_batches
+        # discord.py waits out rate limits by itself, this keeps the backfill from using all of them
+        self._channel_semaphore = asyncio.Semaphore(max_concurrent_channels)
+        self._checkpoints = self._load_checkpoints()
+
+    def _load_checkpoints(self) -> dict[int, int]:
+        if not os.path.exists(self.checkpoint_path):
+            return {}
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as file:
+                return {int(channel_id): message_id for channel_id, message_id in json.load(file).items()}
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Could not read backfill checkpoints '{self.checkpoint_path}': {e}. Starting over.")
+            return {}
+
+    def _save_checkpoints(self):
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({str(channel_id): message_id for channel_id, message_id in self._checkpoints.items()}, file)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    async def _batches(self, channel: discord.abc.Messageable, after_id: int | None, limit: int | None) -> AsyncIterator[list[MessageSnapshot]]:
+        batch: list[MessageSnapshot] = []
+        after = discord.Object(after_id) if after_id is not None else None
+        async for message in channel.history(limit=limit, after=after, oldest_first=True):
+            if not message.content:
+                continue
+            batch.append(await MessageSnapshot.of_discord_message(message))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def _memorize_batch(self, channel_id: int, batch: list[MessageSnapshot], progress: Progress):
+        known_ids = await self.long_term_memory.known_ids([message.message_id for message in batch])
+        new_messages = [message for message in batch if message.message_id not in known_ids]
+        progress.already_memorized += len(batch) - len(new_messages)
+        if new_messages:
+            progress.embedded += await self.long_term_memory.mass_memorize(new_messages)
+        self._checkpoints[channel_id] = batch[-1].message_id
+        self._save_checkpoints()
+
+    async def backfill_channel(
+            self,
+            channel: discord.abc.Messageable,
+            progress: Progress,
+            *,
+            limit: int | None = None,
+            on_progress: Callable[[Progress], Awaitable[None]] | None = None
+        ):
+        async with self._channel_semaphore:
+            channel_id = channel.id
+            # Fetching the next pages overlaps with embedding the current one, up to max_pending_batches ahead
+            pending: asyncio.Queue[list[MessageSnapshot] | None] = asyncio.Queue(maxsize=self.max_pending_batches)
+
+            async def fetch():
+                try:
+                    async for batch in self._batches(channel, self._checkpoints.get(channel_id), limit):
+                        progress.fetched += len(batch)
+                        await pending.put(batch)
+                    await pending.put(None)
+                except Exception:
+                    # Wakes the consumer up so it sees the error. Cancellation isn't an Exception, so a fetcher
+                    # cancelled because the consumer failed never waits here for a queue nobody drains
+                    await pending.put(None)
+                    raise
+
+            fetcher = asyncio.create_task(fetch())
+            try:
+                while (batch := await pending.get()) is not None:
+                    await self._memorize_batch(channel_id, batch, progress)
+                    if on_progress is not None:
+                        await on_progress(progress)
+                # Raises if paging failed
+                await fetcher
+            finally:
+                if not fetcher.done():
+                    fetcher.cancel()
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await fetcher
+
+    async def run(
+            self,
+            channels: list[discord.abc.Messageable],
+            *,
+            limit: int | None = None,
+            on_progress: Callable[[Progress], Awaitable[None]] | None = None
+        ) -> Progress:
+        # on_progress is awaited after every batch and every finished channel
+        progress = HistoryBackfill.Progress(total_channels=len(channels))
+
+        async def backfill(channel: discord.abc.Messageable):
+            try:
+                await self.backfill_channel(channel, progress, limit=limit, on_progress=on_progress)
+            except Exception as e:
+                progress.failed_channels[channel.id] = str(e)
+                logging.error(f"Backfill of channel {channel.id} failed: {e}")
+            progress.finished_channels += 1
+            if on_progress is not None:
+                await on_progress(progress)
+
+        # Embedding the backlog must not slow down replies
+        with request_scope(priority=Priority.BACKGROUND):
+            await asyncio.gather(*(backfill(channel) for channel in channels))
+        return progress
@@ -0,0 +1,56 @@
+import asyncio
+
+from typing import Any
+from core.bot_workflow.vector_backends import Hit
+
+class BM25Index:
+    def __init__(self):
+        self._scoring: Any = None
+        # txtai ids are positions in this list, so any chunk id type round trips
+        self._chunks: list[tuple[int, str, dict]] = []
+        self._lock = asyncio.Lock()
+
+    @property
+    def size(self) -> int:
+        return len(self._chunks)
+
+    # chunks are (chunk id, text, metadata)
+    async def rebuild(self, chunks: list[tuple[int, str, dict]]):
+        async with self._lock:
+            scoring = await asyncio.to_thread(BM25Index._build, chunks) if chunks else None
+            self._scoring = scoring
+            self._chunks = chunks
+
+    @staticmethod
+    def _build(chunks: list[tuple[int, str, dict]]) -> Any:
+        from txtai.scoring import ScoringFactory
+
+        scoring = ScoringFactory.create({"method": "bm25", "terms": True})
+        scoring.index((position, text, None) for position, (_, text, _) in enumerate(chunks))
+        return scoring
+
+    async def search(self, query: str, limit: int) -> list[Hit]:
+        scoring, chunks = self._scoring, self._chunks
+        if scoring is None or not query.strip():
+            return []
+        results = await asyncio.to_thread(scoring.search, query, limit)
+        hits = []
+        for position, score in results:
+            chunk_id, text, metadata = chunks[int(position)]
+            hits.append(Hit(id=chunk_id, distance=float(score), entity={"id": chunk_id, "metadata": metadata, "text": text}))
+        return hits
+
+# Sums 1 / (k + rank) over the rankings, the fused score is returned as the distance
+def reciprocal_rank_fusion(rankings: list[list[Hit]], limit: int, k: int = 60) -> list[Hit]:
+    scores: dict[int, float] = {}
+    first_seen: dict[int, Hit] = {}
+    vectors: dict[int, list[float]] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            scores[hit.id] = scores.get(hit.id, 0.0) + 1 / (k + rank)
+            first_seen.setdefault(hit.id, hit)
+            if hit.vector is not None:
+                vectors.setdefault(hit.id, hit.vector)
+
+    fused = sorted(scores, key=scores.__getitem__, reverse=True)[:limit]
+    return [Hit(id=hit_id, distance=scores[hit_id], entity=first_seen[hit_id].entity, vector=vectors.get(hit_id)) for hit_id in fused]
@@ -1,73 +1,143 @@
 import re
 import os
 import glob
+import json
 import numpy
 import asyncio
+import discord
 import hashlib
 import logging
 
 from core.ai_apis.providers import ProviderData
+from core.ai_apis.client_registry import ClientRegistry
+from core.bot_workflow.hybrid_search import BM25Index, reciprocal_rank_fusion
+from core.bot_workflow.profile_loader import KnowledgeRetrievalConfig, MemoryMaintenanceConfig, VectorStoreConfig
+from core.bot_workflow.memory_maintenance import MemoryAccessLog, MemoryMaintenance, is_low_information
+from core.bot_workflow.memory_scope_migration import MemoryScopeMigration
 from core.bot_workflow.message_snapshot import MessageSnapshot
+from core.bot_workflow.vector_backends import MetadataFilter
 from core.bot_workflow.vector_db import VectorDatabase, VectorDatabaseConnection
 
 class LongTermMemoryIndex:
-    def __init__(self, _db_conn: VectorDatabaseConnection): 
+    DB_PATH = os.path.join('brain_content', 'memories', 'memories.db')
+    ACCESS_LOG_PATH = os.path.join('brain_content', 'memories', 'memory_access.json')
+
+    def __init__(
+            self, 
+            _db_conn: VectorDatabaseConnection, 
+            maintenance: MemoryMaintenanceConfig | None = None, 
+            access_log: MemoryAccessLog | None = None
+        ): 
         self._db_conn = _db_conn
+        self.maintenance = maintenance or MemoryMaintenanceConfig()
+        self.access_log = access_log or MemoryAccessLog(None)
 
     @staticmethod
-    async def from_provider(provider: ProviderData) -> "LongTermMemoryIndex":
-        memories_db_path = os.path.join(os.getcwd(), 'brain_content', 'memories', 'memories.db')
-        vector_db: VectorDatabase = VectorDatabase(provider, memories_db_path)
+    async def from_provider(
+            provider: ProviderData, 
+            vector_store: VectorStoreConfig | None = None, 
+            maintenance: MemoryMaintenanceConfig | None = None
+        ) -> "LongTermMemoryIndex":
+        memories_db_path = os.path.join(os.getcwd(), LongTermMemoryIndex.DB_PATH)
+        vectorizer = ClientRegistry.instance().embeddings(provider.provider_name)
+        vector_db: VectorDatabase = VectorDatabase(vectorizer, memories_db_path, vector_store)
         db_conn = await vector_db.connect()
-        return LongTermMemoryIndex(db_conn)
+        access_log = MemoryAccessLog(os.path.join(os.getcwd(), LongTermMemoryIndex.ACCESS_LOG_PATH))
+        return LongTermMemoryIndex(db_conn, maintenance, access_log)
+
+    def _worth_remembering(self, message: MessageSnapshot) -> bool:
+        return not (self.maintenance.filter_at_ingest and is_low_information(message.text, self.maintenance.min_chars))
+
+    @staticmethod
+    def metadata(message: MessageSnapshot) -> dict:
+        # Lets searches stay within the server or channel they're made from
+        metadata = {"type": "memory", "channel_id": message.channel_id}
+        if message.guild_id is not None:
+            metadata["guild_id"] = message.guild_id
+        if message.author_id is not None:
+            metadata["author_id"] = message.author_id
+        return metadata
 
     async def memorize(self, message: MessageSnapshot):
+        if not self._worth_remembering(message):
+            return
         await self._db_conn.index(
             VectorDatabaseConnection.Indexes.MEMORIES,
             VectorDatabaseConnection.DBEntry(
                 numpy.int64(message.message_id),
-                 {"type": "memory"},
+                LongTermMemoryIndex.metadata(message),
                 message.text, 
             )
         )
 
-    async def mass_memorize(self, messages: list[MessageSnapshot]):
+    # Returns how many messages were worth remembering
+    async def mass_memorize(self, messages: list[MessageSnapshot]) -> int:
         entries = []
         for message in messages:
+            if not self._worth_remembering(message):
+                continue
             entries.append(VectorDatabaseConnection.DBEntry(
                 numpy.int64(message.message_id),
-                 {"type": "memory"},
+                LongTermMemoryIndex.metadata(message),
                 message.text, 
             ))
+        if not entries:
+            return 0
         await self._db_conn.index(
             VectorDatabaseConnection.Indexes.MEMORIES,
             entries
         )
+        return len(entries)
 
-    async def get_closest_messages(self, query: str, *, n=5) -> list[VectorDatabaseConnection.Hit]:
-        hits_for_query_list = await self._db_conn.search(
-            VectorDatabaseConnection.Indexes.MEMORIES, query, n)
-        hits_for_query = hits_for_query_list[0]
-
-        ret: list[VectorDatabaseConnection.Hit] = []
-        for hit in hits_for_query:
-            ret.append(VectorDatabaseConnection.Hit(
-                id=hit["id"],
-                distance=hit["distance"],
-                entity=hit["entity"]
-            ))
-        return ret
+    async def known_ids(self, message_ids: list[int]) -> set[int]:
+        return await self._db_conn.existing_ids(VectorDatabaseConnection.Indexes.MEMORIES, message_ids)
+
+    async def get_closest_messages(
+            self, 
+            query: str | list[float], 
+            *, 
+            n=5, 
+            metadata_filter: MetadataFilter | None = None
+        ) -> list[VectorDatabaseConnection.Hit]:
+        hits = await self._db_conn.search(VectorDatabaseConnection.Indexes.MEMORIES, query, n, metadata_filter)
+        self.access_log.record([hit.id for hit in hits])
+        return hits
+
+    async def run_maintenance(self, *, dry_run: bool = False) -> MemoryMaintenance.Report:
+        return await MemoryMaintenance(self._db_conn.backend, self.access_log, self.maintenance).run(dry_run=dry_run)
+
+    # Returns None if the memories were already migrated
+    async def migrate_scopes(self, channels: list[discord.abc.Messageable]) -> MemoryScopeMigration.Report | None:
+        migration = MemoryScopeMigration(self._db_conn.backend)
+        if migration.is_done():
+            return None
+        return await migration.run(channels)
 
 class KnowledgeIndex:
-    def __init__(self, _db_conn: VectorDatabaseConnection): 
+    MANIFEST_VERSION = 1
+    DB_PATH = os.path.join('brain_content', 'knowledge', 'knowledge.db')
+
+    def __init__(self, _db_conn: VectorDatabaseConnection, manifest_path: str | None = None, retrieval: KnowledgeRetrievalConfig | None = None): 
         self._db_conn = _db_conn
+        self.manifest_path = manifest_path
+        self.retrieval = retrieval or KnowledgeRetrievalConfig()
+        # Bumped whenever indexing changes the stored knowledge, so caches built on it can tell they're stale
+        self.version = 0
+        self._bm25 = BM25Index()
+        self._bm25_version: int | None = None
 
     @staticmethod
-    async def from_provider(provider: ProviderData) -> "KnowledgeIndex":
-        knowledge_db_path = os.path.join(os.getcwd(), 'brain_content', 'knowledge', 'knowledge.db')
-        vector_db: VectorDatabase = VectorDatabase(provider, knowledge_db_path)
+    async def from_provider(
+            provider: ProviderData, 
+            vector_store: VectorStoreConfig | None = None, 
+            retrieval: KnowledgeRetrievalConfig | None = None
+        ) -> "KnowledgeIndex":
+        knowledge_db_path = os.path.join(os.getcwd(), KnowledgeIndex.DB_PATH)
+        manifest_path = os.path.join(os.getcwd(), 'brain_content', 'knowledge_manifest.json')
+        vectorizer = ClientRegistry.instance().embeddings(provider.provider_name)
+        vector_db: VectorDatabase = VectorDatabase(vectorizer, knowledge_db_path, vector_store)
         db_conn = await vector_db.connect()
-        return KnowledgeIndex(db_conn)
+        return KnowledgeIndex(db_conn, manifest_path, retrieval)
     
     @staticmethod
     def chunk_text(text, chunk_size=2000, overlap=400):
@@ -87,6 +157,11 @@ class KnowledgeIndex:
             start += chunk_size
         return chunks
 
+    @staticmethod
+    def content_id(text: str) -> numpy.int64:
+        hash_obj = hashlib.sha256(text.encode('utf-8'))
+        return numpy.int64(int.from_bytes(hash_obj.digest()[:8], byteorder='big', signed=True))
+
     async def chunk_and_index(self, text: str, *, metadata={"type": "knowledge"}) -> int:
         chunks = KnowledgeIndex.chunk_text(text)
         if not chunks: 
@@ -94,11 +169,9 @@ class KnowledgeIndex:
             
         entries = []
         for chunk in chunks:
-            hash_obj = hashlib.sha256(text.encode('utf-8'))
-            hash_int = numpy.int64(int.from_bytes(hash_obj.digest()[:8], byteorder='big', signed=True))
             entries.append(
                 VectorDatabaseConnection.DBEntry(
-                    hash_int,
+                    KnowledgeIndex.content_id(chunk),
                     metadata,
                     chunk,
                 )
@@ -110,44 +183,165 @@ class KnowledgeIndex:
         )
         return len(entries)
 
+    def _load_manifest(self) -> dict | None:
+        if self.manifest_path is None or not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.info(f"Could not read knowledge manifest '{self.manifest_path}': {e}. Rebuilding it.")
+            return None
+        if manifest.get("version") != KnowledgeIndex.MANIFEST_VERSION:
+            return None
+        return manifest
+
+    def _save_manifest(self, manifest: dict):
+        if self.manifest_path is None:
+            return
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    async def _sync_file(self, file_path: str, old_entry: dict | None, *, metadata={"type": "knowledge"}) -> tuple[dict, int]:
+        stat = os.stat(file_path)
+        if old_entry is not None and old_entry["mtime"] == stat.st_mtime and old_entry["size"] == stat.st_size:
+            return old_entry, 0
+
+        with open(file_path, 'r') as file:
+            text = file.read()
+        content_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        if old_entry is not None and old_entry["sha256"] == content_hash:
+            return {**old_entry, "mtime": stat.st_mtime, "size": stat.st_size}, 0
+
+        chunks_by_id: dict[int, str] = {}
+        for chunk in KnowledgeIndex.chunk_text(text):
+            chunks_by_id.setdefault(int(KnowledgeIndex.content_id(chunk)), chunk)
+
+        # Chunks shared with other files or left over from an older version of this one are already embedded
+        already_indexed = await self._db_conn.existing_ids(VectorDatabaseConnection.Indexes.KNOWLEDGE, list(chunks_by_id))
+        new_entries = [
+            VectorDatabaseConnection.DBEntry(numpy.int64(chunk_id), metadata, chunk)
+            for chunk_id, chunk in chunks_by_id.items()
+            if chunk_id not in already_indexed
+        ]
+        if new_entries:
+            await self._db_conn.index(VectorDatabaseConnection.Indexes.KNOWLEDGE, new_entries)
+
+        entry = {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "sha256": content_hash,
+            "chunk_ids": list(chunks_by_id)
+        }
+        return entry, len(new_entries)
+
     async def index_from_folder(self, path, max_concurrent_tasks=8): 
         if not os.path.exists(path):
             logging.info(f"The knowledge folder, located in '{path}' does not exist. Skipping knowledge indexing.")
             return
 
-        all_files = glob.glob(f"{path}/*")
+        # The vector store lives in this folder too, as a .db file or a directory
+        all_files = [file for file in glob.glob(f"{path}/*") if os.path.isfile(file) and not file.endswith('.db')]
         txt_files = [file for file in all_files if file.endswith('.txt')]
         non_txt_files = [file for file in all_files if not file.endswith('.txt')]
 
         for file in non_txt_files:
             logging.info(f"Error: {file} is not a .txt file. All knowledge must be in text files. Skipping.")
 
-        if not txt_files:
-            logging.info(f"No files in knowledge folder: '{path}', nothing to index'")
-            return
+        manifest = self._load_manifest()
+        has_manifest = manifest is not None
+        old_files: dict[str, dict] = manifest["files"] if manifest is not None else {}
+        stale_ids: set[int] = set()
+        semaphore = asyncio.Semaphore(max_concurrent_tasks)
 
         async def process_file(file_path):
-            with open(file_path, 'r') as file:
-                text = file.read()
-                n_chunks = await self.chunk_and_index(text)
-                return n_chunks
+            async with semaphore:
+                return await self._sync_file(file_path, old_files.get(file_path))
 
-        tasks = [process_file(file) for file in txt_files]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        results = await asyncio.gather(*[process_file(file) for file in txt_files], return_exceptions=True)
 
-        total_chunks = 0
+        new_files: dict[str, dict] = {}
+        total_new_chunks = 0
         for file_path, result in zip(txt_files, results):
-            if isinstance(result, Exception):
+            if isinstance(result, BaseException):
                 logging.info(f"Error indexing {file_path}: {result}")
-            elif isinstance(result, int):
-                total_chunks += result
-                logging.info(f"Indexed {file_path}: {result} chunks")
-
-        logging.info(f"Total chunks indexed: {total_chunks}")
-
-    def retrieve(self, related_text: str, n=5):
-        return self._db_conn.search(
-            VectorDatabaseConnection.Indexes.KNOWLEDGE, 
-            related_text, 
-            n
-        )
\ No newline at end of file
+                # Keep the previous state so its chunks are not deleted below
+                if file_path in old_files:
+                    new_files[file_path] = old_files[file_path]
+                continue
+            entry, n_new_chunks = result
+            new_files[file_path] = entry
+            total_new_chunks += n_new_chunks
+            if n_new_chunks > 0:
+                logging.info(f"Indexed {file_path}: {n_new_chunks} new chunks")
+            if not has_manifest:
+                # Before the manifest existed, every chunk of a file was stored under the hash of the whole file
+                with open(file_path, 'r') as file:
+                    stale_ids.add(int(KnowledgeIndex.content_id(file.read())))
+
+        for file_path, old_entry in old_files.items():
+            stale_ids.update(old_entry["chunk_ids"])
+            if file_path not in new_files:
+                logging.info(f"Removing chunks of deleted file {file_path}")
+
+        referenced_ids = {chunk_id for entry in new_files.values() for chunk_id in entry["chunk_ids"]}
+        stale_ids -= referenced_ids
+        if stale_ids:
+            await self._db_conn.delete(VectorDatabaseConnection.Indexes.KNOWLEDGE, list(stale_ids))
+
+        self._save_manifest({"version": KnowledgeIndex.MANIFEST_VERSION, "files": new_files})
+        if total_new_chunks > 0 or stale_ids:
+            self.version += 1
+        logging.info(f"Knowledge index synced: {len(new_files)} files, {total_new_chunks} chunks embedded, {len(stale_ids)} stale chunks removed")
+
+        if self.retrieval.hybrid and self._bm25_version != self.version:
+            chunks = await asyncio.to_thread(KnowledgeIndex._read_chunks, list(new_files))
+            await self._bm25.rebuild(chunks)
+            self._bm25_version = self.version
+            logging.info(f"BM25 index rebuilt with {self._bm25.size} chunks")
+
+    @staticmethod
+    def _read_chunks(file_paths: list[str], metadata={"type": "knowledge"}) -> list[tuple[int, str, dict]]:
+        chunks_by_id: dict[int, str] = {}
+        for file_path in file_paths:
+            try:
+                with open(file_path, 'r') as file:
+                    text = file.read()
+            except OSError as e:
+                logging.info(f"Could not read {file_path} for the BM25 index: {e}")
+                continue
+            for chunk in KnowledgeIndex.chunk_text(text):
+                chunks_by_id.setdefault(int(KnowledgeIndex.content_id(chunk)), chunk)
+        return [(chunk_id, chunk, metadata) for chunk_id, chunk in chunks_by_id.items()]
+
+    async def embed(self, text: str) -> list[float]:
+        return await self._db_conn.embed(text)
+
+    async def retrieve(
+            self,
+            query: str,
+            n: int | None = None,
+            *,
+            query_vector: list[float] | None = None,
+            with_vectors: bool = False
+        ) -> list[VectorDatabaseConnection.Hit]:
+        n = n or self.retrieval.final_k
+        dense_query = query_vector if query_vector is not None else query
+        if not self.retrieval.hybrid:
+            return await self._db_conn.search(VectorDatabaseConnection.Indexes.KNOWLEDGE, dense_query, n, with_vectors=with_vectors)
+
+        dense_hits, sparse_hits = await asyncio.gather(
+            self._db_conn.search(VectorDatabaseConnection.Indexes.KNOWLEDGE, dense_query, max(n, self.retrieval.dense_k), with_vectors=with_vectors),
+            self._bm25.search(query, max(n, self.retrieval.sparse_k))
+        )
+        hits = reciprocal_rank_fusion([dense_hits, sparse_hits], n, self.retrieval.rrf_k)
+        if with_vectors:
+            # Chunks only BM25 found are looked up in the store, never embedded again
+            missing = [hit.id for hit in hits if hit.vector is None]
+            stored = await self._db_conn.stored_vectors(VectorDatabaseConnection.Indexes.KNOWLEDGE, missing)
+            for hit in hits:
+                if hit.vector is None:
+                    hit.vector = stored.get(hit.id)
+        return hits
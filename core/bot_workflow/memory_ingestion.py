@@ -0,0 +1,83 @@
+import asyncio
+import logging
+
+from core.ai_apis.scheduler import Priority, request_scope
+from core.bot_workflow.knowledge import LongTermMemoryIndex
+from core.bot_workflow.message_snapshot import MessageSnapshot
+
+class MemoryIngestionQueue:
+    def __init__(
+            self,
+            long_term_memory: LongTermMemoryIndex,
+            *,
+            batch_size: int = 32,
+            flush_interval_seconds: float = 2.0,
+            max_queue_size: int = 1000
+        ):
+        self.long_term_memory = long_term_memory
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self._queue: asyncio.Queue[MessageSnapshot] = asyncio.Queue(maxsize=max_queue_size)
+        self._queued_ids: set[int] = set()
+        self._worker: asyncio.Task | None = None
+        self._closed = False
+        self.memorized_count = 0
+        self.failed_count = 0
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def enqueue(self, message: MessageSnapshot):
+        if self._closed:
+            raise RuntimeError("Cannot memorize messages after the ingestion queue was closed")
+        if message.message_id in self._queued_ids:
+            return
+        self._queued_ids.add(message.message_id)
+        # Blocks when the queue is full, slowing producers down until the worker catches up
+        await self._queue.put(message)
+
+    async def _next_batch(self) -> list[MessageSnapshot]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.flush_interval_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                # Embedding memories can wait, replies to users go first
+                with request_scope(priority=Priority.BACKGROUND):
+                    await self.long_term_memory.mass_memorize(batch)
+                self.memorized_count += len(batch)
+            except Exception as e:
+                self.failed_count += len(batch)
+                logging.error(f"Failed to memorize a batch of {len(batch)} messages: {e}")
+            finally:
+                for message in batch:
+                    self._queued_ids.discard(message.message_id)
+                    self._queue.task_done()
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    async def close(self, timeout: float = 30):
+        self._closed = True
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Gave up flushing the memory ingestion queue, {len(self)} messages were not memorized")
+        self._worker.cancel()
+        await asyncio.gather(self._worker, return_exceptions=True)
+        self._worker = None
+        logging.info(f"Memory ingestion queue closed: {self.memorized_count} messages memorized, {self.failed_count} failed")
@@ -0,0 +1,245 @@
+# Deduplicates, expires and compacts the long-term memory store. Runs inside the bot every
+# memory_maintenance.interval_hours, or by hand while the bot is stopped:
+#
+# Run from the repository root: python -m core.bot_workflow.memory_maintenance [--dry-run]
+import os
+import re
+import json
+import time
+import numpy
+import asyncio
+import logging
+import argparse
+
+import core.util.logging_setup as logs
+
+from dataclasses import dataclass
+from core.bot_workflow.profile_loader import MemoryMaintenanceConfig, Parameters
+from core.bot_workflow.retrieval_gate import CHITCHAT_WORDS, DISCORD_MARKUP_PATTERN
+from core.bot_workflow.vector_backends import VectorStoreBackend
+from core.bot_workflow.vector_db import VectorDatabaseConnection, backend_location, make_backend
+
+DISCORD_EPOCH_MS = 1420070400000
+MEMORIES_COLLECTION = VectorDatabaseConnection.Indexes.MEMORIES.value
+_WORD_PATTERN = re.compile(r"\w+")
+# MessageSnapshot.of_discord_message puts "[date by nick] " in front of the message
+_SNAPSHOT_PREFIX_PATTERN = re.compile(r"^\[[^\]]* by [^\]]*\] ")
+
+def snowflake_timestamp(snowflake: int) -> float:
+    return ((snowflake >> 22) + DISCORD_EPOCH_MS) / 1000
+
+def is_low_information(text: str, min_chars: int) -> bool:
+    text = DISCORD_MARKUP_PATTERN.sub(" ", _SNAPSHOT_PREFIX_PATTERN.sub("", text))
+    words = [word.lower() for word in _WORD_PATTERN.findall(text)]
+    return sum(len(word) for word in words) < min_chars or all(word in CHITCHAT_WORDS for word in words)
+
+# How often and how recently searches returned each memory
+class MemoryAccessLog:
+    def __init__(self, path: str | None):
+        self.path = path
+        # id -> [times found, unix time of the last search that found it]
+        self._entries: dict[int, list[float]] = {}
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    self._entries = {int(memory_id): entry for memory_id, entry in json.load(file).items()}
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning(f"Could not read memory access log '{path}': {e}. Starting a new one.")
+
+    def record(self, memory_ids: list[int]):
+        now = time.time()
+        for memory_id in memory_ids:
+            entry = self._entries.setdefault(memory_id, [0, now])
+            entry[0] += 1
+            entry[1] = now
+
+    def accesses(self, memory_id: int) -> tuple[int, float | None]:
+        entry = self._entries.get(memory_id)
+        return (0, None) if entry is None else (int(entry[0]), entry[1])
+
+    def merge(self, into_id: int, from_ids: list[int]):
+        for memory_id in from_ids:
+            merged = self._entries.pop(memory_id, None)
+            if merged is None:
+                continue
+            entry = self._entries.setdefault(into_id, [0, merged[1]])
+            entry[0] += merged[0]
+            entry[1] = max(entry[1], merged[1])
+
+    def forget(self, memory_ids: list[int]):
+        for memory_id in memory_ids:
+            self._entries.pop(memory_id, None)
+
+    def save(self):
+        if self.path is None:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({str(memory_id): entry for memory_id, entry in self._entries.items()}, file)
+        os.replace(tmp_path, self.path)
+
+class _DisjointSet:
+    def __init__(self, size: int):
+        self.parents = numpy.arange(size)
+
+    def find(self, i: int) -> int:
+        while self.parents[i] != i:
+            self.parents[i] = self.parents[self.parents[i]]
+            i = self.parents[i]
+        return int(i)
+
+    def union(self, a: int, b: int):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parents[max(root_a, root_b)] = min(root_a, root_b)
+
+class MemoryMaintenance:
+    BLOCK_ROWS = 1024
+    BLOCK_COLUMNS = 8192
+    LATENCY_SAMPLES = 20
+
+    @dataclass
+    class Report:
+        before: int = 0
+        after: int = 0
+        low_information: int = 0
+        duplicates: int = 0
+        expired: int = 0
+        search_p50_ms_before: float = 0.0
+        search_p50_ms_after: float = 0.0
+        elapsed_seconds: float = 0.0
+        dry_run: bool = False
+
+        def describe(self) -> str:
+            action = "would delete" if self.dry_run else "deleted"
+            return f"Memory maintenance {action} {self.low_information} low information, {self.duplicates} duplicate " \
+                f"and {self.expired} expired memories: {self.before} -> {self.after} memories, " \
+                f"search p50 {self.search_p50_ms_before:.2f} -> {self.search_p50_ms_after:.2f} ms, took {self.elapsed_seconds:.1f} s"
+
+    def __init__(self, backend: VectorStoreBackend, access_log: MemoryAccessLog, config: MemoryMaintenanceConfig):
+        self.backend = backend
+        self.access_log = access_log
+        self.config = config
+
+    async def _search_p50_ms(self, queries: list[list[float]]) -> float:
+        samples = []
+        for query in queries:
+            start = time.perf_counter()
+            await self.backend.search(MEMORIES_COLLECTION, query, 5)
+            samples.append(time.perf_counter() - start)
+        return 1000 * float(numpy.median(samples)) if samples else 0.0
+
+    def _duplicate_groups(self, vectors: numpy.ndarray) -> list[list[int]]:
+        # Vectors are compared on their leading dimensions only, which is enough to tell near-identical texts apart
+        # and keeps the all-pairs pass affordable. Pairs above the threshold are chained into groups
+        vectors = vectors / numpy.maximum(numpy.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        groups = _DisjointSet(len(vectors))
+        for row_start in range(0, len(vectors), MemoryMaintenance.BLOCK_ROWS):
+            rows = vectors[row_start:row_start + MemoryMaintenance.BLOCK_ROWS]
+            # Only earlier rows, so every pair is compared once
+            for column_start in range(0, row_start + len(rows), MemoryMaintenance.BLOCK_COLUMNS):
+                columns = vectors[column_start:min(column_start + MemoryMaintenance.BLOCK_COLUMNS, row_start + len(rows))]
+                similarities = rows @ columns.T
+                for row, column in zip(*numpy.nonzero(similarities >= self.config.duplicate_similarity)):
+                    i, j = row_start + int(row), column_start + int(column)
+                    if j < i:
+                        groups.union(i, j)
+
+        members: dict[int, list[int]] = {}
+        for i in range(len(vectors)):
+            members.setdefault(groups.find(i), []).append(i)
+        return [group for group in members.values() if len(group) > 1]
+
+    def _is_expired(self, memory_id: int, now: float) -> bool:
+        if self.config.ttl_days is None:
+            return False
+        ttl_seconds = self.config.ttl_days * 86400
+        if now - snowflake_timestamp(memory_id) < ttl_seconds:
+            return False
+        accesses, last_access = self.access_log.accesses(memory_id)
+        # Old memories survive while searches keep finding them
+        recently_used = last_access is not None and now - last_access < ttl_seconds
+        return accesses < self.config.min_accesses_to_keep and not recently_used
+
+    async def run(self, *, dry_run: bool = False) -> Report:
+        start = time.perf_counter()
+        report = MemoryMaintenance.Report(dry_run=dry_run)
+        report.before = await self.backend.count(MEMORIES_COLLECTION)
+
+        now = time.time()
+        to_delete: list[int] = []
+        # Duplicates are only merged within a server, or a channel outside of servers, so no server loses its copy
+        kept_by_scope: dict[tuple, tuple[list[int], list[numpy.ndarray]]] = {}
+        latency_queries: list[list[float]] = []
+        async for batch in self.backend.scan(MEMORIES_COLLECTION):
+            for row in batch:
+                memory_id = int(row["id"])
+                vector = numpy.asarray(row["vector"], dtype=numpy.float32)
+                if len(latency_queries) < MemoryMaintenance.LATENCY_SAMPLES:
+                    latency_queries.append(vector.tolist())
+                if self.config.prune_low_information and is_low_information(row["text"], self.config.min_chars):
+                    report.low_information += 1
+                    to_delete.append(memory_id)
+                elif self._is_expired(memory_id, now):
+                    report.expired += 1
+                    to_delete.append(memory_id)
+                else:
+                    metadata = row["metadata"]
+                    scope = ("guild", metadata["guild_id"]) if "guild_id" in metadata else ("channel", metadata.get("channel_id"))
+                    kept_ids, kept_vectors = kept_by_scope.setdefault(scope, ([], []))
+                    kept_ids.append(memory_id)
+                    kept_vectors.append(vector[:self.config.duplicate_prefix_dimensions])
+        report.search_p50_ms_before = await self._search_p50_ms(latency_queries)
+
+        for kept_ids, kept_vectors in kept_by_scope.values():
+            groups = await asyncio.to_thread(self._duplicate_groups, numpy.stack(kept_vectors))
+            for group in groups:
+                group_ids = [kept_ids[i] for i in group]
+                # The most searched copy survives, and the newest one on a tie
+                survivor = max(group_ids, key=lambda memory_id: (self.access_log.accesses(memory_id)[0], memory_id))
+                duplicates = [memory_id for memory_id in group_ids if memory_id != survivor]
+                report.duplicates += len(duplicates)
+                to_delete.extend(duplicates)
+                if not dry_run:
+                    self.access_log.merge(survivor, duplicates)
+
+        if not dry_run and to_delete:
+            for i in range(0, len(to_delete), 1000):
+                await self.backend.delete(MEMORIES_COLLECTION, to_delete[i:i + 1000])
+            self.access_log.forget(to_delete)
+            await self.backend.compact(MEMORIES_COLLECTION)
+            self.access_log.save()
+
+        report.after = report.before - len(to_delete)
+        report.search_p50_ms_after = await self._search_p50_ms(latency_queries)
+        report.elapsed_seconds = time.perf_counter() - start
+        return report
+
+async def main():
+    from core.bot_workflow.knowledge import LongTermMemoryIndex
+
+    parser = argparse.ArgumentParser(description="Deduplicate, expire and compact the long-term memory store")
+    parser.add_argument("--profile", default="profile.json")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be deleted")
+    args = parser.parse_args()
+
+    options = Parameters.from_profile_file(args.profile)
+    location = backend_location(LongTermMemoryIndex.DB_PATH, options.vector_store)
+    if not os.path.exists(location):
+        logging.info(f"No memories at {location}")
+        return
+    backend = make_backend(location, options.vector_store)
+    dimensions = await backend.dimensions(MEMORIES_COLLECTION)
+    if dimensions is None:
+        logging.info(f"No memories at {location}")
+        return
+    await backend.ensure_collection(MEMORIES_COLLECTION, dimensions)
+
+    access_log = MemoryAccessLog(LongTermMemoryIndex.ACCESS_LOG_PATH)
+    report = await MemoryMaintenance(backend, access_log, options.memory_maintenance).run(dry_run=args.dry_run)
+    logging.info(report.describe())
+    await backend.close()
+
+if __name__ == "__main__":
+    logs.setup()
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+# Adds the channel and server to memories stored before searches were scoped, so they can still be
+# found when memory_search_scope isn't "global". Those memories only know their message id, so the
+# histories the bot can read are paged over the time span of the unscoped memories to find them.
+import os
+import json
+import time
+import discord
+import logging
+
+from dataclasses import dataclass
+from core.bot_workflow.vector_backends import VectorStoreBackend
+from core.bot_workflow.vector_db import VectorDatabaseConnection
+
+MEMORIES_COLLECTION = VectorDatabaseConnection.Indexes.MEMORIES.value
+
+class MemoryScopeMigration:
+    MARKER_PATH = os.path.join('brain_content', 'memories', 'scope_migration.json')
+    WRITE_BATCH_SIZE = 500
+
+    @dataclass
+    class Report:
+        unscoped: int = 0
+        scoped: int = 0
+        channels_searched: int = 0
+        elapsed_seconds: float = 0.0
+
+        def describe(self) -> str:
+            return f"Memory scope migration scoped {self.scoped} of {self.unscoped} memories by searching " \
+                f"{self.channels_searched} channels in {self.elapsed_seconds:.1f} s. " \
+                f"The other {self.unscoped - self.scoped} were not found and are only returned by global searches"
+
+    def __init__(self, backend: VectorStoreBackend, marker_path: str | None = None):
+        self.backend = backend
+        self.marker_path = marker_path or os.path.join(os.getcwd(), MemoryScopeMigration.MARKER_PATH)
+
+    def is_done(self) -> bool:
+        return os.path.exists(self.marker_path)
+
+    def _mark_done(self, report: Report):
+        with open(self.marker_path, 'w', encoding='utf-8') as file:
+            json.dump({"unscoped": report.unscoped, "scoped": report.scoped, "finished": time.time()}, file)
+
+    async def _unscoped_rows(self) -> dict[int, dict]:
+        rows = {}
+        async for batch in self.backend.scan(MEMORIES_COLLECTION):
+            for row in batch:
+                if "channel_id" not in row["metadata"]:
+                    rows[int(row["id"])] = row
+        return rows
+
+    async def _rewrite(self, rows: list[dict]) -> int:
+        # Memories that maintenance deleted meanwhile stay deleted
+        still_stored = await self.backend.existing_ids(MEMORIES_COLLECTION, [int(row["id"]) for row in rows])
+        rows = [row for row in rows if int(row["id"]) in still_stored]
+        if not rows:
+            return 0
+        # Not every backend replaces rows on insert, so the old copies are deleted first
+        await self.backend.delete(MEMORIES_COLLECTION, [int(row["id"]) for row in rows])
+        await self.backend.insert(MEMORIES_COLLECTION, rows)
+        return len(rows)
+
+    async def run(self, channels: list[discord.abc.Messageable]) -> Report:
+        start = time.perf_counter()
+        report = MemoryScopeMigration.Report()
+        unscoped = await self._unscoped_rows()
+        report.unscoped = len(unscoped)
+        if unscoped:
+            # Message ids are snowflakes, so they bound the time span to page through
+            after, before = discord.Object(min(unscoped) - 1), discord.Object(max(unscoped) + 1)
+            located: list[dict] = []
+            for channel in channels:
+                if not unscoped:
+                    break
+                report.channels_searched += 1
+                try:
+                    async for message in channel.history(limit=None, after=after, before=before, oldest_first=True):
+                        row = unscoped.pop(message.id, None)
+                        if row is None:
+                            continue
+                        row["metadata"] = {**row["metadata"], "channel_id": message.channel.id}
+                        if message.guild is not None:
+                            row["metadata"]["guild_id"] = message.guild.id
+                        row["metadata"]["author_id"] = message.author.id
+                        located.append(row)
+                        if len(located) >= MemoryScopeMigration.WRITE_BATCH_SIZE:
+                            report.scoped += await self._rewrite(located)
+                            located = []
+                except discord.HTTPException as e:
+                    logging.warning(f"Skipping channel {getattr(channel, 'id', '?')} in the memory scope migration: {e}")
+            report.scoped += await self._rewrite(located)
+        report.elapsed_seconds = time.perf_counter() - start
+        self._mark_done(report)
+        return report
@@ -9,7 +9,11 @@ class MessageSnapshot:
     is_bot: bool
     message_id: int
     sent: datetime.datetime
+    channel_id: int
     attachment_urls: list[str] = field(default_factory=list)
+    # None in direct messages
+    guild_id: int | None = None
+    author_id: int | None = None
 
     def __str__(self):
         formatted_time = datetime.datetime.strftime(self.sent, "%Y-%m-%d %H:%M:%S")
@@ -27,5 +31,8 @@ class MessageSnapshot:
             nick=message.author.display_name,
             sent=message.created_at,
             is_bot=message.author.bot,
-            message_id=message.id
+            message_id=message.id,
+            channel_id=message.channel.id,
+            guild_id=message.guild.id if message.guild is not None else None,
+            author_id=message.author.id
         )
\ No newline at end of file
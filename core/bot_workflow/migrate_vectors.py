@@ -0,0 +1,73 @@
+# Converts the knowledge and memory vector stores to the vector_store settings in profile.json,
+# e.g. after changing the embedding dimensions, quantization or backend. Stored vectors are
+# truncated to the new size (Matryoshka) instead of being embedded again.
+#
+# Run from the repository root: python -m core.bot_workflow.migrate_vectors --from-backend milvus
+import os
+import time
+import asyncio
+import logging
+import argparse
+
+import core.util.logging_setup as logs
+
+from core.bot_workflow.profile_loader import Parameters, VectorStoreConfig
+from core.bot_workflow.knowledge import KnowledgeIndex, LongTermMemoryIndex
+from core.bot_workflow.vector_db import VectorDatabaseConnection, backend_location, make_backend, truncate_embedding
+
+async def migrate_database(path: str, source_config: VectorStoreConfig, target_config: VectorStoreConfig, batch_size: int):
+    source_location = backend_location(path, source_config)
+    target_location = backend_location(path, target_config)
+    if not os.path.exists(source_location):
+        logging.info(f"Nothing to migrate at {source_location}")
+        return
+
+    # Written next to the final location first, so a failed migration leaves the old store untouched
+    root, extension = os.path.splitext(target_location)
+    staging_location = f"{root}.migrating{extension}"
+    source = make_backend(source_location, source_config)
+    target = make_backend(staging_location, target_config)
+    target_dim = target_config.embedding.stored_dimensions
+
+    for index in VectorDatabaseConnection.Indexes:
+        source_dim = await source.dimensions(index.value)
+        if source_dim is None:
+            continue
+        if source_dim < target_dim:
+            raise ValueError(f"Cannot grow {index.value} from {source_dim} to {target_dim} dimensions, its texts must be embedded again")
+        await source.ensure_collection(index.value, source_dim)
+        await target.ensure_collection(index.value, target_dim)
+
+        migrated = 0
+        start = time.perf_counter()
+        async for batch in source.scan(index.value, batch_size):
+            for row in batch:
+                row["vector"] = truncate_embedding(list(row["vector"]), target_dim)
+            await target.insert(index.value, batch)
+            migrated += len(batch)
+        logging.info(f"Migrated {migrated} {index.value} vectors in {path} from {source_dim} to {target_dim} dimensions in {time.perf_counter() - start:.1f} s")
+
+    await source.close()
+    await target.close()
+
+    if os.path.exists(target_location):
+        backup_location = f"{target_location}.backup-{int(time.time())}"
+        os.rename(target_location, backup_location)
+        logging.info(f"Previous store moved to {backup_location}")
+    os.rename(staging_location, target_location)
+
+async def main():
+    parser = argparse.ArgumentParser(description="Convert stored vectors to the vector_store settings in profile.json")
+    parser.add_argument("--profile", default="profile.json")
+    parser.add_argument("--from-backend", choices=["milvus", "numpy"], required=True, help="Backend the vectors are currently stored in")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    target_config = Parameters.from_profile_file(args.profile).vector_store
+    source_config = VectorStoreConfig(backend=args.from_backend)
+    for path in (KnowledgeIndex.DB_PATH, LongTermMemoryIndex.DB_PATH):
+        await migrate_database(path, source_config, target_config, args.batch_size)
+
+if __name__ == "__main__":
+    logs.setup()
+    asyncio.run(main())
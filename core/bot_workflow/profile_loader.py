@@ -1,10 +1,10 @@
 import json
 import logging
-from typing import Dict, List
-from pydantic import BaseModel, Field, field_validator, ValidationError
+from typing import Dict, List, Literal
+from pydantic import BaseModel, Field, field_validator, model_validator, ValidationError
 
 from core.ai_apis.providers import ProviderData
-from core.ai_apis.types import LLMRequestParams, Prompt
+from core.ai_apis.api_types import LLMRequestParams, Prompt
 from core.util.environment_vars import parse_api_key_in_config
 
 class FalImageGenModuleConfig(BaseModel):
@@ -19,6 +19,132 @@ class FalImageGenModuleConfig(BaseModel):
     def parse_api_key(cls, v):
         return parse_api_key_in_config(v)
 
+class EmbeddingCacheConfig(BaseModel):
+    enabled: bool = True
+    path: str = "brain_content/embedding_cache.db"
+    max_memory_entries: int = 10_000
+    max_disk_entries: int = 200_000
+
+class MemoryIngestionConfig(BaseModel):
+    batch_size: int = 32
+    flush_interval_seconds: float = 2.0
+    max_queue_size: int = 1000
+
+class PromptBudgetConfig(BaseModel):
+    enabled: bool = False
+    max_prompt_tokens: int = 6000
+    knowledge_tokens: int = 1500
+    memories_tokens: int = 800
+    min_history_messages: int = 2
+
+class HedgingConfig(BaseModel):
+    enabled: bool = False
+    percentile: float = 0.95
+    min_samples: int = 10
+    default_delay_seconds: float = 4.0
+    min_delay_seconds: float = 0.5
+    max_delay_seconds: float = 10.0
+
+class CircuitBreakerConfig(BaseModel):
+    window_size: int = 20
+    min_calls: int = 5
+    failure_rate_threshold: float = 0.5
+    slow_call_seconds: float = 10.0
+    slow_call_rate_threshold: float = 0.8
+    open_seconds: float = 30.0
+    max_open_seconds: float = 300.0
+
+class ResponseCacheConfig(BaseModel):
+    enabled: bool = False
+    scope: Literal["channel", "guild"] = "channel"
+    similarity_threshold: float = 0.95
+    ttl_seconds: float = 3600
+    max_entries_per_scope: int = 256
+
+class EmbeddingConfig(BaseModel):
+    model: str = "text-embedding-3-large"
+    native_dimensions: int = 3072
+    # None keeps the model's native size
+    dimensions: int | None = None
+    # "api" asks the model for shorter embeddings, "local" truncates full ones (Matryoshka) and renormalizes
+    truncation: Literal["api", "local"] = "api"
+
+    @property
+    def stored_dimensions(self) -> int:
+        return self.dimensions or self.native_dimensions
+
+class VectorStoreConfig(BaseModel):
+    backend: Literal["milvus", "numpy"] = "milvus"
+    numpy_dtype: Literal["float16", "float32"] = "float32"
+    numpy_max_segments: int = 16
+    # Only supported by the numpy backend
+    quantization: Literal["none", "int8", "binary"] = "none"
+    # Quantized search fetches this many times more candidates and ranks them with full precision vectors, 1 disables
+    rescore_multiplier: int = 4
+    embedding: EmbeddingConfig = Field(default_factory=EmbeddingConfig)
+
+class RerankerConfig(BaseModel):
+    enabled: bool = False
+    max_passages: int = 3
+    token_budget: int = 800
+    # Share of the score from term overlap, the rest is embedding similarity
+    lexical_weight: float = 0.3
+
+class KnowledgeRetrievalConfig(BaseModel):
+    # Chunks passed to INFO_SELECT
+    final_k: int = 5
+    reranker: RerankerConfig = Field(default_factory=RerankerConfig)
+    # When off, the retrieved (and reranked) passages go into the prompt as they are, saving an LLM round trip
+    llm_info_select: bool = True
+    # Fuses dense results with a local BM25 index, which catches exact identifiers, command names and error strings
+    hybrid: bool = False
+    dense_k: int = 10
+    sparse_k: int = 10
+    rrf_k: int = 60
+
+class RetrievalGateConfig(BaseModel):
+    enabled: bool = False
+    # Messages with fewer words skip retrieval unless they look like a question or mention an identifier
+    min_words: int = 3
+    extra_chitchat_words: List[str] = Field(default_factory=list)
+
+class RequestCoalescingConfig(BaseModel):
+    enabled: bool = False
+    # Pings within this window of the first one, or sent while the channel's previous reply is generated, get one reply
+    window_ms: int = 1500
+    max_batch: int = 5
+
+class HistorySummaryConfig(BaseModel):
+    enabled: bool = False
+    # Any provider in the profile works, the model is set in request_params.HISTORY_SUMMARY
+    provider: str = "INFO_SELECT"
+    # Messages that must fall out of the history window before the summary is updated
+    min_batch: int = 6
+    max_summary_tokens: int = 300
+
+class MemoryMaintenanceConfig(BaseModel):
+    # Drops messages with little to recall, like "lol" or "ok thanks", instead of embedding them
+    filter_at_ingest: bool = False
+    # Also deletes already stored memories like that during maintenance
+    prune_low_information: bool = False
+    # Short facts like "use port 8080" must stay above this, chit-chat words are the main signal
+    min_chars: int = 4
+    # Runs deduplication, expiry and compaction while the bot is up, 0 disables
+    interval_hours: float = 0
+    duplicate_similarity: float = 0.97
+    duplicate_prefix_dimensions: int = 256
+    # Memories older than this are deleted unless searches keep finding them, None keeps them forever
+    ttl_days: float | None = None
+    min_accesses_to_keep: int = 3
+
+class MemoryBackfillConfig(BaseModel):
+    batch_size: int = 100
+    # Channels paged at once, discord.py already waits out rate limits
+    max_concurrent_channels: int = 2
+    # Batches fetched ahead of the one being embedded, per channel
+    max_pending_batches: int = 2
+    progress_interval_seconds: float = 10
+
 class Parameters(BaseModel):
     botname: str
     recent_message_history_length: int
@@ -29,6 +155,35 @@ class Parameters(BaseModel):
     remove_trailing_newline: bool
     enable_image_viewing: bool
     llm_fallbacks: List[str] = Field(default_factory=list, examples=["test", "aaa"])
+    enable_response_streaming: bool = False
+    stream_edit_interval_seconds: float = 1.0
+    max_tracked_channels: int = 2000
+    channel_history_idle_seconds: int = 6 * 3600
+    default_stage_timeout: float = 30
+    stage_timeouts: Dict[str, float] = Field(default_factory=dict, examples=[{"knowledge": 10, "old_memories": 5}])
+    embedding_cache: EmbeddingCacheConfig = Field(default_factory=EmbeddingCacheConfig)
+    memory_ingestion: MemoryIngestionConfig = Field(default_factory=MemoryIngestionConfig)
+    prompt_budget: PromptBudgetConfig = Field(default_factory=PromptBudgetConfig)
+    volatile_context_placement: Literal["inline", "trailing"] = "inline"
+    hedging: HedgingConfig = Field(default_factory=HedgingConfig)
+    circuit_breaker: CircuitBreakerConfig = Field(default_factory=CircuitBreakerConfig)
+    response_cache: ResponseCacheConfig = Field(default_factory=ResponseCacheConfig)
+    vector_store: VectorStoreConfig = Field(default_factory=VectorStoreConfig)
+    knowledge_retrieval: KnowledgeRetrievalConfig = Field(default_factory=KnowledgeRetrievalConfig)
+    retrieval_gate: RetrievalGateConfig = Field(default_factory=RetrievalGateConfig)
+    request_coalescing: RequestCoalescingConfig = Field(default_factory=RequestCoalescingConfig)
+    history_summary: HistorySummaryConfig = Field(default_factory=HistorySummaryConfig)
+    memory_maintenance: MemoryMaintenanceConfig = Field(default_factory=MemoryMaintenanceConfig)
+    memory_backfill: MemoryBackfillConfig = Field(default_factory=MemoryBackfillConfig)
+    # Which memories a search may return. Direct messages are always scoped to their channel. Memories stored
+    # before scoping was added get their scope from a one-off migration when the bot starts
+    memory_search_scope: Literal["global", "guild", "channel"] = "guild"
+
+    # For command line tools that only need the options, so API keys don't have to be set
+    @classmethod
+    def from_profile_file(cls, filename: str) -> "Parameters":
+        with open(filename, 'r', encoding='utf-8') as f:
+            return cls.model_validate(json.load(f)["options"])
 
 class Profile(BaseModel):
     options: Parameters
@@ -39,6 +194,17 @@ class Profile(BaseModel):
     regex_replacements: Dict[str, str | list[str]]
     fal_image_gen_config: FalImageGenModuleConfig
 
+    @model_validator(mode="after")
+    def check_history_summary(self) -> "Profile":
+        summary_config = self.options.history_summary
+        if summary_config.enabled:
+            if summary_config.provider not in self.providers:
+                raise ValueError(f"options.history_summary.provider '{summary_config.provider}' is not one of the providers")
+            for section, entries in (("prompts", self.prompts), ("request_params", self.request_params)):
+                if "HISTORY_SUMMARY" not in entries:
+                    raise ValueError(f"History summaries are enabled but {section} has no HISTORY_SUMMARY entry")
+        return self
+
     def get_prompt(self, name: str) -> Prompt:
         if name in self.prompts:
             return self.prompts[name].model_copy(deep=True)
@@ -0,0 +1,87 @@
+from dataclasses import dataclass, field
+from core.ai_apis.api_types import Prompt
+from core.bot_workflow.message_snapshot import MessageSnapshot
+from core.util.tokens import estimate_tokens, estimate_message_tokens, truncate_to_tokens, MESSAGE_OVERHEAD_TOKENS
+
+class PromptBudget:
+    @dataclass
+    class Allocation:
+        history: list[MessageSnapshot]
+        knowledge: str | None
+        memories: list[str]
+        section_tokens: dict[str, int] = field(default_factory=dict)
+        dropped_history: int = 0
+        dropped_memories: int = 0
+
+        def describe(self) -> str:
+            sections = ", ".join(f"{name}: {tokens}" for name, tokens in self.section_tokens.items())
+            return f"{sections} (total {sum(self.section_tokens.values())}). " \
+                f"Dropped {self.dropped_history} history messages and {self.dropped_memories} memories"
+
+    def __init__(self, *, max_prompt_tokens: int, knowledge_tokens: int, memories_tokens: int, min_history_messages: int):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.knowledge_tokens = knowledge_tokens
+        self.memories_tokens = memories_tokens
+        self.min_history_messages = min_history_messages
+
+    @classmethod
+    def unlimited(cls) -> "PromptBudget":
+        no_limit = 2 ** 31
+        return cls(max_prompt_tokens=no_limit, knowledge_tokens=no_limit, memories_tokens=no_limit, min_history_messages=0)
+
+    def allocate(
+            self,
+            *,
+            base_prompt: Prompt,
+            history: list[MessageSnapshot],
+            knowledge: str | None,
+            memories: list[str],
+            extra_text: str | None = None
+        ) -> Allocation:
+        section_tokens = {
+            "system": sum(estimate_message_tokens(message) for message in base_prompt.messages),
+            "extra": estimate_tokens(extra_text) + MESSAGE_OVERHEAD_TOKENS if extra_text else 0
+        }
+        remaining = self.max_prompt_tokens - section_tokens["system"] - section_tokens["extra"]
+
+        # The newest messages are reserved first since the reply is addressed to them
+        history_tokens = [estimate_tokens(message.text) + MESSAGE_OVERHEAD_TOKENS for message in history]
+        reserved_history = sum(history_tokens[-self.min_history_messages:]) if self.min_history_messages > 0 else 0
+        remaining -= reserved_history
+
+        if knowledge:
+            knowledge = truncate_to_tokens(knowledge, min(self.knowledge_tokens, max(remaining, 0)))
+        section_tokens["knowledge"] = estimate_tokens(knowledge) if knowledge else 0
+        remaining -= section_tokens["knowledge"]
+
+        # Memories arrive sorted by relevance, so the least relevant ones are dropped first
+        kept_memories: list[str] = []
+        memory_budget = min(self.memories_tokens, max(remaining, 0))
+        section_tokens["memories"] = 0
+        for memory in memories:
+            tokens = estimate_tokens(memory)
+            if section_tokens["memories"] + tokens > memory_budget:
+                break
+            kept_memories.append(memory)
+            section_tokens["memories"] += tokens
+        remaining -= section_tokens["memories"]
+
+        # Older history messages are dropped first
+        remaining += reserved_history
+        kept_from = len(history)
+        section_tokens["history"] = 0
+        for i in range(len(history) - 1, -1, -1):
+            is_reserved = i >= len(history) - self.min_history_messages
+            if not is_reserved and section_tokens["history"] + history_tokens[i] > remaining:
+                break
+            section_tokens["history"] += history_tokens[i]
+            kept_from = i
+
+        return PromptBudget.Allocation(
+            history=history[kept_from:],
+            knowledge=knowledge,
+            memories=kept_memories,
+            section_tokens=section_tokens,
+            dropped_history=kept_from,
+            dropped_memories=len(memories) - len(kept_memories)
+        )
@@ -0,0 +1,68 @@
+import asyncio
+
+from dataclasses import dataclass, field
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Generic, TypeVar
+
+T = TypeVar("T")
+
+# Pings that arrive while a channel's batch waits for the window or the previous reply join that batch
+class ChannelCoalescer(Generic[T]):
+    @dataclass
+    class _Batch(Generic[T]):
+        items: list[T]
+        full: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def __init__(self, *, window_seconds: float, max_batch: int):
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self._collecting: dict[int, ChannelCoalescer._Batch[T]] = {}
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._leaders: dict[int, int] = {}
+        self.batches = 0
+        self.coalesced_items = 0
+
+    def _close(self, channel_id: int, batch: "ChannelCoalescer._Batch[T]"):
+        if self._collecting.get(channel_id) is batch:
+            del self._collecting[channel_id]
+        batch.full.set()
+
+    # Yields the batch, oldest first, to the caller that should respond, and None to the others.
+    # The channel stays reserved until the responding caller's block exits
+    @asynccontextmanager
+    async def batch(self, channel_id: int, item: T) -> AsyncIterator[list[T] | None]:
+        collecting = self._collecting.get(channel_id)
+        if collecting is not None:
+            collecting.items.append(item)
+            self.coalesced_items += 1
+            if len(collecting.items) >= self.max_batch:
+                self._close(channel_id, collecting)
+            yield None
+            return
+
+        batch = ChannelCoalescer._Batch([item])
+        self._collecting[channel_id] = batch
+        lock = self._locks.setdefault(channel_id, asyncio.Lock())
+        self._leaders[channel_id] = self._leaders.get(channel_id, 0) + 1
+        try:
+            try:
+                await asyncio.wait_for(batch.full.wait(), self.window_seconds)
+            except asyncio.TimeoutError:
+                pass
+            async with lock:
+                self._close(channel_id, batch)
+                self.batches += 1
+                yield batch.items
+        finally:
+            self._close(channel_id, batch)
+            self._leaders[channel_id] -= 1
+            if self._leaders[channel_id] == 0:
+                del self._leaders[channel_id]
+                del self._locks[channel_id]
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "coalesced_pings": self.coalesced_items,
+            "collecting_channels": len(self._collecting)
+        }
@@ -0,0 +1,90 @@
+import re
+import math
+import numpy
+
+from dataclasses import dataclass
+from core.util.tokens import estimate_tokens, truncate_to_tokens
+
+_TERM_PATTERN = re.compile(r"[\w./:-]+")
+
+# Mixes rarity-weighted term overlap with embedding similarity, so exact identifiers still count
+class LocalReranker:
+    @dataclass
+    class Passage:
+        text: str
+        score: float
+        lexical: float
+        semantic: float
+
+    def __init__(self, *, max_passages: int = 3, token_budget: int = 800, lexical_weight: float = 0.3):
+        self.max_passages = max_passages
+        self.token_budget = token_budget
+        self.lexical_weight = lexical_weight
+
+    @staticmethod
+    def terms(text: str) -> set[str]:
+        return {term.strip(".:-/") for term in _TERM_PATTERN.findall(text.lower())} - {""}
+
+    @staticmethod
+    def lexical_scores(query: str, passages: list[str]) -> list[float]:
+        query_terms = LocalReranker.terms(query)
+        passage_terms = [LocalReranker.terms(passage) for passage in passages]
+        if not query_terms or not passages:
+            return [0.0] * len(passages)
+        # Terms found in every candidate don't tell them apart
+        idf = {
+            term: math.log(1 + len(passages) / (1 + sum(term in terms for terms in passage_terms)))
+            for term in query_terms
+        }
+        total = sum(idf.values())
+        return [sum(idf[term] for term in query_terms & terms) / total for terms in passage_terms]
+
+    @staticmethod
+    def semantic_scores(query_vector: list[float], passage_vectors: list[list[float]]) -> list[float]:
+        if not passage_vectors:
+            return []
+        matrix = numpy.asarray(passage_vectors, dtype=numpy.float32)
+        query = numpy.asarray(query_vector, dtype=numpy.float32)
+        norms = numpy.linalg.norm(matrix, axis=1) * numpy.linalg.norm(query)
+        similarities = (matrix @ query) / numpy.maximum(norms, 1e-12)
+        return similarities.tolist()
+
+    def rerank(
+            self,
+            query: str,
+            passages: list[str],
+            query_vector: list[float] | None = None,
+            passage_vectors: list[list[float]] | None = None
+        ) -> list[Passage]:
+        lexical = LocalReranker.lexical_scores(query, passages)
+        if query_vector is not None and passage_vectors is not None:
+            semantic = LocalReranker.semantic_scores(query_vector, passage_vectors)
+            lexical_weight = self.lexical_weight
+        else:
+            semantic = [0.0] * len(passages)
+            lexical_weight = 1.0
+
+        ranked = sorted(
+            (
+                LocalReranker.Passage(text, lexical_weight * lex + (1 - lexical_weight) * sem, lex, sem)
+                for text, lex, sem in zip(passages, lexical, semantic)
+            ),
+            key=lambda passage: passage.score,
+            reverse=True
+        )
+
+        selected: list[LocalReranker.Passage] = []
+        remaining = self.token_budget
+        for passage in ranked:
+            if len(selected) >= self.max_passages:
+                break
+            tokens = estimate_tokens(passage.text)
+            if tokens > remaining:
+                if selected:
+                    continue
+                # The best passage is always kept, cut down to the budget
+                passage.text = truncate_to_tokens(passage.text, remaining)
+                tokens = remaining
+            selected.append(passage)
+            remaining -= tokens
+        return selected
@@ -0,0 +1,86 @@
+import time
+import numpy
+
+from dataclasses import dataclass
+from collections import OrderedDict
+from core.bot_workflow.knowledge import KnowledgeIndex
+
+class SemanticResponseCache:
+    @dataclass
+    class Entry:
+        query: str
+        vector: numpy.ndarray
+        response: str
+        created_at: float
+        knowledge_version: int
+
+    @dataclass
+    class Lookup:
+        vector: numpy.ndarray
+        hit: "SemanticResponseCache.Entry | None"
+        similarity: float
+
+    def __init__(
+            self,
+            knowledge: KnowledgeIndex,
+            *,
+            similarity_threshold: float = 0.95,
+            ttl_seconds: float = 3600,
+            max_entries_per_scope: int = 256,
+            max_scopes: int = 1000
+        ):
+        self.knowledge = knowledge
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_scope = max_entries_per_scope
+        self.max_scopes = max_scopes
+        self._scopes: OrderedDict[int, list[SemanticResponseCache.Entry]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _is_fresh(self, entry: Entry, now: float) -> bool:
+        # Answers given before the knowledge changed may be outdated
+        return now - entry.created_at < self.ttl_seconds and entry.knowledge_version == self.knowledge.version
+
+    def lookup(self, scope: int, query_vector: list[float]) -> Lookup:
+        vector = numpy.asarray(query_vector, dtype=numpy.float32)
+        vector = vector / max(float(numpy.linalg.norm(vector)), 1e-12)
+
+        now = time.time()
+        entries = [entry for entry in self._scopes.get(scope, []) if self._is_fresh(entry, now)]
+        if scope in self._scopes:
+            self._scopes[scope] = entries
+            self._scopes.move_to_end(scope)
+
+        best: SemanticResponseCache.Entry | None = None
+        best_similarity = 0.0
+        if entries:
+            similarities = numpy.stack([entry.vector for entry in entries]) @ vector
+            best_index = int(numpy.argmax(similarities))
+            best_similarity = float(similarities[best_index])
+            if best_similarity >= self.similarity_threshold:
+                best = entries[best_index]
+
+        if best is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return SemanticResponseCache.Lookup(vector, best, best_similarity)
+
+    def store(self, scope: int, query: str, vector: numpy.ndarray, response: str):
+        entries = self._scopes.setdefault(scope, [])
+        self._scopes.move_to_end(scope)
+        entries.append(SemanticResponseCache.Entry(query, vector, response, time.time(), self.knowledge.version))
+        if len(entries) > self.max_entries_per_scope:
+            del entries[:len(entries) - self.max_entries_per_scope]
+        while len(self._scopes) > self.max_scopes:
+            self._scopes.popitem(last=False)
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "scopes": len(self._scopes)
+        }
@@ -1,8 +1,11 @@
 import time
 
-from core.ai_apis import providers
 from abc import ABC, abstractmethod
+from core.bot_workflow.reranker import LocalReranker
+from core.bot_workflow.vector_backends import Hit
 from core.bot_workflow.response_logs import SimpleDebugLogger
+from core.bot_workflow.bot_types import MessageSnapshotHistory
+from core.ai_apis.client_registry import ClientRegistry
 from core.bot_workflow.ai_bot import Prompt, LLMClient, CustomBotData
 
 class ResponseStep(ABC):
@@ -13,8 +16,7 @@ class ResponseStep(ABC):
 
     async def _llm_request(self, *, name: str, prompt: Prompt):
         params = self.bot_data.profile.request_params[name]
-        provider: providers.ProviderData = self.bot_data.profile.providers[name]
-        client: LLMClient = LLMClient.from_provider(provider)
+        client: LLMClient = ClientRegistry.instance().llm(name)
         return await client.send_request(prompt=prompt, params=params)
     
     async def execute(self, bot_data: CustomBotData, message: str) -> str | None:
@@ -54,9 +56,13 @@ class PersonalityRewriteStep(ResponseStep):
         return "personality rewriter"
     
 class UserQueryRephraseStep(ResponseStep):
+    def __init__(self, *, logger: SimpleDebugLogger, history: MessageSnapshotHistory):
+        super().__init__(logger)
+        self.history = history
+
     async def _run(self):
         NAME = "USER_QUERY_REPHRASE"
-        recent_history_list = self.bot_data.recent_history.backing_history.as_list()
+        recent_history_list = self.history.as_list()
         user_prompt_str = "\n".join(
             [memorized_message.text for memorized_message in recent_history_list]
         )
@@ -76,21 +82,53 @@ class UserQueryRephraseStep(ResponseStep):
         return "query rephraser"
     
 class RelevantInfoSelectStep(ResponseStep):
-    def __init__(self, *, logger: SimpleDebugLogger, user_query: str):
+    def __init__(self, *, logger: SimpleDebugLogger, user_query: str, query_vector: list[float] | None = None):
         super().__init__(logger)
         self.user_query = user_query
+        self.query_vector = query_vector
+
+    async def _rerank(self, hits: list[Hit]) -> list[str]:
+        config = self.bot_data.profile.options.knowledge_retrieval.reranker
+        query_vector = self.query_vector if self.query_vector is not None else await self.bot_data.knowledge.embed(self.user_query)
+        reranker = LocalReranker(
+            max_passages=config.max_passages,
+            token_budget=config.token_budget,
+            lexical_weight=config.lexical_weight
+        )
+        passages = [hit.entity["text"] for hit in hits]
+        # Stored vectors come back with the hits, so reranking costs no embedding request
+        passage_vectors = [hit.vector for hit in hits]
+        if any(vector is None for vector in passage_vectors):
+            passage_vectors = None
+        start = time.perf_counter()
+        ranked = reranker.rerank(self.user_query, passages, query_vector, passage_vectors)
+        elapsed_ms = 1000 * (time.perf_counter() - start)
+        self.logger.verbose(
+            f"Kept {len(ranked)} of {len(passages)} passages in {elapsed_ms:.1f} ms, scores: " +
+            ", ".join(f"{passage.score:.3f} (lexical {passage.lexical:.2f}, semantic {passage.semantic:.2f})" for passage in ranked),
+            category="RERANK"
+        )
+        return [passage.text for passage in ranked]
 
     async def _run(self):
         NAME = "INFO_SELECT"
-        available_info = ""
-        hits_list = await self.bot_data.knowledge.retrieve(self.user_query)
+        retrieval_config = self.bot_data.profile.options.knowledge_retrieval
+        hits = await self.bot_data.knowledge.retrieve(
+            self.user_query,
+            query_vector=self.query_vector,
+            with_vectors=retrieval_config.reranker.enabled
+        )
 
-        if len(hits_list) == 0:
+        if len(hits) == 0:
             return None
 
-        for hits in hits_list:
-            for hit in hits:
-                available_info += hit["text"] + "\n"
+        if retrieval_config.reranker.enabled:
+            passages = await self._rerank(hits)
+        else:
+            passages = [hit.entity["text"] for hit in hits]
+        available_info = "".join(passage + "\n" for passage in passages)
+        if not retrieval_config.llm_info_select:
+            return available_info
 
         prompt = self.bot_data.profile.get_prompt(NAME) \
             .replace({
@@ -0,0 +1,74 @@
+import re
+
+from collections import Counter
+from dataclasses import dataclass
+
+DISCORD_MARKUP_PATTERN = re.compile(r"<a?:\w+:\d+>|<[@#][!&]?\d+>|https?://\S+")
+_WORD_PATTERN = re.compile(r"[\w'/.`-]+")
+# Things the knowledge files or old messages can answer and a rephrase can't guess: codes, commands, names
+_IDENTIFIER_PATTERN = re.compile(r"`|\w*\d\w*|/\w+|\w+[_.]\w+|[a-z]+[A-Z]\w*")
+_QUESTION_WORDS = {
+    "what", "how", "why", "who", "when", "where", "which", "whose", "can", "could", "does", "do", "did",
+    "is", "are", "was", "were", "should", "would", "will", "explain", "tell", "remember", "recall"
+}
+CHITCHAT_WORDS = {
+    "hi", "hey", "hello", "yo", "sup", "hiya", "howdy", "gm", "gn", "bye", "cya", "lol", "lmao", "lmfao",
+    "rofl", "haha", "hahaha", "xd", "ok", "okay", "k", "kk", "yes", "yeah", "yep", "yup", "no", "nope", "nah",
+    "thanks", "thank", "thx", "ty", "you", "u", "np", "nice", "cool", "wow", "omg", "true", "fr", "based",
+    "good", "morning", "night", "bot", "hmm", "oh", "ah", "damn", "lmk", "same", "please", "pls", "love",
+    "goodnight", "welcome", "great", "awesome", "sure", "alright", "right", "bruh"
+}
+
+# Lets greetings and reactions skip the rephrase call and the vector searches. Errs towards retrieving
+class RetrievalGate:
+    @dataclass
+    class Decision:
+        retrieve: bool
+        reason: str
+
+    def __init__(self, *, min_words: int = 3, extra_chitchat_words: list[str] | None = None):
+        self.min_words = min_words
+        self.chitchat_words = CHITCHAT_WORDS | {word.lower() for word in extra_chitchat_words or []}
+        self.reasons: Counter[str] = Counter()
+        self.retrieved = 0
+        self.retrieved_with_results = 0
+
+    def _decide(self, text: str) -> Decision:
+        text = DISCORD_MARKUP_PATTERN.sub(" ", text)
+        words = _WORD_PATTERN.findall(text)
+        lowered = [word.lower().strip("'.") for word in words]
+        if not words:
+            return RetrievalGate.Decision(False, "no text")
+        if "?" in text:
+            return RetrievalGate.Decision(True, "question mark")
+        if any(_IDENTIFIER_PATTERN.fullmatch(word) or "`" in word for word in words):
+            return RetrievalGate.Decision(True, "identifier")
+        if lowered[0] in _QUESTION_WORDS:
+            return RetrievalGate.Decision(True, "question word")
+        if all(word in self.chitchat_words for word in lowered):
+            return RetrievalGate.Decision(False, "chit-chat")
+        if len(words) < self.min_words:
+            return RetrievalGate.Decision(False, "too short")
+        return RetrievalGate.Decision(True, "long enough")
+
+    def check(self, text: str) -> Decision:
+        decision = self._decide(text)
+        self.reasons[f"{'retrieve' if decision.retrieve else 'skip'}: {decision.reason}"] += 1
+        return decision
+
+    # Called after a retrieval the gate allowed, to see how often it was useful
+    def record_outcome(self, found_anything: bool):
+        self.retrieved += 1
+        if found_anything:
+            self.retrieved_with_results += 1
+
+    def stats(self) -> dict:
+        checked = sum(self.reasons.values())
+        skipped = sum(count for reason, count in self.reasons.items() if reason.startswith("skip"))
+        return {
+            "checked": checked,
+            "skipped": skipped,
+            "skip_rate": round(skipped / checked, 3) if checked else 0.0,
+            "retrieval_hit_rate": round(self.retrieved_with_results / self.retrieved, 3) if self.retrieved else 0.0,
+            "reasons": dict(self.reasons)
+        }
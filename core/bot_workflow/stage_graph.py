@@ -0,0 +1,71 @@
+import time
+import asyncio
+
+from typing import Any, Awaitable, Callable
+from dataclasses import dataclass, field
+from core.bot_workflow.response_logs import SimpleDebugLogger
+
+_NO_DEFAULT = object()
+
+class StageGraph:
+    @dataclass
+    class Stage:
+        name: str
+        run: Callable[..., Awaitable[Any]]
+        depends_on: list[str] = field(default_factory=list)
+        timeout: float | None = None
+        timeout_default: Any = _NO_DEFAULT
+
+    def __init__(self, logger: SimpleDebugLogger):
+        self.logger = logger
+        self.stages: dict[str, StageGraph.Stage] = {}
+        self.elapsed_ms: dict[str, float] = {}
+
+    def add(
+            self,
+            name: str,
+            run: Callable[..., Awaitable[Any]],
+            *,
+            depends_on: list[str] | None = None,
+            timeout: float | None = None,
+            timeout_default: Any = _NO_DEFAULT
+        ) -> None:
+        depends_on = depends_on or []
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' was already added")
+        for dependency in depends_on:
+            # Dependencies must be added first, which also rules out cycles
+            if dependency not in self.stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dependency}'")
+        self.stages[name] = StageGraph.Stage(name, run, depends_on, timeout, timeout_default)
+
+    async def _run_stage(self, stage: Stage, tasks: dict[str, asyncio.Task]) -> Any:
+        dependency_results = {}
+        for dependency in stage.depends_on:
+            dependency_results[dependency] = await tasks[dependency]
+
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(stage.run(**dependency_results), stage.timeout)
+        except asyncio.TimeoutError:
+            if stage.timeout_default is _NO_DEFAULT:
+                raise RuntimeError(f"Stage '{stage.name}' timed out after {stage.timeout} s")
+            self.logger.verbose(f"Stage '{stage.name}' timed out after {stage.timeout} s, using default", category="STAGE TIMEOUT")
+            return stage.timeout_default
+        finally:
+            self.elapsed_ms[stage.name] = 1000 * (time.perf_counter() - start)
+            self.logger.verbose(f"Stage '{stage.name}' finished in {self.elapsed_ms[stage.name]:.1f} ms", category="STAGE FINISHED")
+
+    async def run(self) -> dict[str, Any]:
+        tasks: dict[str, asyncio.Task] = {}
+        for name, stage in self.stages.items():
+            tasks[name] = asyncio.create_task(self._run_stage(stage, tasks))
+
+        try:
+            results = await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return dict(zip(tasks.keys(), results))
@@ -0,0 +1,68 @@
+import asyncio
+import discord
+
+from typing import Callable
+
+class StreamedReply:
+    def __init__(self, first_message: discord.Message, *, chunker: Callable[[str], list[str]], min_edit_interval: float):
+        self.messages: list[discord.Message] = [first_message]
+        self.chunker = chunker
+        self.min_edit_interval = min_edit_interval
+        self._rendered_chunks: list[str] = [first_message.content]
+        self._latest_text = ""
+        self._dirty = asyncio.Event()
+        self._closed = asyncio.Event()
+        self._flush_task: asyncio.Task | None = None
+
+    @property
+    def started(self) -> bool:
+        return self._flush_task is not None
+
+    def update(self, text: str) -> None:
+        self._latest_text = text
+        self._dirty.set()
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while not self._closed.is_set():
+            await self._dirty.wait()
+            self._dirty.clear()
+            if self._closed.is_set():
+                break
+            await self._render(self._latest_text)
+            # Throttle edits to stay under Discord's message edit rate limit
+            try:
+                await asyncio.wait_for(self._closed.wait(), timeout=self.min_edit_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _render(self, text: str):
+        chunks = self.chunker(text)
+        if not chunks:
+            return
+
+        for i, chunk in enumerate(chunks):
+            if i < len(self.messages):
+                if self._rendered_chunks[i] != chunk:
+                    self.messages[i] = await self.messages[i].edit(content=chunk)
+                    self._rendered_chunks[i] = chunk
+            else:
+                self.messages.append(await self.messages[-1].reply(content=chunk, silent=True))
+                self._rendered_chunks.append(chunk)
+
+        # The text can shrink if a fallback model restarted the stream
+        while len(self.messages) > len(chunks):
+            await self.messages.pop().delete()
+            self._rendered_chunks.pop()
+
+    async def close(self):
+        self._closed.set()
+        self._dirty.set()
+        if self._flush_task is not None:
+            await self._flush_task
+
+    async def finish(self, text: str) -> discord.Message:
+        await self.close()
+        await self._render(text)
+        return self.messages[-1]
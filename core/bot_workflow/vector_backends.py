@@ -0,0 +1,653 @@
+import os
+import json
+import numpy
+import asyncio
+import logging
+import threading
+
+from typing import Any, AsyncIterator, Iterator, Literal
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+MetadataFilter = dict[str, Any]
+
+@dataclass
+class Hit:
+    id: int
+    distance: float
+    entity: dict[str, Any]
+    # The stored vector, only filled in when the search asks for it
+    vector: list[float] | None = None
+
+# Rows are {"id", "vector", "metadata", "text"}, searched by cosine similarity
+class VectorStoreBackend(ABC):
+    # None if the collection doesn't exist yet
+    @abstractmethod
+    async def dimensions(self, name: str) -> int | None:
+        raise NotImplementedError("dimensions")
+
+    @abstractmethod
+    async def ensure_collection(self, name: str, dim: int) -> None:
+        raise NotImplementedError("ensure_collection")
+
+    @abstractmethod
+    async def insert(self, name: str, rows: list[dict[str, Any]]) -> None:
+        raise NotImplementedError("insert")
+
+    @abstractmethod
+    async def existing_ids(self, name: str, ids: list[int]) -> set[int]:
+        raise NotImplementedError("existing_ids")
+
+    @abstractmethod
+    async def delete(self, name: str, ids: list[int]) -> None:
+        raise NotImplementedError("delete")
+
+    @abstractmethod
+    async def search(
+            self,
+            name: str,
+            vector: list[float],
+            limit: int,
+            metadata_filter: MetadataFilter | None = None,
+            with_vectors: bool = False
+        ) -> list[Hit]:
+        raise NotImplementedError("search")
+
+    @abstractmethod
+    async def vectors(self, name: str, ids: list[int]) -> dict[int, list[float]]:
+        raise NotImplementedError("vectors")
+
+    # Yields every row with its full precision vector
+    @abstractmethod
+    def scan(self, name: str, batch_size: int = 1000) -> AsyncIterator[list[dict[str, Any]]]:
+        raise NotImplementedError("scan")
+
+    @abstractmethod
+    async def count(self, name: str) -> int:
+        raise NotImplementedError("count")
+
+    # Reclaims the space of deleted rows, if the backend needs it
+    async def compact(self, name: str) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+class MilvusBackend(VectorStoreBackend):
+    # Metadata keys that scoped searches filter on, copied into indexed scalar fields. 0 means none
+    SCOPE_FIELDS = ("guild_id", "channel_id")
+
+    def __init__(self, path: str):
+        # Imported here so the NumPy backend works without Milvus installed
+        from pymilvus import MilvusClient, AsyncMilvusClient
+        self._async_client = AsyncMilvusClient(path)
+        self._sync_client = MilvusClient(path)
+        self._scoped_collections: dict[str, bool] = {}
+
+    def _has_scope_fields(self, name: str) -> bool:
+        if name not in self._scoped_collections:
+            field_names = {f["name"] for f in self._sync_client.describe_collection(name)["fields"]}
+            self._scoped_collections[name] = all(field in field_names for field in MilvusBackend.SCOPE_FIELDS)
+        return self._scoped_collections[name]
+
+    async def dimensions(self, name: str) -> int | None:
+        if not self._sync_client.has_collection(name):
+            return None
+        fields = self._sync_client.describe_collection(name)["fields"]
+        return next(int(f["params"]["dim"]) for f in fields if f["name"] == "vector")
+
+    async def ensure_collection(self, name: str, dim: int) -> None:
+        from pymilvus import MilvusClient, DataType
+        existing_dim = await self.dimensions(name)
+        if existing_dim is not None:
+            if existing_dim != dim:
+                raise ValueError(
+                    f"Milvus collection '{name}' has {existing_dim} dimensions but {dim} are configured. "
+                    "Run python -m core.bot_workflow.migrate_vectors to convert it."
+                )
+            if not self._has_scope_fields(name):
+                logging.warning(
+                    f"Milvus collection '{name}' predates the indexed guild_id and channel_id fields, so scoped searches "
+                    "filter on the metadata JSON instead. Run python -m core.bot_workflow.migrate_vectors --from-backend milvus to add them."
+                )
+            return
+
+        schema = self._sync_client.create_schema(
+            auto_id=False,
+            description="Brain schema",
+        )
+        schema.add_field("id", DataType.INT64, is_primary=True)
+        schema.add_field("vector", DataType.FLOAT_VECTOR, dim=dim)
+        schema.add_field("metadata", DataType.JSON)
+        schema.add_field("text", DataType.VARCHAR, max_length=8192)
+        for field in MilvusBackend.SCOPE_FIELDS:
+            schema.add_field(field, DataType.INT64)
+        await self._async_client.create_collection(collection_name=name, schema=schema)
+        self._scoped_collections[name] = True
+
+        index_params = MilvusClient.prepare_index_params()
+        index_params.add_index(
+            field_name="vector",
+            metric_type="COSINE",
+            index_type="IVF_FLAT",
+            index_name="vector_index"
+        )
+        for field in MilvusBackend.SCOPE_FIELDS:
+            # Scoped searches only score the rows of one server or channel
+            index_params.add_index(field_name=field, index_type="INVERTED", index_name=f"{field}_index")
+        await self._async_client.create_index(
+            collection_name=name,
+            index_params=index_params
+        )
+
+    async def insert(self, name: str, rows: list[dict[str, Any]]) -> None:
+        if self._has_scope_fields(name):
+            rows = [
+                {**row, **{field: int(row["metadata"].get(field) or 0) for field in MilvusBackend.SCOPE_FIELDS}}
+                for row in rows
+            ]
+        await self._async_client.insert(name, rows)
+
+    async def existing_ids(self, name: str, ids: list[int]) -> set[int]:
+        rows = await self._async_client.get(name, ids=ids, output_fields=["id"])
+        return {int(row["id"]) for row in rows}
+
+    async def delete(self, name: str, ids: list[int]) -> None:
+        await self._async_client.delete(name, ids=ids)
+
+    def _filter_expression(self, name: str, metadata_filter: MetadataFilter) -> str:
+        scoped = self._has_scope_fields(name)
+        return " and ".join(
+            f"{key} == {int(value)}" if scoped and key in MilvusBackend.SCOPE_FIELDS else f'metadata["{key}"] == {json.dumps(value)}'
+            for key, value in metadata_filter.items()
+        )
+
+    async def search(
+            self,
+            name: str,
+            vector: list[float],
+            limit: int,
+            metadata_filter: MetadataFilter | None = None,
+            with_vectors: bool = False
+        ) -> list[Hit]:
+        results = await self._async_client.search(
+            collection_name=name,
+            output_fields=["id", "metadata", "text"] + (["vector"] if with_vectors else []),
+            data=[vector],
+            limit=limit,
+            filter=self._filter_expression(name, metadata_filter) if metadata_filter else ""
+        )
+        hits = []
+        for hit in results[0]:
+            stored_vector = hit["entity"].pop("vector", None)
+            hits.append(Hit(
+                id=int(hit["id"]),
+                distance=float(hit["distance"]),
+                entity=hit["entity"],
+                vector=list(stored_vector) if stored_vector is not None else None
+            ))
+        return hits
+
+    async def vectors(self, name: str, ids: list[int]) -> dict[int, list[float]]:
+        rows = await self._async_client.get(name, ids=ids, output_fields=["id", "vector"])
+        return {int(row["id"]): list(row["vector"]) for row in rows}
+
+    async def scan(self, name: str, batch_size: int = 1000) -> AsyncIterator[list[dict[str, Any]]]:
+        iterator = self._sync_client.query_iterator(
+            collection_name=name,
+            batch_size=batch_size,
+            output_fields=["id", "vector", "metadata", "text"]
+        )
+        try:
+            while batch := await asyncio.to_thread(iterator.next):
+                yield batch
+        finally:
+            iterator.close()
+
+    async def count(self, name: str) -> int:
+        rows = await self._async_client.query(name, filter="", output_fields=["count(*)"])
+        return int(rows[0]["count(*)"])
+
+    async def compact(self, name: str) -> None:
+        await asyncio.to_thread(self._sync_client.compact, name)
+
+    async def close(self) -> None:
+        await self._async_client.close()
+        self._sync_client.close()
+
+Quantization = Literal["none", "int8", "binary"]
+
+def _quantize_int8(vectors: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+    # One scale per vector, so every row uses the full int8 range
+    scales = numpy.maximum(numpy.abs(vectors).max(axis=1), 1e-12).astype(numpy.float32) / 127
+    codes = numpy.round(vectors / scales[:, None]).astype(numpy.int8)
+    return codes, scales
+
+def _quantize_binary(vectors: numpy.ndarray) -> numpy.ndarray:
+    return numpy.packbits(vectors > 0, axis=1)
+
+# Immutable batch of rows, full vectors are memory-mapped and deleted rows are hidden by the alive mask
+class _Segment:
+    def __init__(
+            self,
+            name: str,
+            vectors: numpy.ndarray,
+            ids: numpy.ndarray,
+            records: list[dict[str, Any]],
+            codes: numpy.ndarray | None = None,
+            scales: numpy.ndarray | None = None
+        ):
+        self.name = name
+        self.vectors = vectors
+        self.ids = ids
+        self.records = records
+        # Quantized copy of the vectors kept in memory for searching, if enabled
+        self.codes = codes
+        self.scales = scales
+        self.alive = numpy.ones(len(ids), dtype=bool)
+        # Scalar index: metadata key -> value -> rows holding it, built the first time a key is filtered on
+        self._field_indexes: dict[str, dict[str, numpy.ndarray]] = {}
+
+    def _field_index(self, key: str) -> dict[str, numpy.ndarray]:
+        if key not in self._field_indexes:
+            rows_by_value: dict[str, list[int]] = {}
+            for row, record in enumerate(self.records):
+                if key in record["metadata"]:
+                    rows_by_value.setdefault(json.dumps(record["metadata"][key]), []).append(row)
+            self._field_indexes[key] = {value: numpy.asarray(rows, dtype=numpy.int64) for value, rows in rows_by_value.items()}
+        return self._field_indexes[key]
+
+    def filter_mask(self, metadata_filter: MetadataFilter) -> numpy.ndarray:
+        mask = numpy.ones(len(self.records), dtype=bool)
+        for key, value in metadata_filter.items():
+            matching = numpy.zeros(len(self.records), dtype=bool)
+            matching[self._field_index(key).get(json.dumps(value), [])] = True
+            mask &= matching
+        return mask
+
+class _NumpyCollection:
+    SEARCH_CHUNK_ROWS = 1024
+    FULL_SCAN_FRACTION = 0.5
+    SEGMENT_FILES = ("vectors.npy", "ids.npy", "records.jsonl", "int8.npy", "scales.npy", "binary.npy")
+
+    def __init__(
+            self,
+            directory: str,
+            dim: int,
+            *,
+            dtype: str,
+            quantization: Quantization,
+            rescore_multiplier: int,
+            max_segments: int
+        ):
+        self.directory = directory
+        self.dtype = numpy.dtype(dtype)
+        self.quantization = quantization
+        self.rescore_multiplier = rescore_multiplier
+        self.max_segments = max_segments
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.tombstones_path = os.path.join(directory, "tombstones.jsonl")
+        self.segments: list[_Segment] = []
+        # id -> (segment index, row) of its live copy
+        self._locations: dict[int, tuple[int, int]] = {}
+        os.makedirs(directory, exist_ok=True)
+
+        manifest = self._read_manifest()
+        if manifest is None:
+            self.dim = dim
+            self.next_segment = 0
+            self._write_manifest()
+        else:
+            if manifest["dim"] != dim:
+                raise ValueError(
+                    f"Vector collection in {directory} has {manifest['dim']} dimensions but {dim} are configured. "
+                    "Run python -m core.bot_workflow.migrate_vectors to convert it."
+                )
+            self.dim = manifest["dim"]
+            self.next_segment = manifest["next_segment"]
+            for segment_name in manifest["segments"]:
+                self._add_segment(self._load_segment(segment_name))
+            self._apply_tombstones()
+
+    def _read_manifest(self) -> dict | None:
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path, 'r') as file:
+            return json.load(file)
+
+    def _write_manifest(self):
+        # The manifest is the commit point: segment files it doesn't list are ignored
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({
+                "dim": self.dim,
+                "dtype": self.dtype.name,
+                "next_segment": self.next_segment,
+                "segments": [segment.name for segment in self.segments]
+            }, file)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _segment_path(self, segment_name: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{segment_name}.{suffix}")
+
+    def _save_array(self, segment_name: str, suffix: str, array: numpy.ndarray):
+        path = self._segment_path(segment_name, suffix)
+        with open(path + ".tmp", 'wb') as file:
+            numpy.save(file, array)
+        os.replace(path + ".tmp", path)
+
+    def _load_codes(self, segment_name: str, vectors: numpy.ndarray) -> tuple[numpy.ndarray | None, numpy.ndarray | None]:
+        if self.quantization == "none":
+            return None, None
+        code_files = ("int8.npy", "scales.npy") if self.quantization == "int8" else ("binary.npy",)
+        if not all(os.path.exists(self._segment_path(segment_name, suffix)) for suffix in code_files):
+            # Segments written before quantization was turned on are encoded from their full vectors
+            full = numpy.asarray(vectors, dtype=numpy.float32)
+            if self.quantization == "int8":
+                codes, scales = _quantize_int8(full)
+                self._save_array(segment_name, "int8.npy", codes)
+                self._save_array(segment_name, "scales.npy", scales)
+            else:
+                self._save_array(segment_name, "binary.npy", _quantize_binary(full))
+        if self.quantization == "int8":
+            return numpy.load(self._segment_path(segment_name, "int8.npy")), numpy.load(self._segment_path(segment_name, "scales.npy"))
+        return numpy.load(self._segment_path(segment_name, "binary.npy")), None
+
+    def _load_segment(self, segment_name: str) -> _Segment:
+        vectors = numpy.load(self._segment_path(segment_name, "vectors.npy"), mmap_mode='r')
+        ids = numpy.load(self._segment_path(segment_name, "ids.npy"))
+        with open(self._segment_path(segment_name, "records.jsonl"), 'r') as file:
+            records = [json.loads(line) for line in file]
+        codes, scales = self._load_codes(segment_name, vectors)
+        return _Segment(segment_name, vectors, ids, records, codes, scales)
+
+    def _write_segment(self, vectors: numpy.ndarray, ids: numpy.ndarray, records: list[dict[str, Any]]) -> _Segment:
+        segment_name = f"segment-{self.next_segment:06d}"
+        self.next_segment += 1
+        self._save_array(segment_name, "vectors.npy", vectors)
+        self._save_array(segment_name, "ids.npy", ids)
+        with open(self._segment_path(segment_name, "records.jsonl"), 'w') as file:
+            for record in records:
+                file.write(json.dumps(record) + "\n")
+        return self._load_segment(segment_name)
+
+    def _add_segment(self, segment: _Segment):
+        segment_index = len(self.segments)
+        self.segments.append(segment)
+        for row, row_id in enumerate(segment.ids.tolist()):
+            # Later copies of an id replace earlier ones
+            self._kill(row_id)
+            self._locations[row_id] = (segment_index, row)
+
+    def _kill(self, row_id: int):
+        location = self._locations.pop(row_id, None)
+        if location is not None:
+            segment_index, row = location
+            self.segments[segment_index].alive[row] = False
+
+    def _apply_tombstones(self):
+        if not os.path.exists(self.tombstones_path):
+            return
+        with open(self.tombstones_path, 'r') as file:
+            for line in file:
+                row_id, n_segments = json.loads(line)
+                location = self._locations.get(row_id)
+                # Only deletes copies that existed when the tombstone was written
+                if location is not None and location[0] < n_segments:
+                    self._kill(row_id)
+
+    def insert(self, rows: list[dict[str, Any]]):
+        if not rows:
+            return
+        vectors = numpy.asarray([row["vector"] for row in rows], dtype=numpy.float32)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+        vectors /= numpy.maximum(numpy.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        ids = numpy.asarray([int(row["id"]) for row in rows], dtype=numpy.int64)
+        records = [{"metadata": row["metadata"], "text": row["text"]} for row in rows]
+
+        self._add_segment(self._write_segment(vectors.astype(self.dtype), ids, records))
+        self._write_manifest()
+        if len(self.segments) > self.max_segments:
+            self.compact()
+
+    def delete(self, ids: list[int]):
+        deleted = [row_id for row_id in ids if row_id in self._locations]
+        if not deleted:
+            return
+        with open(self.tombstones_path, 'a') as file:
+            for row_id in deleted:
+                file.write(json.dumps([row_id, len(self.segments)]) + "\n")
+        for row_id in deleted:
+            self._kill(row_id)
+
+    def existing_ids(self, ids: list[int]) -> set[int]:
+        return {row_id for row_id in ids if row_id in self._locations}
+
+    def live_row_batches(self, batch_size: int) -> Iterator[list[dict[str, Any]]]:
+        # Reads from the segments and alive masks as they were at the first batch. Segments are never changed
+        # once written, so inserts, deletes and compactions between batches don't affect the scan
+        snapshot = [(segment, numpy.flatnonzero(segment.alive)) for segment in self.segments]
+        for segment, rows in snapshot:
+            for start in range(0, len(rows), batch_size):
+                batch_rows = rows[start:start + batch_size]
+                # Fancy indexing copies the rows out of the memory map
+                vectors = numpy.asarray(segment.vectors[batch_rows], dtype=numpy.float32)
+                yield [
+                    {
+                        "id": int(segment.ids[row]),
+                        "vector": vector,
+                        "metadata": segment.records[row]["metadata"],
+                        "text": segment.records[row]["text"]
+                    }
+                    for row, vector in zip(batch_rows.tolist(), vectors)
+                ]
+
+    def compact(self):
+        old_segments = self.segments
+        live = [(segment, segment.alive.copy()) for segment in old_segments]
+        vectors = numpy.concatenate([segment.vectors[alive] for segment, alive in live] or [numpy.empty((0, self.dim), self.dtype)])
+        ids = numpy.concatenate([segment.ids[alive] for segment, alive in live] or [numpy.empty(0, numpy.int64)])
+        records = [record for segment, alive in live for record, is_alive in zip(segment.records, alive) if is_alive]
+
+        merged = self._write_segment(vectors, ids, records)
+        self.segments = []
+        self._locations = {}
+        self._add_segment(merged)
+        self._write_manifest()
+        if os.path.exists(self.tombstones_path):
+            os.remove(self.tombstones_path)
+        for segment in old_segments:
+            for suffix in _NumpyCollection.SEGMENT_FILES:
+                path = self._segment_path(segment.name, suffix)
+                if os.path.exists(path):
+                    os.remove(path)
+        logging.info(f"Compacted {len(old_segments)} segments in {self.directory} into one with {len(ids)} rows")
+
+    def _blockwise_scores(self, matrix: numpy.ndarray, query: numpy.ndarray) -> numpy.ndarray:
+        # There is no BLAS matmul for float16 or int8, so convert small blocks into a reused float32 buffer
+        scores = numpy.empty(len(matrix), dtype=numpy.float32)
+        buffer = numpy.empty((_NumpyCollection.SEARCH_CHUNK_ROWS, matrix.shape[1]), dtype=numpy.float32)
+        for start in range(0, len(matrix), _NumpyCollection.SEARCH_CHUNK_ROWS):
+            block = matrix[start:start + _NumpyCollection.SEARCH_CHUNK_ROWS]
+            converted = buffer[:len(block)]
+            converted[...] = block
+            numpy.matmul(converted, query, out=scores[start:start + len(block)])
+        return scores
+
+    def _segment_scores(
+            self,
+            segment: _Segment,
+            query: numpy.ndarray,
+            query_bits: numpy.ndarray | None,
+            rows: numpy.ndarray | None = None
+        ) -> numpy.ndarray:
+        # Every row of the segment, or only the given rows
+        if self.quantization == "int8":
+            codes, scales = (segment.codes, segment.scales) if rows is None else (segment.codes[rows], segment.scales[rows])
+            return self._blockwise_scores(codes, query) * scales
+        if self.quantization == "binary":
+            codes = segment.codes if rows is None else segment.codes[rows]
+            # Hamming distance between sign bits, mapped to an approximate cosine similarity
+            differing_bits = numpy.bitwise_count(codes ^ query_bits).sum(axis=1, dtype=numpy.int32)
+            return 1 - 2 * differing_bits.astype(numpy.float32) / self.dim
+        vectors = segment.vectors if rows is None else segment.vectors[rows]
+        if vectors.dtype == numpy.float32:
+            return vectors @ query
+        return self._blockwise_scores(vectors, query)
+
+    def search(self, vector: list[float], limit: int, metadata_filter: MetadataFilter | None, with_vectors: bool = False) -> list[Hit]:
+        query = numpy.asarray(vector, dtype=numpy.float32)
+        query = query / max(float(numpy.linalg.norm(query)), 1e-12)
+        query_bits = _quantize_binary(query[None, :])[0] if self.quantization == "binary" else None
+
+        scores_per_segment = []
+        segment_indexes_per_segment = []
+        rows_per_segment = []
+        for segment_index, segment in enumerate(self.segments):
+            mask = segment.alive if metadata_filter is None else segment.alive & segment.filter_mask(metadata_filter)
+            rows = numpy.flatnonzero(mask)
+            if len(rows) == 0:
+                continue
+            if len(rows) > _NumpyCollection.FULL_SCAN_FRACTION * len(mask):
+                # Scanning contiguous memory beats gathering most of the rows
+                scores = self._segment_scores(segment, query, query_bits)[rows]
+            else:
+                # Selective filters, like a single server's memories, only read the matching rows
+                scores = self._segment_scores(segment, query, query_bits, rows)
+            scores_per_segment.append(scores)
+            segment_indexes_per_segment.append(numpy.full(len(rows), segment_index))
+            rows_per_segment.append(rows)
+        if not scores_per_segment:
+            return []
+
+        scores = numpy.concatenate(scores_per_segment)
+        # Quantized scores only pick candidates, which are then ranked by their full precision vectors
+        rescore = self.quantization != "none" and self.rescore_multiplier > 1
+        n_candidates = min(limit * self.rescore_multiplier if rescore else limit, len(scores))
+        if n_candidates <= 0:
+            return []
+        top = numpy.argpartition(-scores, n_candidates - 1)[:n_candidates]
+
+        segment_indexes = numpy.concatenate(segment_indexes_per_segment)[top]
+        rows = numpy.concatenate(rows_per_segment)[top]
+        if rescore:
+            final_scores = numpy.array([
+                float(numpy.asarray(self.segments[segment_index].vectors[row], dtype=numpy.float32) @ query)
+                for segment_index, row in zip(segment_indexes.tolist(), rows.tolist())
+            ], dtype=numpy.float32)
+        else:
+            final_scores = scores[top]
+
+        hits = []
+        for i in numpy.argsort(-final_scores)[:limit].tolist():
+            segment = self.segments[int(segment_indexes[i])]
+            row = int(rows[i])
+            row_id = int(segment.ids[row])
+            record = segment.records[row]
+            hits.append(Hit(
+                id=row_id,
+                distance=float(final_scores[i]),
+                entity={"id": row_id, "metadata": record["metadata"], "text": record["text"]},
+                vector=numpy.asarray(segment.vectors[row], dtype=numpy.float32).tolist() if with_vectors else None
+            ))
+        return hits
+
+    def vectors(self, ids: list[int]) -> dict[int, list[float]]:
+        stored = {}
+        for row_id in ids:
+            location = self._locations.get(row_id)
+            if location is not None:
+                segment_index, row = location
+                stored[row_id] = numpy.asarray(self.segments[segment_index].vectors[row], dtype=numpy.float32).tolist()
+        return stored
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+# Exact in-process search, for stores small enough that a brute force matmul beats an ANN index
+class NumpyBackend(VectorStoreBackend):
+    def __init__(
+            self,
+            directory: str,
+            *,
+            dtype: str = "float32",
+            quantization: Quantization = "none",
+            rescore_multiplier: int = 4,
+            max_segments: int = 16
+        ):
+        self.directory = directory
+        self.dtype = dtype
+        self.quantization = quantization
+        self.rescore_multiplier = rescore_multiplier
+        self.max_segments = max_segments
+        self._collections: dict[str, _NumpyCollection] = {}
+        # Searches run in worker threads, so they must not see a half-applied write
+        self._lock = threading.Lock()
+
+    def _collection(self, name: str) -> _NumpyCollection:
+        if name not in self._collections:
+            raise ValueError(f"Unknown collection '{name}'")
+        return self._collections[name]
+
+    async def _run_locked(self, function, *args):
+        def locked():
+            with self._lock:
+                return function(*args)
+        return await asyncio.to_thread(locked)
+
+    async def dimensions(self, name: str) -> int | None:
+        if name in self._collections:
+            return self._collections[name].dim
+        manifest_path = os.path.join(self.directory, name, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, 'r') as file:
+            return json.load(file)["dim"]
+
+    async def ensure_collection(self, name: str, dim: int) -> None:
+        if name in self._collections:
+            return
+        self._collections[name] = await asyncio.to_thread(
+            _NumpyCollection,
+            os.path.join(self.directory, name),
+            dim,
+            dtype=self.dtype,
+            quantization=self.quantization,
+            rescore_multiplier=self.rescore_multiplier,
+            max_segments=self.max_segments
+        )
+
+    async def insert(self, name: str, rows: list[dict[str, Any]]) -> None:
+        await self._run_locked(self._collection(name).insert, rows)
+
+    async def existing_ids(self, name: str, ids: list[int]) -> set[int]:
+        return await self._run_locked(self._collection(name).existing_ids, ids)
+
+    async def delete(self, name: str, ids: list[int]) -> None:
+        await self._run_locked(self._collection(name).delete, ids)
+
+    async def search(
+            self,
+            name: str,
+            vector: list[float],
+            limit: int,
+            metadata_filter: MetadataFilter | None = None,
+            with_vectors: bool = False
+        ) -> list[Hit]:
+        return await self._run_locked(self._collection(name).search, vector, limit, metadata_filter, with_vectors)
+
+    async def vectors(self, name: str, ids: list[int]) -> dict[int, list[float]]:
+        return await self._run_locked(self._collection(name).vectors, ids)
+
+    async def scan(self, name: str, batch_size: int = 1000) -> AsyncIterator[list[dict[str, Any]]]:
+        batches = self._collection(name).live_row_batches(batch_size)
+        # Each batch is read under the lock, so writes can run between batches but never during one
+        while (batch := await self._run_locked(next, batches, None)) is not None:
+            yield batch
+
+    async def count(self, name: str) -> int:
+        return await self._run_locked(len, self._collection(name))
+
+    async def compact(self, name: str) -> None:
+        await self._run_locked(self._collection(name).compact)
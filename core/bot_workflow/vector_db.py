@@ -1,19 +1,46 @@
 import os
 import numpy
 import hashlib
+import logging
 
 from enum import Enum
 from typing import Any
 from dataclasses import dataclass
-from core.ai_apis.providers import ProviderData
 from core.ai_apis.client import EmbeddingsClient
-from pymilvus import MilvusClient, AsyncMilvusClient, DataType
+from core.bot_workflow.profile_loader import EmbeddingConfig, VectorStoreConfig
+from core.bot_workflow.vector_backends import Hit, MetadataFilter, MilvusBackend, NumpyBackend, VectorStoreBackend
+
+def truncate_embedding(vector: list[float], dimensions: int) -> list[float]:
+    # Matryoshka-trained models like text-embedding-3 keep most of their quality in the leading dimensions
+    if len(vector) < dimensions:
+        raise ValueError(f"Cannot truncate a {len(vector)}-dimensional embedding to {dimensions} dimensions")
+    truncated = numpy.asarray(vector[:dimensions], dtype=numpy.float32)
+    return (truncated / max(float(numpy.linalg.norm(truncated)), 1e-12)).tolist()
+
+def make_backend(location: str, config: VectorStoreConfig) -> VectorStoreBackend:
+    if config.backend == "numpy":
+        return NumpyBackend(
+            location,
+            dtype=config.numpy_dtype,
+            quantization=config.quantization,
+            rescore_multiplier=config.rescore_multiplier,
+            max_segments=config.numpy_max_segments
+        )
+    if config.quantization != "none":
+        logging.warning("Vector quantization is only supported by the numpy backend, ignoring it for Milvus")
+    return MilvusBackend(location)
+
+def backend_location(path: str, config: VectorStoreConfig) -> str:
+    # NumPy stores are kept next to the Milvus file, e.g. knowledge.db -> knowledge_vectors/
+    return os.path.splitext(path)[0] + "_vectors" if config.backend == "numpy" else path
 
 class VectorDatabaseConnection:
-    def __init__(self, _async_client: AsyncMilvusClient, _sync_client: MilvusClient, vectorizer: EmbeddingsClient):
-        self._sync_client = _sync_client
-        self._async_client = _async_client
+    Hit = Hit
+
+    def __init__(self, backend: VectorStoreBackend, vectorizer: EmbeddingsClient, embedding: EmbeddingConfig | None = None):
+        self.backend = backend
         self.vectorizer = vectorizer
+        self.embedding = embedding or EmbeddingConfig()
         
     @dataclass
     class DBEntry:
@@ -21,12 +48,6 @@ class VectorDatabaseConnection:
         metadata: dict
         text: str
 
-    @dataclass
-    class Hit:
-        id: int
-        distance: float
-        entity: dict[str, Any]
-
     class Indexes(Enum):
         KNOWLEDGE = "knowledge"
         MEMORIES = "memories"
@@ -34,7 +55,7 @@ class VectorDatabaseConnection:
     async def index(self, index: Indexes, data: DBEntry | list[DBEntry]):
         if isinstance(data, list):
             texts = [entry.text for entry in data]
-            vectors = await self.vectorizer.vectorize(texts)
+            vectors = await self._vectorize(texts)
             to_index = [
                 {
                     "id": entry.id, 
@@ -44,23 +65,56 @@ class VectorDatabaseConnection:
                 }
                 for i, entry in enumerate(data)
             ]
-            await self._async_client.insert(index.value, to_index)
+            await self.backend.insert(index.value, to_index)
         else:
             to_index = {
                 "id": data.id, 
                 "metadata": data.metadata, 
-                "vector": await self.vectorizer.vectorize(data.text), 
+                "vector": await self.embed(data.text), 
                 "text": data.text
             }
-            await self._async_client.insert(index.value, to_index)
-
-    async def search(self, index: Indexes, text: str, limit=5) -> list[list[dict]]:
-        return await self._async_client.search(
-            collection_name=index.value,
-            output_fields=["id", "metadata", "text"],
-            data=[await self.vectorizer.vectorize(text)],
-            limit=limit
-        )
+            await self.backend.insert(index.value, [to_index])
+
+    async def existing_ids(self, index: Indexes, ids: list[int]) -> set[int]:
+        if not ids:
+            return set()
+        return await self.backend.existing_ids(index.value, [int(i) for i in ids])
+
+    async def delete(self, index: Indexes, ids: list[int]):
+        if not ids:
+            return
+        await self.backend.delete(index.value, [int(i) for i in ids])
+
+    async def _vectorize(self, texts: list[str]) -> list[list[float]]:
+        config = self.embedding
+        if config.dimensions is not None and config.truncation == "api":
+            return await self.vectorizer.vectorize(texts, model=config.model, dimensions=config.dimensions)
+        vectors = await self.vectorizer.vectorize(texts, model=config.model)
+        if config.dimensions is not None:
+            vectors = [truncate_embedding(vector, config.dimensions) for vector in vectors]
+        return vectors
+
+    async def embed(self, text: str) -> list[float]:
+        return (await self._vectorize([text]))[0]
+
+    async def search(
+            self,
+            index: Indexes,
+            query: str | list[float],
+            limit=5,
+            metadata_filter: MetadataFilter | None = None,
+            with_vectors: bool = False
+        ) -> list[Hit]:
+        vector = await self.embed(query) if isinstance(query, str) else query
+        return await self.backend.search(index.value, vector, limit, metadata_filter, with_vectors)
+
+    async def stored_vectors(self, index: Indexes, ids: list[int]) -> dict[int, list[float]]:
+        if not ids:
+            return {}
+        return await self.backend.vectors(index.value, [int(i) for i in ids])
+
+    async def close(self):
+        await self.backend.close()
 
 class VectorDatabase:
     @dataclass
@@ -74,43 +128,13 @@ class VectorDatabase:
                 combined = self.data + str(self.metadata)
                 self.entry_id = int(hashlib.sha256(combined.encode()).hexdigest(), 16) & 0x7FFFFFFF
         
-    def __init__(self, provider: ProviderData, path: str):
-        self.vectorizer = EmbeddingsClient(provider)
-        self.async_client = AsyncMilvusClient(path)
-        self.sync_client = MilvusClient(path)
+    def __init__(self, vectorizer: EmbeddingsClient, path: str, config: VectorStoreConfig | None = None):
+        self.vectorizer = vectorizer
+        self.path = path
+        self.config = config or VectorStoreConfig()
 
     async def connect(self) -> VectorDatabaseConnection:
-        async def make_schema(name: str):
-            schema = self.sync_client.create_schema(
-                auto_id=False,
-                description="Brain schema",
-            )
-            schema.add_field("id", DataType.INT64, is_primary=True)
-            schema.add_field("vector", DataType.FLOAT_VECTOR, dim=3072)
-            schema.add_field("metadata", DataType.JSON)
-            schema.add_field("text", DataType.VARCHAR, max_length=8192)
-            return schema
-
-        async def create_collection_index(name: str):
-            index_params = MilvusClient.prepare_index_params()
-            index_params.add_index(
-                field_name="vector",
-                metric_type="COSINE",
-                index_type="IVF_FLAT",
-                index_name="vector_index"
-            )
-            await self.async_client.create_index(
-                collection_name=name,
-                index_params=index_params
-            )
-
-        if not self.sync_client.has_collection("knowledge"):
-            knowledge_schema = await make_schema("knowledge")
-            await self.async_client.create_collection(collection_name="knowledge", schema=knowledge_schema)
-            await create_collection_index("knowledge")
-        if not self.sync_client.has_collection("memories"):
-            memories_schema = await make_schema("memories")
-            await self.async_client.create_collection(collection_name="memories", schema=memories_schema)
-            await create_collection_index("memories")
-        
-        return VectorDatabaseConnection(self.async_client, self.sync_client, self.vectorizer)
\ No newline at end of file
+        backend = make_backend(backend_location(self.path, self.config), self.config)
+        for index in VectorDatabaseConnection.Indexes:
+            await backend.ensure_collection(index.value, self.config.embedding.stored_dimensions)
+        return VectorDatabaseConnection(backend, self.vectorizer, self.config.embedding)
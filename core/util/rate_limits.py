@@ -1,4 +1,6 @@
 from time import time
+from array import array
+from collections import OrderedDict
 
 class RateLimit:
     def __init__(self, *, n_messages: int, seconds: int):
@@ -6,30 +8,66 @@ class RateLimit:
         self.seconds = seconds
 
 class RateLimiter:
+    # Each user has a flat array: the last request time, then for every limit an approximate
+    # sliding window counter stored as (window number, previous window count, current window count)
+    _FIELDS_PER_LIMIT = 3
+
     def __init__(self, *limits: RateLimit):
         self.limits = limits
-        self.user_logs: dict[int, list[float]] = {}
+        self.max_window_seconds = max((limit.seconds for limit in limits), default=0)
+        self.user_logs: OrderedDict[int, array] = OrderedDict()
+        self._empty_counters = array('d', [0.0] * (1 + RateLimiter._FIELDS_PER_LIMIT * len(limits)))
+        self._windows = [
+            (1 + RateLimiter._FIELDS_PER_LIMIT * i, float(limit.seconds), limit.n_messages)
+            for i, limit in enumerate(limits)
+        ]
 
     def register_request(self, user_id: int) -> None:
-        if user_id not in self.user_logs:
-            self.user_logs[user_id] = []
-        self.user_logs[user_id].append(time())
-        self._cleanup(user_id)
+        now = time()
+        counters = self.user_logs.get(user_id)
+        if counters is None:
+            counters = array('d', self._empty_counters)
+            self.user_logs[user_id] = counters
+        else:
+            # Keeps users ordered from least to most recently active
+            self.user_logs.move_to_end(user_id)
+        counters[0] = now
+
+        for base, seconds, _ in self._windows:
+            RateLimiter._roll_window(counters, base, seconds, now)
+            counters[base + 2] += 1
+
+        self._evict_idle_users(now)
 
     def is_rate_limited(self, user_id: int) -> bool:
-        if user_id not in self.user_logs:
+        counters = self.user_logs.get(user_id)
+        if counters is None:
             return False
 
-        for limit in self.limits:
-            if self._is_limited(user_id, limit):
+        now = time()
+        for base, seconds, n_messages in self._windows:
+            RateLimiter._roll_window(counters, base, seconds, now)
+            # Weigh the previous window by how much of it still overlaps the sliding window
+            elapsed_fraction = (now % seconds) / seconds
+            if counters[base + 1] * (1 - elapsed_fraction) + counters[base + 2] > n_messages:
                 return True
 
         return False
 
-    def _is_limited(self, user_id: int, limit: RateLimit) -> bool:
-        relevant_logs = [log for log in self.user_logs[user_id] if log > time() - limit.seconds]
-        return len(relevant_logs) > limit.n_messages
+    @staticmethod
+    def _roll_window(counters: array, base: int, seconds: float, now: float):
+        window = now // seconds
+        last_window = counters[base]
+        if window != last_window:
+            counters[base + 1] = counters[base + 2] if window == last_window + 1 else 0.0
+            counters[base + 2] = 0.0
+            counters[base] = window
 
-    def _cleanup(self, user_id: int):
-        for limit in self.limits:
-            self.user_logs[user_id] = [log for log in self.user_logs[user_id] if log > time() - limit.seconds]
\ No newline at end of file
+    def _evict_idle_users(self, now: float):
+        # Users are ordered by last request, so the idle ones are always at the front
+        cutoff = now - self.max_window_seconds
+        while self.user_logs:
+            user_id, counters = next(iter(self.user_logs.items()))
+            if counters[0] >= cutoff:
+                break
+            del self.user_logs[user_id]
@@ -0,0 +1,30 @@
+import re
+
+# Approximates BPE tokenizers offline: words cost about one token per 4 UTF-8 bytes and every
+# punctuation mark is its own token. Close enough for budgeting without loading a vocabulary.
+_TOKEN_PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def _piece_tokens(piece: str) -> int:
+    return max(1, (len(piece.encode('utf-8')) + 3) // 4)
+
+def estimate_tokens(text: str) -> int:
+    return sum(_piece_tokens(match.group()) for match in _TOKEN_PIECE_PATTERN.finditer(text))
+
+def estimate_message_tokens(message: dict) -> int:
+    content = message.get("content", "")
+    if isinstance(content, list):
+        text = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    else:
+        text = str(content)
+    return estimate_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    used = 0
+    for match in _TOKEN_PIECE_PATTERN.finditer(text):
+        used += _piece_tokens(match.group())
+        if used > max_tokens:
+            return text[:match.start()].rstrip()
+    return text
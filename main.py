@@ -1,3 +1,4 @@
+import asyncio
 import discord
 import logging
 import core.util.logging_setup as logs
@@ -6,12 +7,23 @@ from discord.ext import commands
 from core.bot_workflow.ai_bot import CustomBotData
 from core.bot_workflow.profile_loader import Profile
 from core.ai_apis.providers import ProviderDataStore
+from core.ai_apis.client_registry import ClientRegistry
+from core.ai_apis.embedding_cache import EmbeddingCache
+from core.ai_apis.usage_stats import TokenUsageStats
+from core.ai_apis.latency_stats import LatencyTracker
+from core.ai_apis.circuit_breaker import CircuitBreakerRegistry
+from core.ai_apis.scheduler import Priority, request_scope
 from core.util.environment_vars import get_environment_var
 from core.bot_workflow.discord_chat_handler import DiscordChatHandler
 from core.bot_workflow.knowledge import KnowledgeIndex, LongTermMemoryIndex
+from core.bot_workflow.memory_ingestion import MemoryIngestionQueue
+from core.bot_workflow.response_cache import SemanticResponseCache
+from core.bot_workflow.retrieval_gate import RetrievalGate
+from core.bot_workflow.conversation_summary import ConversationSummarizer
 
 from commands.sync_command_tree import SyncCommand
 from commands.image_gen_command import ImageGenCommand
+from commands.backfill_memory_command import BackfillMemoryCommand
 
 logs.setup()
 
@@ -21,20 +33,128 @@ class DiscordBot:
         intents.message_content = True
         self.bot = commands.Bot(command_prefix='r!', intents=intents)
         self.profile = Profile.from_file("profile.json")
+        CircuitBreakerRegistry.instance().configure(**self.profile.options.circuit_breaker.model_dump())
+        ClientRegistry.instance().register_all(
+            list(self.profile.providers.values()),
+            embedding_cache=self.make_embedding_cache()
+        )
         self.bot.event(self.on_ready)
+        self.initialized = False
+        self.long_term_memory: LongTermMemoryIndex | None = None
+        self.memory_ingestion: MemoryIngestionQueue | None = None
+        self.memory_maintenance_task: asyncio.Task | None = None
+        self.memory_scope_task: asyncio.Task | None = None
+        self.response_cache: SemanticResponseCache | None = None
+        self.retrieval_gate: RetrievalGate | None = None
+        self.conversation_summarizer: ConversationSummarizer | None = None
+
+    def make_embedding_cache(self) -> EmbeddingCache | None:
+        cache_config = self.profile.options.embedding_cache
+        if not cache_config.enabled:
+            logging.info("Embedding cache is disabled")
+            return None
+        return EmbeddingCache(
+            cache_config.path,
+            max_memory_entries=cache_config.max_memory_entries,
+            max_disk_entries=cache_config.max_disk_entries
+        )
 
     def run(self):
         bot_token = get_environment_var('AI_BOT_TOKEN', required=True)
-        self.bot.run(bot_token)
+        asyncio.run(self._run_until_closed(bot_token))
+
+    async def _run_until_closed(self, bot_token: str):
+        try:
+            async with self.bot:
+                await self.bot.start(bot_token)
+        finally:
+            await self.shutdown()
+
+    async def shutdown(self):
+        if self.memory_maintenance_task is not None:
+            self.memory_maintenance_task.cancel()
+        if self.memory_scope_task is not None:
+            self.memory_scope_task.cancel()
+        if self.memory_ingestion is not None:
+            logging.info("Flushing pending memories...")
+            await self.memory_ingestion.close()
+        if self.long_term_memory is not None:
+            self.long_term_memory.access_log.save()
+        if self.response_cache is not None:
+            logging.info(f"Response cache: {self.response_cache.stats()}")
+        if self.retrieval_gate is not None:
+            logging.info(f"Retrieval gate: {self.retrieval_gate.stats()}")
+        if self.conversation_summarizer is not None:
+            logging.info(f"Conversation summaries: {self.conversation_summarizer.stats()}")
+            await self.conversation_summarizer.close()
+        logging.info(f"Token usage: {TokenUsageStats.instance().summary()}")
+        logging.info(f"Latencies: {LatencyTracker.instance().summary()}")
+        logging.info(f"Circuit breakers: {CircuitBreakerRegistry.instance().summary()}")
+        logging.info(f"Request schedulers: {ClientRegistry.instance().scheduler_stats()}")
+        logging.info("Closing API clients...")
+        await ClientRegistry.instance().aclose()
 
     async def setup_chatbot(self):
         embeddings_provider = self.profile.providers["EMBEDDINGS"]
-        self.knowledge = await KnowledgeIndex.from_provider(embeddings_provider)
+        self.knowledge = await KnowledgeIndex.from_provider(
+            embeddings_provider, 
+            self.profile.options.vector_store, 
+            self.profile.options.knowledge_retrieval
+        )
         if self.profile.options.enable_long_term_memory:
-            self.long_term_memory: LongTermMemoryIndex | None = await LongTermMemoryIndex.from_provider(embeddings_provider)
+            self.long_term_memory = await LongTermMemoryIndex.from_provider(
+                embeddings_provider, 
+                self.profile.options.vector_store, 
+                self.profile.options.memory_maintenance
+            )
+            ingestion_config = self.profile.options.memory_ingestion
+            self.memory_ingestion = MemoryIngestionQueue(
+                self.long_term_memory,
+                batch_size=ingestion_config.batch_size,
+                flush_interval_seconds=ingestion_config.flush_interval_seconds,
+                max_queue_size=ingestion_config.max_queue_size
+            )
+            self.memory_ingestion.start()
+            if self.profile.options.memory_maintenance.interval_hours > 0:
+                self.memory_maintenance_task = asyncio.create_task(self.run_memory_maintenance(self.long_term_memory))
+            self.memory_scope_task = asyncio.create_task(self.migrate_memory_scopes(self.long_term_memory))
+            # Needs the memory index, so it can't be added with the other commands
+            await self.bot.add_cog(BackfillMemoryCommand(
+                bot=self.bot,
+                long_term_memory=self.long_term_memory,
+                backfill_config=self.profile.options.memory_backfill
+            ))
         else:
             self.long_term_memory = None
 
+        cache_config = self.profile.options.response_cache
+        if cache_config.enabled:
+            self.response_cache = SemanticResponseCache(
+                self.knowledge,
+                similarity_threshold=cache_config.similarity_threshold,
+                ttl_seconds=cache_config.ttl_seconds,
+                max_entries_per_scope=cache_config.max_entries_per_scope
+            )
+
+        gate_config = self.profile.options.retrieval_gate
+        if gate_config.enabled:
+            self.retrieval_gate = RetrievalGate(
+                min_words=gate_config.min_words,
+                extra_chitchat_words=gate_config.extra_chitchat_words
+            )
+
+        summary_config = self.profile.options.history_summary
+        if summary_config.enabled:
+            self.conversation_summarizer = ConversationSummarizer(
+                ClientRegistry.instance().llm(summary_config.provider),
+                self.profile.request_params["HISTORY_SUMMARY"],
+                self.profile.get_prompt("HISTORY_SUMMARY"),
+                min_batch=summary_config.min_batch,
+                max_summary_tokens=summary_config.max_summary_tokens,
+                max_channels=self.profile.options.max_tracked_channels
+            )
+            self.conversation_summarizer.start()
+
         provider_list = [self.profile.providers[k] for k, v in self.profile.providers.items()]
         provider_store = ProviderDataStore(
             providers=provider_list
@@ -48,6 +168,10 @@ class DiscordBot:
                 profile=self.profile, 
                 provider_store=provider_store,
                 long_term_memory=self.long_term_memory,
+                memory_ingestion=self.memory_ingestion,
+                response_cache=self.response_cache,
+                retrieval_gate=self.retrieval_gate,
+                conversation_summarizer=self.conversation_summarizer,
                 knowledge=self.knowledge,
                 discord_bot_id=self.bot.user.id,
                 memory_length=50
@@ -67,13 +191,41 @@ class DiscordBot:
             logging.info("Image generation using FAL.AI is disabled")
         pass
 
+    async def run_memory_maintenance(self, long_term_memory: LongTermMemoryIndex):
+        interval_seconds = self.profile.options.memory_maintenance.interval_hours * 3600
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                with request_scope(priority=Priority.BACKGROUND):
+                    report = await long_term_memory.run_maintenance()
+                logging.info(report.describe())
+            except Exception as e:
+                logging.error(f"Memory maintenance failed: {e}")
+
+    async def migrate_memory_scopes(self, long_term_memory: LongTermMemoryIndex):
+        channels = [
+            channel
+            for guild in self.bot.guilds
+            for channel in [*guild.text_channels, *guild.voice_channels, *guild.threads]
+        ] + list(self.bot.private_channels)
+        try:
+            report = await long_term_memory.migrate_scopes(channels)
+            if report is not None:
+                logging.info(report.describe())
+        except Exception as e:
+            logging.error(f"Memory scope migration failed, it will be retried on the next start: {e}")
+
     async def on_ready(self):
-        logging.info("Setting up commands...")
-        await self.setup_commands()
-        logging.info("Creating chatbot...")
-        await self.setup_chatbot()
+        # on_ready fires again on every gateway reconnect
+        if not self.initialized:
+            logging.info("Setting up commands...")
+            await self.setup_commands()
+            logging.info("Creating chatbot...")
+            await self.setup_chatbot()
+            self.initialized = True
         logging.info("Indexing knowledge...")
-        await self.knowledge.index_from_folder("brain_content/knowledge")
+        with request_scope(priority=Priority.BACKGROUND):
+            await self.knowledge.index_from_folder("brain_content/knowledge")
         logging.info(f'Logged in as {self.bot.user}')
 
 bot = DiscordBot()